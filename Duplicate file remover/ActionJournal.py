@@ -0,0 +1,116 @@
+"""
+Crash-safe journal of the actions taken on duplicates.
+
+Both duplicate removers used to collect their recovery data in a dict and
+write it as one JSON file once every duplicate had been handled, so a crash
+or a killed process in the middle of a large run lost the record of every
+file already moved. An ActionJournal instead appends one JSON line per
+completed operation to recovery_<timestamp>.jsonl:
+
+    {"time": 1718000000.5, "path": "/data/a (copy).txt", "action": "move",
+     "from": "duplicates/a (copy).txt", "to": "/data/a (copy).txt"}
+
+Lines are flushed to the OS at once and fsync'ed in batches (every
+`sync_every` records or `sync_interval` seconds, and on close), so a power
+loss costs at most the last batch, never the journal. A line cut short by a
+crash is skipped when the journal is read back.
+
+read_journal() loads both formats into the {path: info} dict the recovery
+code expects, so older recovery_<timestamp>.json files stay usable.
+"""
+
+import os
+import json
+import time
+import threading
+
+JOURNAL_SUFFIX = ".jsonl"
+LEGACY_SUFFIX = ".json"
+
+DEFAULT_SYNC_EVERY = 256
+DEFAULT_SYNC_INTERVAL = 1.0  # seconds
+
+
+class ActionJournal:
+    """
+    Append-only JSON-lines journal, safe to write from several threads.
+    Use as a context manager, or call close() to sync the last batch.
+    """
+
+    def __init__(self, path, sync_every=DEFAULT_SYNC_EVERY, sync_interval=DEFAULT_SYNC_INTERVAL):
+        self.path = path
+        self.sync_every = max(1, sync_every)
+        self.sync_interval = sync_interval
+        self.count = 0
+        self._file = open(path, "a", encoding="utf-8")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, record):
+        """Write one record (a dict with at least "path" and "action")"""
+        line = json.dumps({"time": time.time(), **record}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.count += 1
+            self._unsynced += 1
+            if (self._unsynced >= self.sync_every
+                    or time.monotonic() - self._last_sync >= self.sync_interval):
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._unsynced:
+                self._sync()
+            self._file.close()
+
+
+def read_records(f, offset=0):
+    """
+    (record, end offset) for the complete lines of a journal opened in binary
+    mode at offset. Stops at a line that is not terminated yet; a malformed
+    line (torn by a crash) is skipped.
+    """
+    for line in f:
+        if not line.endswith(b"\n"):
+            return
+        offset += len(line)
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and "path" in record:
+            yield record, offset
+
+
+def iter_journal(path):
+    """Records of a .jsonl journal in the order they were written"""
+    with open(path, "rb") as f:
+        for record, _ in read_records(f):
+            yield record
+
+
+def read_journal(path):
+    """{path: info} from a .jsonl journal or a legacy .json recovery file"""
+    if path.endswith(JOURNAL_SUFFIX):
+        return {record["path"]: record for record in iter_journal(path)}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_recovery_log(name):
+    return name.endswith(JOURNAL_SUFFIX) or name.endswith(LEGACY_SUFFIX)
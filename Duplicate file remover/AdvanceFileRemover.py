@@ -3,21 +3,47 @@ Duplicate File Remover - GUI Application with Advanced Features
 
 Features included:
 - Tkinter-based GUI with folder selection and drag-drop support
-- Duplicate detection by SHA256 + file size + name filtering
-- Image perceptual hashing using PIL + imagehash
-- File type and size filters
+- Thin client of ScanEngine.py, which holds all scan, watch, action and recovery logic without Tk;
+  BatchRemover.py runs the same engine from the command line (JSON / NDJSON output) on headless servers
+- Worker threads never touch Tk or the result lists: log lines, groups and UI calls are queued and applied in
+  batches from an after() timer; groups are shown in a virtualized list that only draws visible rows
+- Duplicate detection by SHA256 (or BLAKE2b / xxh3 / crc32) + file size + name filtering, staged so that only
+  files sharing a size are read (partial hash first, full hash for survivors)
+- Image perceptual hashing (aHash, dHash or pHash) using PIL + imagehash; JPEGs are decoded in draft
+  mode at a reduced scale, and image hashes of unchanged files are cached in the database
+- Near-duplicate (resized/re-encoded) image groups within a configurable Hamming distance,
+  found through a multi-index hash table instead of comparing all pairs
+- Parallel hashing: worker threads for SHA256, worker processes for image decoding
+- Walked files are held in a compact FileIndex (directory table, packed names, array columns),
+  so a scan of tens of millions of files fits in memory; with a memory budget, files are grouped
+  in a scratch SQLite database on disk instead (DiskGrouping.py) for trees beyond even that
+- File type and size filters (globs or regexes, checked before any stat), folder pruning (.git, node_modules, ...)
+- Concurrent directory listing for high-latency network mounts
+- Live scan status (files/s and bytes/s per stage, queue depths, cache hit ratio, ETA); a JSON
+  metrics report of every scan is written to scan_metrics.json
 - Embedded Matplotlib visualization of duplicate stats
-- Scheduled scans using APScheduler
+- Fast startup: matplotlib, APScheduler, PIL / imagehash, plyer and speech_recognition are only
+  imported when the chart, watch mode, image hashing, a notification or voice commands first need them
+- Watch mode: inotify (or polling) tracks changes and an APScheduler job reconciles only the diff
+  into an incrementally maintained duplicate index
 - Notifications via plyer
-- Logging and recovery data stored in SQLite database
+- Logging and recovery data stored in SQLite database (WAL mode, batched background writes)
+- Hash cache in the same database, so rescans skip files whose size, mtime and inode are unchanged
+- Optional per-folder summaries: folders whose mtime is unchanged are not listed or stat'ed again
 - File versioning metadata to allow undo restoration
+- Parallel move/delete/link operations, each appended to a crash-safe recovery journal as it completes
+- Content-addressed trash: one optionally compressed blob per unique content, with a size limit
+- Recovery from an SQLite index of the journals, filtered by folder and time, restored in parallel
+- Hard links are detected and hashed once; duplicates can be replaced by hard links or reflinks
+- Identical folders detected from Merkle hashes of their contents and handled as one item
 - Password protection for critical actions
 - Dark/Light theme switching
 - Basic voice command support (scan command)
 
 Requirements:
 - Python 3.7+
-- Packages: pillow, imagehash, matplotlib, apscheduler, plyer, speechrecognition, pyaudio, sqlite3 (builtin)
+- Packages: pillow, imagehash, matplotlib, apscheduler, plyer, speechrecognition, pyaudio, sqlite3 (builtin);
+  all optional except for the feature that uses them
 - On Windows, pyaudio must be installed separately (or use official wheels)
 
 Usage:
@@ -26,45 +52,46 @@ Usage:
 
 import os
 import sys
-import hashlib
-import shutil
-import datetime
+import time
+import queue
 import threading
+import importlib.util
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 from tkinter.scrolledtext import ScrolledText
-import sqlite3
 from functools import partial
 
-from PIL import Image, UnidentifiedImageError
-import imagehash
+# matplotlib, APScheduler, PIL / imagehash, plyer and speech_recognition are
+# imported on first use (chart, watch mode, image hashing, notifications,
+# voice commands), so the window comes up without waiting for them
 
-import matplotlib
-matplotlib.use('TkAgg')
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
-
-from apscheduler.schedulers.background import BackgroundScheduler
-
-try:
-    from plyer import notification
-except ImportError:
-    notification = None  # Notifications won't work
-
-try:
-    import speech_recognition as sr
-except ImportError:
-    sr = None
+from ScanEngine import ScanEngine, ScanSettings, RECOVERY_FOLDER, extension_counts
+from DuplicateEngine import DuplicatePairs
+from WorkerPool import DEFAULT_WORKERS, default_io_depth
+from HashEngine import FileHasher, DEFAULT_ALGORITHM, available_algorithms
+from FileWalker import DEFAULT_EXCLUDE_DIRS, DEFAULT_FANOUT
+from RecoveryIndex import parse_time
+from TrashStore import DEFAULT_COMPRESS_LEVEL, parse_size
+from ImageHashing import HASH_METHODS, DEFAULT_METHOD
+from ResultsView import GroupTreeView
 
 # Constants and folders
 APP_NAME = "Duplicate File Remover GUI"
-DB_FILE = "duplicate_remover.db"
-DUPLICATE_FOLDER = "duplicates"
-TRASH_FOLDER = "trash_bin"
-RECOVERY_FOLDER = "recovery_data"
-
-# Supported image extensions for perceptual hashing
-IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff'}
+METRICS_FILE = "scan_metrics.json"  # report of the last scan (a .prom name writes Prometheus text)
+
+# UI updates from worker threads are queued and applied in batches on the Tk thread
+UI_POLL_MS = 100
+UI_BATCH_SECONDS = 0.05  # time spent applying queued updates per poll
+MAX_LOG_LINES = 5000  # older log lines are dropped
+STATUS_INTERVAL = 1.0  # seconds between live scan status updates
+VOICE_PHRASE_SECONDS = 4  # longest voice command listened to at once
+
+LOG_COLORS = {
+    'info': 'black',
+    'error': 'red',
+    'warn': 'orange',
+    'success': 'green'
+}
 
 # Password for securing deletion and recovery (in real app, do better handling)
 SECURE_PASSWORD = "admin123"  # Change or store securely in production
@@ -102,28 +129,43 @@ class DuplicateFileRemoverApp(tk.Tk):
         self.configure(bg=THEMES[self.current_theme]["bg"])
         self.set_theme(self.current_theme)
 
-        # Initialize database
-        self.init_database()
-
-        # Scheduler for scans
-        self.scheduler = BackgroundScheduler()
-        self.scheduler.start()
-
         # Initialize variables
         self.selected_folder = tk.StringVar()
         self.file_types_filter = tk.StringVar(value="*")  # e.g. *.jpg;*.png
+        self.exclude_filter = tk.StringVar(value="")  # files to skip, e.g. *.tmp;re:.*~$
+        self.exclude_dirs_filter = tk.StringVar(value=";".join(DEFAULT_EXCLUDE_DIRS))  # folders not descended into
         self.min_file_size = tk.IntVar(value=0)  # in KB
         self.max_file_size = tk.IntVar(value=10240)  # default max 10MB
+        self.verify_cache = tk.BooleanVar(value=False)  # re-hash files the cache considers unchanged
+        self.worker_count = tk.IntVar(value=DEFAULT_WORKERS)  # hashing threads / image decoding processes
+        self.io_depth = tk.IntVar(value=default_io_depth(DEFAULT_WORKERS))  # max files queued for hashing
+        self.hash_algorithm = tk.StringVar(value=DEFAULT_ALGORITHM)  # see HashEngine.ALGORITHMS
+        self.walk_threads = tk.IntVar(value=DEFAULT_FANOUT)  # directories listed concurrently
+        self.image_hash_method = tk.StringVar(value=DEFAULT_METHOD)  # see ImageHashing.HASH_METHODS
+        self.similarity_distance = tk.IntVar(value=0)  # max differing image hash bits, 0 = exact matches only
+        self.detect_dirs = tk.BooleanVar(value=False)  # report identical folders as a whole
+        self.skip_unchanged_dirs = tk.BooleanVar(value=False)  # trust folder mtimes, see ScanDatabase.DirectorySummaries
+        self.watch_interval = tk.IntVar(value=30)  # seconds between watch mode reconciliations
+        self.trash_compress = tk.BooleanVar(value=False)  # zlib blobs in the TrashStore
+        self.trash_limit = tk.StringVar(value="")  # e.g. 20G, blank = unlimited
+        self.memory_budget = tk.StringVar(value="")  # e.g. 512M, blank = group in memory, see DiskGrouping
+        self.status_text = tk.StringVar(value="")  # live scan metrics
+        self.folder_watch = None  # ScanEngine.FolderWatch kept up to date in watch mode
+        self.scheduler = None  # APScheduler BackgroundScheduler, started with the first watch
+        self.figure = self.ax = self.canvas = None  # matplotlib chart, made by the first plot
         self.scan_in_progress = threading.Event()
-        self.duplicates = []  # List of tuples (dup_path, original_path)
+        self.duplicates = DuplicatePairs()  # (dup_path, original_path) pairs of duplicate_groups
+        self.duplicate_groups = []  # DuplicateEngine.DuplicateGroup, in the order they were confirmed
         self.duplicate_stats = {}  # filetype: count
         self.versioning_enabled = True
+        self.ui_queue = queue.Queue()  # ("log", message, level) / ("group", group) / ("call", func, args)
 
         # Create GUI components
         self.create_widgets()
+        self.after(UI_POLL_MS, self.drain_ui_queue)
 
-        # Setup voice command thread if available
-        if sr:
+        # Setup voice command thread if available (speech_recognition is imported on that thread)
+        if importlib.util.find_spec("speech_recognition"):
             threading.Thread(target=self.voice_command_listener, daemon=True).start()
 
     def set_theme(self, theme_name):
@@ -133,9 +175,11 @@ class DuplicateFileRemoverApp(tk.Tk):
         self.style.configure('TButton', background=colors["button_bg"], foreground=colors["button_fg"])
         self.style.configure('TEntry', fieldbackground=colors["entry_bg"], foreground=colors["entry_fg"])
         self.configure(bg=colors["bg"])
-        # Background for frames
-        for frame in [self.main_frame, self.filter_frame, self.log_frame, self.control_frame]:
-            frame.configure(bg=colors["bg"])
+        # Background for frames (the first call comes before create_widgets made them)
+        for name in ("main_frame", "filter_frame", "log_frame", "control_frame"):
+            frame = self.__dict__.get(name)
+            if frame is not None:
+                frame.configure(bg=colors["bg"])
 
     def toggle_theme(self):
         self.current_theme = "light" if self.current_theme == "dark" else "dark"
@@ -177,9 +221,70 @@ class DuplicateFileRemoverApp(tk.Tk):
         self.max_size_entry = ttk.Entry(self.filter_frame, textvariable=self.max_file_size, width=10)
         self.max_size_entry.grid(row=0, column=5, sticky="w", padx=5, pady=3)
 
+        self.verify_cache_check = ttk.Checkbutton(self.filter_frame, text="Verify cached hashes (re-read all files)", variable=self.verify_cache)
+        self.verify_cache_check.grid(row=1, column=0, columnspan=2, sticky="w", padx=5, pady=3)
+
+        ttk.Label(self.filter_frame, text="Workers:").grid(row=1, column=2, sticky="w", padx=5, pady=3)
+        self.workers_entry = ttk.Entry(self.filter_frame, textvariable=self.worker_count, width=10)
+        self.workers_entry.grid(row=1, column=3, sticky="w", padx=5, pady=3)
+
+        ttk.Label(self.filter_frame, text="I/O Depth:").grid(row=1, column=4, sticky="w", padx=5, pady=3)
+        self.io_depth_entry = ttk.Entry(self.filter_frame, textvariable=self.io_depth, width=10)
+        self.io_depth_entry.grid(row=1, column=5, sticky="w", padx=5, pady=3)
+
+        ttk.Label(self.filter_frame, text="Hash Algorithm:").grid(row=2, column=0, sticky="w", padx=5, pady=3)
+        self.hash_algorithm_combo = ttk.Combobox(self.filter_frame, textvariable=self.hash_algorithm, values=available_algorithms(), state="readonly", width=12)
+        self.hash_algorithm_combo.grid(row=2, column=1, sticky="w", padx=5, pady=3)
+
+        ttk.Label(self.filter_frame, text="Walk Threads:").grid(row=2, column=2, sticky="w", padx=5, pady=3)
+        self.walk_threads_entry = ttk.Entry(self.filter_frame, textvariable=self.walk_threads, width=10)
+        self.walk_threads_entry.grid(row=2, column=3, sticky="w", padx=5, pady=3)
+
+        ttk.Label(self.filter_frame, text="Similar Images (max bits, 0 = off):").grid(row=2, column=4, sticky="w", padx=5, pady=3)
+        self.similarity_entry = ttk.Entry(self.filter_frame, textvariable=self.similarity_distance, width=10)
+        self.similarity_entry.grid(row=2, column=5, sticky="w", padx=5, pady=3)
+
+        ttk.Label(self.filter_frame, text="Exclude Files (e.g. *.tmp;re:.*~$):").grid(row=3, column=0, sticky="w", padx=5, pady=3)
+        self.exclude_entry = ttk.Entry(self.filter_frame, textvariable=self.exclude_filter, width=40)
+        self.exclude_entry.grid(row=3, column=1, sticky="w", padx=5, pady=3)
+
+        ttk.Label(self.filter_frame, text="Skip Folders:").grid(row=3, column=2, sticky="w", padx=5, pady=3)
+        self.exclude_dirs_entry = ttk.Entry(self.filter_frame, textvariable=self.exclude_dirs_filter, width=30)
+        self.exclude_dirs_entry.grid(row=3, column=3, columnspan=3, sticky="w", padx=5, pady=3)
+
+        ttk.Label(self.filter_frame, text="Image Hash:").grid(row=4, column=0, sticky="w", padx=5, pady=3)
+        self.image_hash_combo = ttk.Combobox(self.filter_frame, textvariable=self.image_hash_method, values=list(HASH_METHODS), state="readonly", width=12)
+        self.image_hash_combo.grid(row=4, column=1, sticky="w", padx=5, pady=3)
+
+        ttk.Label(self.filter_frame, text="Watch Interval (s):").grid(row=4, column=2, sticky="w", padx=5, pady=3)
+        self.watch_interval_entry = ttk.Entry(self.filter_frame, textvariable=self.watch_interval, width=10)
+        self.watch_interval_entry.grid(row=4, column=3, sticky="w", padx=5, pady=3)
+
+        self.skip_dirs_check = ttk.Checkbutton(self.filter_frame, text="Skip unchanged folders (misses in-place edits)", variable=self.skip_unchanged_dirs)
+        self.skip_dirs_check.grid(row=4, column=4, columnspan=2, sticky="w", padx=5, pady=3)
+
+        self.detect_dirs_check = ttk.Checkbutton(self.filter_frame, text="Detect duplicate folders", variable=self.detect_dirs)
+        self.detect_dirs_check.grid(row=5, column=0, columnspan=2, sticky="w", padx=5, pady=3)
+
+        self.trash_compress_check = ttk.Checkbutton(self.filter_frame, text="Compress trash", variable=self.trash_compress)
+        self.trash_compress_check.grid(row=5, column=2, sticky="w", padx=5, pady=3)
+        ttk.Label(self.filter_frame, text="Trash Limit (e.g. 20G):").grid(row=5, column=3, sticky="w", padx=5, pady=3)
+        self.trash_limit_entry = ttk.Entry(self.filter_frame, textvariable=self.trash_limit, width=10)
+        self.trash_limit_entry.grid(row=5, column=4, sticky="w", padx=5, pady=3)
+
+        ttk.Label(self.filter_frame, text="Memory Budget (e.g. 512M):").grid(row=6, column=0, sticky="w", padx=5, pady=3)
+        self.memory_budget_entry = ttk.Entry(self.filter_frame, textvariable=self.memory_budget, width=10)
+        self.memory_budget_entry.grid(row=6, column=1, sticky="w", padx=5, pady=3)
+
         # Scan and Action buttons
         self.scan_button = ttk.Button(self.main_frame, text="Scan for Duplicates", command=self.start_scan)
-        self.scan_button.pack(fill=tk.X, pady=(0, 10))
+        self.scan_button.pack(fill=tk.X, pady=(0, 5))
+
+        self.watch_button = ttk.Button(self.main_frame, text="Start Watching Folder", command=self.toggle_watch)
+        self.watch_button.pack(fill=tk.X, pady=(0, 5))
+
+        self.status_label = ttk.Label(self.main_frame, textvariable=self.status_text, anchor="w")
+        self.status_label.pack(fill=tk.X, pady=(0, 10))
 
         self.action_frame = tk.Frame(self.main_frame, bg=THEMES[self.current_theme]["bg"])
         self.action_frame.pack(fill=tk.X, pady=(0, 10))
@@ -193,6 +298,12 @@ class DuplicateFileRemoverApp(tk.Tk):
         self.perm_delete_button = ttk.Button(self.action_frame, text="Permanent Delete", command=self.permanent_delete_duplicates, state=tk.DISABLED)
         self.perm_delete_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=5)
 
+        self.hardlink_button = ttk.Button(self.action_frame, text="Replace with Hard Links", command=self.hardlink_duplicates, state=tk.DISABLED)
+        self.hardlink_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=5)
+
+        self.reflink_button = ttk.Button(self.action_frame, text="Replace with Reflinks", command=self.reflink_duplicates, state=tk.DISABLED)
+        self.reflink_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=5)
+
         self.recover_button = ttk.Button(self.action_frame, text="Recover Deleted Files", command=self.recover_files)
         self.recover_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=5)
 
@@ -203,16 +314,37 @@ class DuplicateFileRemoverApp(tk.Tk):
         self.log_frame = tk.LabelFrame(self.main_frame, text="Log & Duplicate Preview", bg=THEMES[self.current_theme]["bg"], fg=THEMES[self.current_theme]["fg"])
         self.log_frame.pack(fill=tk.BOTH, expand=True)
 
-        self.log_text = ScrolledText(self.log_frame, state='disabled', bg=THEMES[self.current_theme]["entry_bg"], fg=THEMES[self.current_theme]["entry_fg"])
+        # Groups go to a virtualized list, so a million of them stay scrollable
+        self.results_view = GroupTreeView(self.log_frame, height=10)
+        self.results_view.pack(fill=tk.BOTH, expand=True, padx=5, pady=(5, 0))
+
+        self.log_text = ScrolledText(self.log_frame, state='disabled', height=8, bg=THEMES[self.current_theme]["entry_bg"], fg=THEMES[self.current_theme]["entry_fg"])
         self.log_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        for level, color in LOG_COLORS.items():
+            self.log_text.tag_config(level, foreground=color)
 
         # Visualization frame with matplotlib chart
         self.visual_frame = tk.LabelFrame(self.main_frame, text="Duplicates Visualization", bg=THEMES[self.current_theme]["bg"], fg=THEMES[self.current_theme]["fg"])
         self.visual_frame.pack(fill=tk.BOTH, expand=True, pady=(10,0))
 
-        self.figure, self.ax = plt.subplots(figsize=(8,3))
+        # The chart itself is made by the first plot (see create_chart)
+        self.chart_placeholder = ttk.Label(self.visual_frame, text="Duplicate file types are shown here after a scan.",
+                                           anchor="center")
+        self.chart_placeholder.pack(fill=tk.BOTH, expand=True)
+
+    def create_chart(self):
+        """Import matplotlib and embed the figure; called on first use"""
+        import matplotlib
+        matplotlib.use('TkAgg')
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        # A plain Figure, not pyplot: pyplot is slower to import and keeps figures alive globally
+        self.figure = Figure(figsize=(8, 3))
+        self.ax = self.figure.add_subplot()
         self.canvas = FigureCanvasTkAgg(self.figure, master=self.visual_frame)
         self.canvas_widget = self.canvas.get_tk_widget()
+        self.chart_placeholder.destroy()
         self.canvas_widget.pack(fill=tk.BOTH, expand=True)
 
     def browse_folder(self):
@@ -221,18 +353,51 @@ class DuplicateFileRemoverApp(tk.Tk):
             self.selected_folder.set(folder_selected)
 
     def log(self, message, level='info'):
-        """Thread-safe logging in GUI"""
-        # Color coding by level
-        colors = {
-            'info': 'black',
-            'error': 'red',
-            'warn': 'orange',
-            'success': 'green'
-        }
-        color = colors.get(level, 'black')
+        """Thread-safe logging in GUI: queued, shown by drain_ui_queue()"""
+        self.ui_queue.put(("log", message, level))
+
+    def publish_group(self, group):
+        """Thread-safe: add a DuplicateGroup to the results list"""
+        self.ui_queue.put(("group", group))
+
+    def post(self, func, *args):
+        """Thread-safe: run func(*args) on the Tk thread, after the updates queued before it"""
+        self.ui_queue.put(("call", func, args))
+
+    def drain_ui_queue(self):
+        """Apply queued updates in batches: one text insert and one list update per batch"""
+        deadline = time.monotonic() + UI_BATCH_SECONDS
+        lines = []
+        groups = []
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    item = self.ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item[0] == "log":
+                    lines += [item[1] + "\n", item[2] if item[2] in LOG_COLORS else 'info']
+                elif item[0] == "group":
+                    groups.append(item[1])
+                else:
+                    # Earlier updates first, so calls see the state they were queued after
+                    self.flush_updates(lines, groups)
+                    lines, groups = [], []
+                    item[1](*item[2])
+            self.flush_updates(lines, groups)
+        finally:
+            self.after(UI_POLL_MS, self.drain_ui_queue)
+
+    def flush_updates(self, lines, groups):
+        if groups:
+            self.results_view.add_groups(groups)
+        if not lines:
+            return
         self.log_text.configure(state='normal')
-        self.log_text.insert(tk.END, message + "\n", (color,))
-        self.log_text.tag_config(color, foreground=color)
+        self.log_text.insert(tk.END, *lines)
+        excess = int(self.log_text.index('end-1c').split('.')[0]) - MAX_LOG_LINES
+        if excess > 0:
+            self.log_text.delete('1.0', f'{excess + 1}.0')
         self.log_text.see(tk.END)
         self.log_text.configure(state='disabled')
 
@@ -246,152 +411,184 @@ class DuplicateFileRemoverApp(tk.Tk):
         if not os.path.isdir(folder):
             messagebox.showerror(APP_NAME, "Please select a valid folder to scan.")
             return
+        try:
+            memory_budget = parse_size(self.memory_budget.get())
+        except ValueError:
+            messagebox.showerror(APP_NAME, f"Invalid memory budget: {self.memory_budget.get()}")
+            return
+        if memory_budget and self.detect_dirs.get():
+            messagebox.showerror(APP_NAME, "Duplicate folders can only be detected without a memory budget.")
+            return
 
         # Clear previous results
         self.duplicates.clear()
+        self.duplicate_groups.clear()
         self.duplicate_stats.clear()
         self.clear_visualization()
         self.clear_log()
+        self.results_view.clear()
+        self.status_text.set("")
         self.disable_action_buttons()
 
         self.log(f"Starting scan in folder: {folder}")
 
-        # Start thread
-        thread = threading.Thread(target=self.scan_for_duplicates, args=(folder,), daemon=True)
+        # Start thread; settings are read here, Tk variables belong to the Tk thread
+        thread = threading.Thread(target=self.scan_for_duplicates, args=(folder, self.current_settings()),
+                                  daemon=True)
         self.scan_in_progress.set()
         thread.start()
 
-    def scan_for_duplicates(self, folder):
+    def scan_for_duplicates(self, folder, settings):
         try:
-            file_types = [t.strip().lower() for t in self.file_types_filter.get().split(';') if t.strip()]
-            if not file_types:
-                file_types = ["*"]
-
-            min_size_b = self.min_file_size.get() * 1024
-            max_size_b = self.max_file_size.get() * 1024
-
-            hash_map = {}
-            duplicates = []
-
-            # SQLite cursor for recording scan
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-
-            # Create table to store scanned files (for versioning and logs)
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS scanned_files (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    file_path TEXT UNIQUE,
-                    file_hash TEXT,
-                    file_size INTEGER,
-                    mtime REAL,
-                    is_duplicate INTEGER,
-                    original_file TEXT,
-                    scan_time TEXT
-                )
-            ''')
-            conn.commit()
-
-            scan_start_time = datetime.datetime.now().isoformat()
-
-            for root, _, files in os.walk(folder):
-                for file in files:
-                    full_path = os.path.join(root, file)
-                    ext = os.path.splitext(file)[1].lower()
-
-                    # Filter by file type
-                    if "*" not in file_types and ext not in file_types:
-                        continue
-
-                    try:
-                        stat = os.stat(full_path)
-                    except Exception as e:
-                        self.log(f"[Error] Cannot access {full_path}: {str(e)}", 'error')
-                        continue
-
-                    # Filter by size
-                    if stat.st_size < min_size_b or stat.st_size > max_size_b:
-                        continue
-
-                    # File hash calculation
-                    file_hash = None
-
-                    # For images, use perceptual hash (more tolerant)
-                    if ext in IMAGE_EXTENSIONS:
-                        try:
-                            with Image.open(full_path) as img:
-                                file_hash = str(imagehash.average_hash(img))
-                        except (UnidentifiedImageError, OSError) as e:
-                            # If image can't be opened, fallback to sha256
-                            file_hash = self.get_file_hash(full_path)
-                    else:
-                        file_hash = self.get_file_hash(full_path)
-
-                    if not file_hash:
-                        continue
-
-                    # Combine hash with file size for detection robustness
-                    composite_key = f"{file_hash}_{stat.st_size}"
-
-                    if composite_key in hash_map:
-                        original_file = hash_map[composite_key]
-                        duplicates.append((full_path, original_file))
-
-                        # Log in db as duplicate
-                        c.execute('''
-                            INSERT OR REPLACE INTO scanned_files
-                            (file_path, file_hash, file_size, mtime, is_duplicate, original_file, scan_time)
-                            VALUES (?, ?, ?, ?, 1, ?, ?)
-                        ''', (full_path, file_hash, stat.st_size, stat.st_mtime, original_file, scan_start_time))
-                    else:
-                        hash_map[composite_key] = full_path
-                        c.execute('''
-                            INSERT OR REPLACE INTO scanned_files
-                            (file_path, file_hash, file_size, mtime, is_duplicate, original_file, scan_time) 
-                            VALUES (?, ?, ?, ?, 0, NULL, ?)
-                        ''', (full_path, file_hash, stat.st_size, stat.st_mtime, scan_start_time))
-
-                    conn.commit()
-
-            conn.close()
-
-            self.duplicates = duplicates
-
-            if not duplicates:
-                self.log("✅ No duplicates found.", 'success')
-            else:
-                self.log(f"⚠️ Found {len(duplicates)} duplicates.", 'warn')
-                self.enable_action_buttons()
-
-            self.build_duplicate_stats()
-            self.plot_duplicates()
+            # The engine does the work; groups and the status line come back through the UI queue
+            report = ScanEngine(settings, self.log).scan(
+                folder,
+                on_group=self.publish_group,
+                on_status=partial(self.post, self.status_text.set),
+                status_interval=STATUS_INTERVAL,
+                metrics_file=METRICS_FILE,
+            )
+            self.post(self.status_text.set, report.metrics.status_line())
+            self.post(self.show_scan_results, report)
 
         except Exception as e:
             self.log(f"[Error] Scan failed: {str(e)}", 'error')
         finally:
             self.scan_in_progress.clear()
 
+    def show_scan_results(self, report):
+        """Take over a finished scan's groups and pairs (Tk thread, where the results view reads them)"""
+        self.duplicate_groups = report.groups
+        self.duplicates = report.duplicates
+        if report.duplicates:
+            self.enable_action_buttons()
+        self.build_duplicate_stats()
+        self.plot_duplicates()
+
+    def current_settings(self):
+        """ScanSettings from the filter and performance fields (call on the Tk thread)"""
+        return ScanSettings(
+            include=self.file_types_filter.get(),
+            exclude=self.exclude_filter.get(),
+            exclude_dirs=self.exclude_dirs_filter.get(),
+            min_size=self.min_file_size.get() * 1024,
+            max_size=self.max_file_size.get() * 1024,
+            verify_cache=self.verify_cache.get(),
+            workers=self.worker_count.get(),
+            io_depth=self.io_depth.get(),
+            hash_algorithm=self.hash_algorithm.get(),
+            walk_threads=self.walk_threads.get(),
+            image_hash_method=self.image_hash_method.get(),
+            similarity_distance=self.similarity_distance.get(),
+            detect_dirs=self.detect_dirs.get(),
+            skip_unchanged_dirs=self.skip_unchanged_dirs.get(),
+            versioning=self.versioning_enabled,
+            memory_budget=self.scan_memory_budget(),
+        )
+
+    def scan_memory_budget(self):
+        """Bytes from the memory budget field; None (group in memory) when blank or invalid"""
+        try:
+            return parse_size(self.memory_budget.get())
+        except ValueError:
+            return None
+
+    def toggle_watch(self):
+        if self.folder_watch:
+            self.stop_watch()
+        else:
+            self.start_watch()
+
+    def start_watch(self):
+        """Index the folder once, then keep the index current from file change events"""
+        if self.scan_in_progress.is_set():
+            messagebox.showwarning(APP_NAME, "A scan is already running. Please wait.")
+            return
+
+        folder = self.selected_folder.get()
+        if not os.path.isdir(folder):
+            messagebox.showerror(APP_NAME, "Please select a valid folder to scan.")
+            return
+
+        self.duplicates.clear()
+        self.duplicate_groups.clear()
+        self.clear_log()
+        self.results_view.clear()
+        self.status_text.set("")
+        self.disable_action_buttons()
+        self.watch_button.configure(text="Stop Watching Folder")
+        self.log(f"👁️ Indexing {folder} for watch mode...")
+
+        thread = threading.Thread(target=self.build_watch_index,
+                                  args=(folder, self.current_settings(), self.watch_interval.get()), daemon=True)
+        self.scan_in_progress.set()
+        thread.start()
+
+    def build_watch_index(self, folder, settings, interval):
+        try:
+            self.folder_watch = ScanEngine(settings, self.log).watch(folder, interval)
+            self.post(self.show_watch_groups, self.folder_watch.groups())
+
+            # Each run only reconciles what changed since the previous one
+            self.post(self.schedule_reconcile, interval)
+        except Exception as e:
+            self.log(f"[Error] Watch mode failed: {str(e)}", 'error')
+            self.post(self.stop_watch)
+        finally:
+            self.scan_in_progress.clear()
+
+    def schedule_reconcile(self, interval):
+        if self.folder_watch is None:
+            return  # stopped while indexing
+        if self.scheduler is None:
+            from apscheduler.schedulers.background import BackgroundScheduler
+            self.scheduler = BackgroundScheduler()
+            self.scheduler.start()
+        self.scheduler.add_job(self.reconcile_watch, "interval", seconds=max(1, interval),
+                               id="watch", replace_existing=True, max_instances=1, coalesce=True)
+
+    def reconcile_watch(self):
+        folder_watch = self.folder_watch
+        if folder_watch and folder_watch.reconcile():
+            self.post(self.show_watch_groups, folder_watch.groups())
+
+    def show_watch_groups(self, groups):
+        self.duplicate_groups = groups
+        self.duplicates = DuplicatePairs(groups)
+        self.results_view.set_groups(groups)
+        if self.duplicates:
+            self.log(f"⚠️ {len(self.duplicates)} duplicates in {len(groups)} groups.", 'warn')
+            self.enable_action_buttons()
+        else:
+            self.log("✅ No duplicates found.", 'success')
+            self.disable_action_buttons()
+        self.build_duplicate_stats()
+        self.plot_duplicates()
+
+    def stop_watch(self):
+        if self.scheduler and self.scheduler.get_job("watch"):
+            self.scheduler.remove_job("watch")
+        if self.folder_watch:
+            self.folder_watch.close()
+            self.folder_watch = None
+            self.log("👁️ Watch mode stopped.")
+        self.watch_button.configure(text="Start Watching Folder")
+
     def get_file_hash(self, filepath):
-        """Calculate sha256 hash of a file"""
+        """Calculate the full hash of a file (hex string) with the selected algorithm"""
         try:
-            hasher = hashlib.sha256()
-            with open(filepath, 'rb') as f:
-                while chunk := f.read(8192):
-                    hasher.update(chunk)
-            return hasher.hexdigest()
+            return FileHasher(self.hash_algorithm.get()).full(filepath).hex()
         except Exception as e:
             self.log(f"[Error] Cannot hash file {filepath}: {str(e)}", 'error')
             return None
 
     def build_duplicate_stats(self):
         """Build stats dictionary for visualization"""
-        stats = {}
-        for dup_path, orig_path in self.duplicates:
-            ext = os.path.splitext(dup_path)[1].lower()
-            stats[ext] = stats.get(ext, 0) + 1
-        self.duplicate_stats = stats
+        self.duplicate_stats = extension_counts(self.duplicates)
 
     def plot_duplicates(self):
+        if self.ax is None:
+            self.create_chart()
         self.ax.clear()
         if not self.duplicate_stats:
             self.ax.text(0.5, 0.5, 'No duplicates found to plot.', transform=self.ax.transAxes,
@@ -408,6 +605,8 @@ class DuplicateFileRemoverApp(tk.Tk):
         self.canvas.draw()
 
     def clear_visualization(self):
+        if self.ax is None:
+            return  # nothing plotted yet
         self.ax.clear()
         self.canvas.draw()
 
@@ -420,14 +619,18 @@ class DuplicateFileRemoverApp(tk.Tk):
         self.move_button.configure(state=tk.NORMAL)
         self.delete_button.configure(state=tk.NORMAL)
         self.perm_delete_button.configure(state=tk.NORMAL)
+        self.hardlink_button.configure(state=tk.NORMAL)
+        self.reflink_button.configure(state=tk.NORMAL)
 
     def disable_action_buttons(self):
         self.move_button.configure(state=tk.DISABLED)
         self.delete_button.configure(state=tk.DISABLED)
         self.perm_delete_button.configure(state=tk.DISABLED)
+        self.hardlink_button.configure(state=tk.DISABLED)
+        self.reflink_button.configure(state=tk.DISABLED)
 
     def password_prompt(self, action_name="perform this action"):
-        pwd = tk.simpledialog.askstring(APP_NAME, f"Enter password to {action_name}:", show='*')
+        pwd = simpledialog.askstring(APP_NAME, f"Enter password to {action_name}:", show='*')
         if pwd == SECURE_PASSWORD:
             return True
         else:
@@ -444,6 +647,16 @@ class DuplicateFileRemoverApp(tk.Tk):
             return
         self.perform_action_on_duplicates(action="safe_delete")
 
+    def hardlink_duplicates(self):
+        if not self.password_prompt("replace duplicates with hard links"):
+            return
+        self.perform_action_on_duplicates(action="hardlink")
+
+    def reflink_duplicates(self):
+        if not self.password_prompt("replace duplicates with reflinks"):
+            return
+        self.perform_action_on_duplicates(action="reflink")
+
     def permanent_delete_duplicates(self):
         if not self.password_prompt("permanently delete duplicates"):
             return
@@ -456,12 +669,113 @@ class DuplicateFileRemoverApp(tk.Tk):
         if not self.duplicates:
             messagebox.showinfo(APP_NAME, "No duplicates to process.")
             return
+        if self.scan_in_progress.is_set():
+            messagebox.showwarning(APP_NAME, "A scan is already running. Please wait.")
+            return
+        trash = ()
+        if action == "safe_delete":
+            try:
+                trash = (DEFAULT_COMPRESS_LEVEL if self.trash_compress.get() else 0, parse_size(self.trash_limit.get()))
+            except ValueError:
+                messagebox.showerror(APP_NAME, f"Invalid trash limit: {self.trash_limit.get()}")
+                return
 
-        # Ensure backup folders
-        os.makedirs(DUPLICATE_FOLDER, exist_ok=True)
-        os.makedirs(TRASH_FOLDER, exist_ok=True)
+        self.disable_action_buttons()
+        thread = threading.Thread(target=self.run_action,
+                                  args=(action, self.duplicates.copy(), self.current_settings(), trash), daemon=True)
+        self.scan_in_progress.set()
+        thread.start()
+
+    def run_action(self, action, duplicates, settings, trash_settings=()):
+        # trash_settings: (compress level, size limit) of the TrashStore for safe deletes
+        try:
+            report = ScanEngine(settings, self.log).run_action(action, duplicates, *trash_settings)
+            self.notify(f"{report.handled} duplicates processed ({action}).")
+        except Exception as e:
+            self.log(f"[Error] {action.replace('_', ' ').title()} failed: {str(e)}", 'error')
+        finally:
+            # Queued before the flag drops, so a scan started next is never cleared afterwards
+            self.post(self.clear_results)
+            self.scan_in_progress.clear()
+
+    def clear_results(self):
+        """Forget the duplicates an action has handled (Tk thread)"""
+        self.duplicates = DuplicatePairs()
+        self.duplicate_groups = []
+        self.results_view.clear()
+
+    def notify(self, message):
+        try:
+            from plyer import notification
+            notification.notify(title=APP_NAME, message=message, timeout=5)
+        except Exception:
+            pass  # Notifications are best effort (and plyer is optional)
+
+    def recover_files(self):
+        """Undo previous actions, optionally only below a folder and after a time"""
         os.makedirs(RECOVERY_FOLDER, exist_ok=True)
+        recovery_file = filedialog.askopenfilename(
+            title="Select recovery file (cancel to search all of them)", initialdir=RECOVERY_FOLDER,
+            filetypes=[("Recovery data", "*.jsonl *.json")])
+        journal = os.path.basename(recovery_file) if recovery_file else None
+        if not journal and not messagebox.askyesno(APP_NAME, "Restore from all recovery files?"):
+            return
+        prefix = simpledialog.askstring(APP_NAME, "Only restore paths under (blank for all):",
+                                        initialvalue=self.selected_folder.get())
+        if prefix is None:
+            return
+        since = simpledialog.askstring(APP_NAME, "Only actions at or after (YYYY-MM-DD [HH:MM], blank for any):")
+        if since is None:
+            return
+        try:
+            filters = dict(prefix=prefix.strip() or None, since=parse_time(since), journal=journal)
+        except ValueError as e:
+            messagebox.showerror(APP_NAME, f"Invalid time: {e}")
+            return
+        if not self.password_prompt("recover files"):
+            return
+        if self.scan_in_progress.is_set():
+            messagebox.showwarning(APP_NAME, "A scan is already running. Please wait.")
+            return
+
+        thread = threading.Thread(target=self.run_recovery, args=(filters, self.current_settings()), daemon=True)
+        self.scan_in_progress.set()
+        thread.start()
 
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        recovery_data = {}
+    def run_recovery(self, filters, settings):
+        try:
+            ScanEngine(settings, self.log).recover(**filters)
+        except Exception as e:
+            self.log(f"[Error] Recovery failed: {str(e)}", 'error')
+        finally:
+            self.scan_in_progress.clear()
 
+    def voice_command_listener(self):
+        """Listen on the default microphone and start a scan when "scan" is heard (runs on its own thread)"""
+        try:
+            import speech_recognition as sr
+            recognizer = sr.Recognizer()
+            microphone = sr.Microphone()
+        except (ImportError, AttributeError, OSError) as e:
+            # No pyaudio or no input device
+            self.log(f"[Warning] Voice commands unavailable: {str(e)}", 'warn')
+            return
+        with microphone as source:
+            recognizer.adjust_for_ambient_noise(source)
+            while True:
+                try:
+                    audio = recognizer.listen(source, phrase_time_limit=VOICE_PHRASE_SECONDS)
+                    command = recognizer.recognize_google(audio).lower()
+                except sr.UnknownValueError:
+                    continue
+                except (sr.RequestError, OSError) as e:
+                    self.log(f"[Warning] Voice commands stopped: {str(e)}", 'warn')
+                    return
+                if "scan" in command:
+                    self.log("🎤 Voice command: scan")
+                    self.post(self.start_scan)
+
+
+if __name__ == "__main__":
+    app = DuplicateFileRemoverApp()
+    app.mainloop()
@@ -0,0 +1,298 @@
+"""
+Non-interactive command line for ScanEngine, for batch jobs and servers
+without a display. Same features as AdvanceFileRemover.py, no prompts:
+
+    python BatchRemover.py --format ndjson scan /data --include "*.jpg;*.png" --similar 5
+    python BatchRemover.py scan /data --dirs --action safe_delete --trash-compress
+    python BatchRemover.py recover --prefix /data/projects --since "2024-06-01 12:00"
+    python BatchRemover.py watch /data --interval 30
+    python BatchRemover.py manifest /data nas1.dfm --volume nas1
+    python BatchRemover.py merge nas1.dfm laptop.dfm --across
+
+Results go to stdout, as one JSON document at the end (--format json, the
+default) or as one JSON object per line as they happen (--format ndjson):
+
+    {"type": "group", "kind": "content", "size": 1024, "digest": "...", "original": "...", "duplicates": [...]}
+    {"type": "action", "path": "...", "action": "move", "ok": true, "record": {...}}
+    {"type": "summary", "files": 1200, "groups": 3, "duplicates": 5, ...}
+
+Groups from merge list "volume:path" locations (see ScanManifest.py).
+
+Log lines and the live status line go to stderr (--quiet silences the log).
+The exit status is 1 if the scan failed or any action or restore did.
+"""
+
+import sys
+import json
+import time
+import argparse
+from contextlib import ExitStack
+
+from ScanEngine import ScanEngine, ScanSettings, group_record, extension_counts
+from ScanDatabase import DB_FILE
+from WorkerPool import DEFAULT_WORKERS
+from HashEngine import DEFAULT_ALGORITHM, available_algorithms
+from FileWalker import DEFAULT_EXCLUDE_DIRS, DEFAULT_FANOUT
+from FileActions import ACTIONS
+from RecoveryIndex import parse_time
+from ScanMetrics import DEFAULT_REPORT_INTERVAL
+from ScanManifest import ManifestReader, merge_manifests
+from TrashStore import DEFAULT_COMPRESS_LEVEL, parse_size
+from ImageHashing import HASH_METHODS, DEFAULT_METHOD
+
+FORMATS = ("json", "ndjson")
+DEFAULT_WATCH_INTERVAL = 30  # seconds between watch mode reconciliations
+
+
+class Output:
+    """Writes events as NDJSON lines, or collects them into one JSON document"""
+
+    def __init__(self, fmt, stream=None):
+        self.fmt = fmt
+        self.stream = stream or sys.stdout
+        self.document = {"groups": [], "actions": []}
+
+    def event(self, name, **data):
+        if self.fmt == "ndjson":
+            self.stream.write(json.dumps({"type": name, **data}, ensure_ascii=False) + "\n")
+            self.stream.flush()
+        elif name in ("group", "action"):
+            self.document[name + "s"].append(data)
+        else:
+            self.document[name] = data
+
+    def close(self):
+        if self.fmt == "json":
+            json.dump(self.document, self.stream, ensure_ascii=False, indent=2)
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+def _stderr_log(quiet):
+    def log(message, level='info'):
+        if not quiet or level == 'error':
+            print(message, file=sys.stderr, flush=True)
+    return log
+
+
+def _show_status(line):
+    print(f"⏱️ {line}", file=sys.stderr, flush=True)
+
+
+def settings_from_args(args):
+    return ScanSettings(
+        include=";".join(args.include) or "*",
+        exclude=";".join(args.exclude),
+        exclude_dirs=";".join(args.exclude_dir) if args.exclude_dir is not None else ";".join(DEFAULT_EXCLUDE_DIRS),
+        min_size=args.min_size or 0,
+        max_size=args.max_size,
+        verify_cache=args.verify_cache,
+        workers=args.workers,
+        io_depth=args.io_depth,
+        hash_algorithm=args.hash,
+        walk_threads=args.walkers,
+        images=not args.no_images,
+        image_hash_method=args.image_hash,
+        similarity_distance=args.similar,
+        detect_dirs=args.dirs,
+        skip_unchanged_dirs=args.skip_unchanged_dirs,
+        db_file=args.db,
+        memory_budget=getattr(args, "memory_budget", None),
+    )
+
+
+def scan_command(engine, args, output):
+    report = engine.scan(args.folder, on_group=lambda group: output.event("group", **group_record(group)),
+                         on_status=_show_status if args.progress else None, status_interval=args.progress,
+                         metrics_file=args.metrics)
+    summary = report.as_dict()
+    summary["extensions"] = extension_counts(report.duplicates)
+    output.event("summary", **summary)
+    if not args.action or not report.duplicates:
+        return 0
+
+    def on_result(dup, record, error):
+        output.event("action", path=dup, action=args.action, ok=error is None,
+                     record=record, error=str(error) if error else None)
+
+    result = engine.run_action(args.action, report.duplicates, args.trash_compress, args.trash_limit, on_result)
+    output.event("action_summary", **result.as_dict())
+    return 1 if result.failed else 0
+
+
+def recover_command(engine, args, output):
+    def on_progress(done, entry, error):
+        output.event("restore", path=entry.path, action=entry.action, ok=error is None,
+                     error=str(error) if error else None)
+
+    restored, failed = engine.recover(args.prefix, parse_time(args.since or ""), args.journal, on_progress)
+    output.event("summary", restored=restored, failed=failed)
+    return 1 if failed else 0
+
+
+def manifest_command(engine, args, output):
+    report = engine.export_manifest(args.folder, args.manifest, args.volume,
+                                    on_status=_show_status if args.progress else None, status_interval=args.progress)
+    output.event("summary", **report.as_dict())
+    return 0
+
+
+def merge_command(engine, args, output):
+    with ExitStack() as stack:
+        readers = [stack.enter_context(ManifestReader(manifest_file)) for manifest_file in args.manifests]
+        groups = duplicates = wasted = 0
+        for group in merge_manifests(readers, args.across):
+            output.event("group", **group_record(group))
+            groups += 1
+            duplicates += len(group.duplicates)
+            wasted += group.wasted_bytes()
+        output.event("summary", volumes=[reader.volume for reader in readers],
+                     files=sum(reader.files for reader in readers), groups=groups, duplicates=duplicates,
+                     wasted_bytes=wasted)
+    return 0
+
+
+def watch_command(engine, args, output):
+    watch = engine.watch(args.folder, args.interval)
+    try:
+        output.event("groups", groups=[group_record(group) for group in watch.groups()])
+        while True:
+            time.sleep(max(1, args.interval))
+            if watch.reconcile():
+                # The whole current state, so a consumer never has to merge diffs
+                output.event("groups", groups=[group_record(group) for group in watch.groups()])
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        watch.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Duplicate File Remover, non-interactive")
+    parser.add_argument("--format", choices=FORMATS, default="json",
+                        help="json: one document at the end (default); ndjson: one object per line as it happens")
+    parser.add_argument("--quiet", action="store_true", help="only log errors to stderr")
+    parser.add_argument("--db", default=DB_FILE, help=f"SQLite database with scan results and the hash cache "
+                                                      f"(default: {DB_FILE})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"hashing threads / image processes, also used for actions (default: {DEFAULT_WORKERS})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def file_options(command):
+        command.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                             help="only scan files matching this glob (or re:regex); repeatable")
+        command.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                             help="skip files matching this glob (or re:regex); repeatable")
+        command.add_argument("--exclude-dir", action="append", default=None, metavar="PATTERN",
+                             help=f"do not descend into matching folders; repeatable "
+                                  f"(default: {', '.join(DEFAULT_EXCLUDE_DIRS)})")
+        command.add_argument("--min-size", type=parse_size, default=None, metavar="SIZE",
+                             help="skip files smaller than SIZE, e.g. 4K")
+        command.add_argument("--max-size", type=parse_size, default=None, metavar="SIZE",
+                             help="skip files larger than SIZE, e.g. 10G")
+        command.add_argument("--verify-cache", action="store_true",
+                             help="re-hash every file and report cached hashes that no longer match")
+        command.add_argument("--io-depth", type=int, default=None,
+                             help="maximum number of files queued for hashing (default: 4 per worker)")
+        command.add_argument("--hash", choices=available_algorithms(), default=DEFAULT_ALGORITHM,
+                             help=f"algorithm confirming duplicates (default: {DEFAULT_ALGORITHM})")
+        command.add_argument("--walkers", type=int, default=DEFAULT_FANOUT,
+                             help=f"directories listed concurrently (default: {DEFAULT_FANOUT})")
+
+    def scan_options(command):
+        command.add_argument("folder")
+        file_options(command)
+        command.add_argument("--no-images", action="store_true",
+                             help="compare images by content only (no PIL / imagehash needed)")
+        command.add_argument("--image-hash", choices=HASH_METHODS, default=None,
+                             help=f"perceptual hash for images (default: {DEFAULT_METHOD})")
+        command.add_argument("--similar", type=int, default=0, metavar="BITS",
+                             help="also list near-duplicate images up to BITS differing hash bits (default: 0, off)")
+        command.add_argument("--dirs", action="store_true",
+                             help="report identical folders as a whole and act on them as one item")
+        command.add_argument("--skip-unchanged-dirs", action="store_true",
+                             help="reuse the stored files of folders whose mtime is unchanged instead of listing them "
+                                  "(misses files modified in place)")
+
+    scan = commands.add_parser("scan", help="scan a folder, optionally acting on the duplicates")
+    scan_options(scan)
+    scan.add_argument("--action", choices=ACTIONS, default=None,
+                      help="apply this action to every duplicate (similar images are never touched)")
+    scan.add_argument("--yes", action="store_true", help="confirm --action permanent_delete")
+    scan.add_argument("--trash-compress", type=int, nargs="?", const=DEFAULT_COMPRESS_LEVEL, default=0,
+                      metavar="LEVEL", choices=range(10),
+                      help=f"zlib-compress safe-deleted files in the trash (level 1-9, default {DEFAULT_COMPRESS_LEVEL})")
+    scan.add_argument("--trash-limit", type=parse_size, default=None, metavar="SIZE",
+                      help="evict the least recently used trash contents beyond this size, e.g. 20G")
+    scan.add_argument("--metrics", metavar="FILE",
+                      help="write scan throughput metrics to FILE: JSON, or Prometheus text if FILE ends in .prom")
+    scan.add_argument("--progress", type=float, default=0, metavar="SECONDS",
+                      help="print a live status line to stderr every SECONDS (default: 0, never; "
+                           f"e.g. {DEFAULT_REPORT_INTERVAL:g})")
+    scan.add_argument("--memory-budget", type=parse_size, default=None, metavar="SIZE",
+                      help="group files in a scratch database next to --db, using about SIZE of memory (e.g. 512M) "
+                           "whatever the file count")
+
+    watch = commands.add_parser("watch", help="index a folder and report its duplicate groups whenever they change")
+    scan_options(watch)
+    watch.add_argument("--interval", type=int, default=DEFAULT_WATCH_INTERVAL,
+                       help=f"seconds between reconciliations (default: {DEFAULT_WATCH_INTERVAL})")
+
+    manifest = commands.add_parser("manifest", help="hash every file of a folder into a manifest, for merge")
+    manifest.add_argument("folder")
+    manifest.add_argument("manifest", metavar="MANIFEST", help="file to write, e.g. nas1.dfm")
+    file_options(manifest)
+    manifest.add_argument("--volume", default=None,
+                          help="name of the folder in merged results (default: the host name)")
+    manifest.add_argument("--progress", type=float, default=0, metavar="SECONDS",
+                          help="print a live status line to stderr every SECONDS (default: 0, never)")
+    manifest.set_defaults(no_images=True, image_hash=None, similar=0, dirs=False, skip_unchanged_dirs=False)
+
+    merge = commands.add_parser("merge", help="report duplicates across manifests, without rescanning")
+    merge.add_argument("manifests", nargs="+", metavar="MANIFEST")
+    merge.add_argument("--across", action="store_true",
+                       help="only report groups with copies in more than one manifest")
+
+    recover = commands.add_parser("recover", help="undo journaled actions")
+    recover.add_argument("--journal", default=None, help="only this recovery file (name, default: all of them)")
+    recover.add_argument("--prefix", default=None, help="only paths under this folder")
+    recover.add_argument("--since", default=None, metavar="TIME",
+                         help="only actions at or after TIME (YYYY-MM-DD [HH:MM])")
+
+    args = parser.parse_args(argv)
+    if args.command == "scan" and args.action == "permanent_delete" and not args.yes:
+        parser.error("--action permanent_delete cannot be undone; add --yes to confirm")
+    if args.command == "scan" and args.memory_budget and args.dirs:
+        parser.error("--dirs needs every file in memory; it cannot be combined with --memory-budget")
+    if args.command == "watch":
+        args.format = "ndjson"  # a watch never ends, so there is no document to finish
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    log = _stderr_log(args.quiet)
+    settings = settings_from_args(args) if args.command not in ("recover", "merge") else \
+        ScanSettings(workers=args.workers, db_file=args.db)
+    output = Output(args.format)
+    commands = {"scan": scan_command, "watch": watch_command, "recover": recover_command,
+                "manifest": manifest_command, "merge": merge_command}
+    try:
+        # Merging only reads manifests, so it needs no database
+        engine = ScanEngine(settings, log) if args.command != "merge" else None
+        status = commands[args.command](engine, args, output)
+    except ImportError as e:
+        log(f"[Error] {args.command.title()} needs the {e.name} package; install it, or leave out --image-hash "
+            f"and --similar to compare images by content only.", 'error')
+        output.event("error", message=str(e))
+        status = 1
+    except Exception as e:
+        log(f"[Error] {args.command.title()} failed: {str(e)}", 'error')
+        output.event("error", message=str(e))
+        status = 1
+    output.close()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
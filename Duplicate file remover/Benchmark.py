@@ -0,0 +1,720 @@
+"""
+Benchmark harness for the duplicate scan.
+
+    python Benchmark.py run                        # all configurations on the default tree
+    python Benchmark.py run --profile tiny --scale 0.5 --config default --config single_thread
+    python Benchmark.py generate --tree /tmp/tree  # only write the synthetic tree
+    python Benchmark.py compare                    # latest results against the ones before
+    python Benchmark.py startup                    # time until the GUI / the CLI is ready
+    python Benchmark.py memory --files 1000000     # bytes per file of the index and of a real scan
+
+The tree comes from TreeGenerator.py (stdlib only, so this runs offline on
+any Linux box). Every configuration runs `--repeat` times, each time in a
+fresh Python process, so one run's memory or warm caches never leak into the
+next. Before each run the tree's pages are dropped from the page cache with
+posix_fadvise() (no root needed), unless --page-cache warm is given.
+
+Recorded per run, around the scan only (imports and startup excluded):
+- wall_seconds, user_seconds, system_seconds
+- peak_rss_bytes (the process' high-water mark, startup included) and
+  base_rss_bytes (the mark before the scan started)
+- bytes_hashed - file data the scan read, from its StageStats
+- read_chars / read_bytes - everything read through read()-like calls, and
+  what actually came from the block device (/proc/self/io)
+- read_syscalls / write_syscalls (/proc/self/io)
+  The /proc/self/io and RSS figures cover the scanning process only, not the
+  worker processes that decode images.
+- syscalls - every system call of the run, counted by strace -c in one extra,
+  untimed run (only with --strace, if strace is installed)
+
+Results are appended to benchmark_results.jsonl, one JSON line per
+configuration with the tree fingerprint, git commit, host and the median of
+the runs. `compare` (also printed after `run`) sets each against the previous
+result with the same tree, configuration, page-cache mode and host, so numbers
+are only ever compared like for like.
+
+`startup` times how long `BatchRemover.py` takes to import and parse its
+arguments, and `AdvanceFileRemover.py` to import and draw its window (skipped
+without a display), each as the wall time of a fresh interpreter, median of
+--repeat runs. It lists the optional heavy packages (matplotlib, PIL, ...)
+that got imported on the way, which should be none, and flags a median above
+STARTUP_BUDGET. Its records are stored and compared like the others.
+
+`memory` builds what a scan keeps per walked file for made-up paths (100
+files per folder, every tenth file a copy of the one before it), once per
+layout in MEMORY_LAYOUTS, and reports the bytes per file traced by
+tracemalloc while it is held (and at the peak of building it): the old
+scanner's hash_map, the per-path dicts the engine kept before FileIndex, and
+FileIndex with DuplicatePairs. The "scan" and "rescan" entries (MEMORY_SCANS)
+write that tree with small files instead and trace a real ScanEngine.scan()
+of it, with an empty and with a filled hash cache: what the returned report
+keeps, and the peak while scanning (hash cache and hashing stages included).
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import gc
+import random
+import argparse
+import datetime
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+
+from DuplicateEngine import DuplicateGroup, DuplicatePairs, StageStats, iter_duplicate_groups
+from FileIndex import FileIndex
+from FileRemover import scan_duplicates
+from FileWalker import walk_files
+from HashEngine import FileHasher
+from ImageHashing import PerceptualHasher, load_imaging
+from ImageIndex import find_similar_images, DEFAULT_MAX_DISTANCE
+from ScanEngine import ScanEngine, ScanSettings
+from TreeGenerator import PROFILES, TreeSpec, generate_tree
+from WorkerPool import WorkerPool, DEFAULT_WORKERS
+
+RESULTS_FILE = "benchmark_results.jsonl"
+DEFAULT_TREE = os.path.join(tempfile.gettempdir(), "dedupe-benchmark-tree")
+DEFAULT_REPEAT = 3
+
+# Metrics shown by run and compare (lower is better for all of them)
+COMPARED_METRICS = (
+    "wall_seconds",
+    "peak_rss_bytes",
+    "bytes_hashed",
+    "read_bytes",
+    "read_syscalls",
+    "syscalls",
+    "bytes_per_file",
+    "peak_bytes_per_file",
+)
+
+# Startup targets, name: (description, code run in a fresh interpreter)
+STARTUP_TARGETS = {
+    "headless": ("BatchRemover.py imported, arguments parsed",
+                 "import BatchRemover; BatchRemover.parse_args(['scan', '.'])"),
+    "gui": ("AdvanceFileRemover.py imported, window drawn once",
+            "import AdvanceFileRemover as gui; app = gui.DuplicateFileRemoverApp(); app.update(); app.destroy()"),
+}
+STARTUP_BUDGET = 1.0  # seconds
+# Optional packages that should only be imported on first use, never at startup
+HEAVY_MODULES = ("matplotlib", "PIL", "imagehash", "apscheduler", "plyer", "speech_recognition")
+
+_STARTUP_CHILD = """
+import sys, json
+sys.path.insert(0, {folder!r})
+try:
+    exec({code!r})
+except Exception as e:
+    if type(e).__name__ != "TclError":
+        raise
+    print(json.dumps({{"skipped": f"no display ({{e}})"}}))
+else:
+    print(json.dumps({{"loaded": sorted(name for name in {heavy!r} if name in sys.modules)}}))
+"""
+
+DEFAULT_MEMORY_FILES = 200000
+
+# name: (description, scan_duplicates options, warm-up run first)
+CONFIGS = {
+    "default": ("defaults: sha256, all workers, no cache", {}, False),
+    "single_thread": ("one hashing thread, serial walk", {"workers": 1, "fanout": 1}, False),
+    "crc32_prefilter": ("crc32 partial hashes, sha256 full hashes", {"prefilter": "crc32"}, False),
+    "blake2b": ("blake2b instead of sha256", {"hash": "blake2b"}, False),
+    "cache_cold": ("empty hash cache (cost of filling it)", {"cache": True}, False),
+    "cache_warm": ("hash cache filled by an untimed run", {"cache": True}, True),
+    "dirs": ("identical folders detected as a whole", {"detect_directories": True}, False),
+    "similar_images": ("image hashing and near-duplicate images (needs PIL)", {"images": True}, False),
+}
+
+
+# Measuring (runs in the child process)
+
+def _proc_io():
+    counters = {}
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                name, value = line.split(":")
+                counters[name] = int(value)
+    except OSError:
+        pass  # not Linux, or no task I/O accounting
+    return counters
+
+
+def drop_page_cache(root):
+    """Ask the kernel to forget the cached pages of every file below root"""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for folder, _, names in os.walk(root):
+        for name in names:
+            try:
+                fd = os.open(os.path.join(folder, name), os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def _scan(root, workdir, options):
+    """One scan with FileRemover.scan_duplicates(); returns its counts"""
+    metrics_file = os.path.join(workdir, "metrics.json")
+    kwargs = {key: value for key, value in options.items() if key not in ("cache", "hash", "prefilter")}
+    if options.get("cache"):
+        kwargs["cache_file"] = os.path.join(workdir, "cache.db")
+    kwargs["hasher"] = FileHasher(options.get("hash", "sha256"), options.get("prefilter"))
+    groups = duplicates = 0
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for group in scan_duplicates(root, metrics_file=metrics_file, progress_interval=0, **kwargs):
+            groups += 1
+            duplicates += len(group.duplicates)
+    with open(metrics_file, "r", encoding="utf-8") as f:
+        bytes_hashed = json.load(f)["bytes_read"]
+    return {"groups": groups, "duplicates": duplicates, "bytes_hashed": bytes_hashed}
+
+
+def _scan_images(root, workdir, options):
+    """The GUI's pipeline: content and image groups, then near-duplicate images"""
+
+    stats = StageStats()
+    image_hasher = PerceptualHasher()
+    files = [(path, stat.st_size) for path, stat in walk_files(root)]
+    groups = duplicates = 0
+    duplicate_paths = set()
+    with WorkerPool(DEFAULT_WORKERS) as pool, WorkerPool(DEFAULT_WORKERS, processes=True) as image_pool:
+        for group in iter_duplicate_groups(files, stats, None, None, pool, None, image_hasher, image_pool):
+            groups += 1
+            duplicates += len(group.duplicates)
+            duplicate_paths.update(group.duplicates)
+        remaining = [(path, size) for path, size in files if path not in duplicate_paths]
+        similar = find_similar_images(remaining, image_hasher, DEFAULT_MAX_DISTANCE, None, image_pool, stats)
+    return {"groups": groups, "duplicates": duplicates, "similar_groups": len(similar),
+            "bytes_hashed": stats.total_read()}
+
+
+def run_child(config, root, workdir, page_cache):
+    """Measure one run of config in this process; returns the measurements"""
+    _, options, warm_up = CONFIGS[config]
+    scan = _scan_images if options.get("images") else _scan
+    try:
+        if options.get("images"):
+            load_imaging()  # imported before the clock starts, like everything else (needs PIL)
+        if warm_up:
+            scan(root, workdir, options)
+        if page_cache == "cold":
+            drop_page_cache(root)
+
+        base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        io = _proc_io()
+        started = time.perf_counter()
+        result = scan(root, workdir, options)
+        wall = time.perf_counter() - started
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+        io_after = _proc_io()
+    except ImportError as e:
+        return {"skipped": f"missing dependency: {e.name}"}
+
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    result.update(
+        wall_seconds=round(wall, 4),
+        user_seconds=round(usage_after.ru_utime - usage.ru_utime, 4),
+        system_seconds=round(usage_after.ru_stime - usage.ru_stime, 4),
+        peak_rss_bytes=usage_after.ru_maxrss * unit,
+        base_rss_bytes=base_rss * unit,
+    )
+    for field, name in (("rchar", "read_chars"), ("read_bytes", "read_bytes"),
+                        ("syscr", "read_syscalls"), ("syscw", "write_syscalls")):
+        if field in io_after:
+            result[name] = io_after[field] - io.get(field, 0)
+    return result
+
+
+# Memory per file
+
+def _synthetic_files(count, seed=0):
+    """(path, size, mtime, is_copy) of made-up files; is_copy: same content as the file before"""
+    rng = random.Random(seed)
+    size = 0
+    for i in range(count):
+        path = f"/srv/data/projects/p{i // 100000:03d}/{2000 + i // 10000 % 25}/album{i // 100:05d}/IMG_{i:08d}.JPG"
+        is_copy = i % 10 == 9
+        if not is_copy:
+            size = rng.randrange(1 << 24)
+        yield path, size, 1.7e9 + i, is_copy
+
+
+def _layout_hash_map(files):
+    # FileRemover's first version: hex digest + size -> first path, pairs of full paths
+    hash_map = {}
+    duplicates = []
+    digest = None
+    for path, size, _, is_copy in files:
+        if not is_copy:
+            digest = os.urandom(32)
+        key = f"{digest.hex()}_{size}"
+        if key in hash_map:
+            duplicates.append((path, hash_map[key]))
+        else:
+            hash_map[key] = path
+    return hash_map, duplicates
+
+
+def _layout_path_dicts(files):
+    # The engine before FileIndex: a stat result per path in ScanEngine, the
+    # walk list, position and size dicts in iter_duplicate_groups, pair tuples
+    candidates = {}
+    listed = []
+    position = {}
+    size_of = {}
+    groups = []
+    pairs = []
+    previous = None
+    for i, (path, size, mtime, is_copy) in enumerate(files):
+        candidates[path] = os.stat_result((0o100644, i, 1, 1, 0, 0, size, int(mtime), int(mtime), int(mtime)))
+        listed.append((path, size))
+        position[path] = i
+        size_of[path] = size
+        if is_copy:
+            group = DuplicateGroup(size, os.urandom(32), [previous, path])
+            groups.append(group)
+            pairs.extend(group.pairs())
+        previous = path
+    return candidates, listed, position, size_of, groups, pairs
+
+
+def _layout_compact(files):
+    index = FileIndex()
+    groups = []
+    for path, size, mtime, is_copy in files:
+        row = index.add(path, size, mtime)
+        if is_copy:
+            groups.append(DuplicateGroup(size, os.urandom(32), [index.path(row - 1), index.path(row)]))
+    return index, DuplicatePairs(groups)
+
+
+# name: (description, builder)
+MEMORY_LAYOUTS = {
+    "hash_map": ("original scanner: {hex digest_size: path} and (duplicate, original) tuples", _layout_hash_map),
+    "path_dicts": ("stat result, (path, size) tuple, position and size entries per path", _layout_path_dicts),
+    "compact": ("FileIndex rows (directory table, packed names, array columns), DuplicatePairs", _layout_compact),
+}
+
+# name: (description, scans of the same tree before the measured one)
+MEMORY_SCANS = {
+    "scan": ("ScanEngine.scan() of a written tree, empty hash cache", 0),
+    "rescan": ("ScanEngine.scan() of the same tree again, every digest cached", 1),
+}
+MEMORY_SCAN_MAX_SIZE = 4096  # file sizes of the written tree; most sizes collide, so every file is hashed
+
+
+def _write_memory_tree(root, count, seed=0):
+    """Write _synthetic_files(count, seed) below root, with small files so that writing stays quick"""
+    rng = random.Random(seed)
+    data = b""
+    for path, size, _, is_copy in _synthetic_files(count, seed):
+        if not is_copy:
+            data = rng.getrandbits(8 * MEMORY_SCAN_MAX_SIZE).to_bytes(MEMORY_SCAN_MAX_SIZE, "little")
+            data = data[:size % MEMORY_SCAN_MAX_SIZE]
+        path = os.path.join(root, os.path.relpath(path, "/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def measure_scan_memory(scan, count=DEFAULT_MEMORY_FILES, seed=0):
+    """
+    Bytes per file traced while ScanEngine.scan() runs over a tree of `count`
+    written files: what its report keeps, and the peak during the scan
+    """
+    workdir = tempfile.mkdtemp(prefix="dedupe-benchmark-memory-")
+    try:
+        root = os.path.join(workdir, "tree")
+        _write_memory_tree(root, count, seed)
+        engine = ScanEngine(ScanSettings(images=False, db_file=os.path.join(workdir, "cache.db")))
+        for _ in range(MEMORY_SCANS[scan][1]):
+            engine.scan(root)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            report = engine.scan(root)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"bytes_per_file": round((current - base) / count, 1),
+            "peak_bytes_per_file": round((peak - base) / count, 1)}
+
+
+def measure_memory(layout, count=DEFAULT_MEMORY_FILES, seed=0):
+    """Bytes per file held by a layout for `count` files, and at the peak of building it"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        kept = MEMORY_LAYOUTS[layout][1](_synthetic_files(count, seed))
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del kept
+    return {"bytes_per_file": round((current - base) / count, 1),
+            "peak_bytes_per_file": round((peak - base) / count, 1)}
+
+
+def run_memory(layouts, count=DEFAULT_MEMORY_FILES, seed=0, results_file=RESULTS_FILE, on_result=None):
+    """Measure the layouts (and scans, see MEMORY_SCANS) and append their records to results_file"""
+    commit = _git_commit()
+    host = _host()
+    records = []
+    for layout in layouts:
+        if layout in MEMORY_SCANS:
+            result = measure_scan_memory(layout, count, seed)
+        else:
+            result = measure_memory(layout, count, seed)
+        record = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "host": host,
+            "tree": {"fingerprint": f"synthetic-{count}-{seed}", "files": count},
+            "config": f"memory:{layout}",
+            "page_cache": None,
+            "repeat": 1,
+            "runs": [result],
+            "median": result,
+        }
+        with open(results_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        records.append(record)
+        if on_result:
+            on_result(record)
+    return records
+
+
+# Driving (runs in the parent process)
+
+def _child_command(config, root, workdir, out_file, page_cache):
+    return [sys.executable, os.path.abspath(__file__), "child", config, root, workdir, out_file,
+            "--page-cache", page_cache]
+
+
+def _run_once(config, root, page_cache, strace=False):
+    workdir = tempfile.mkdtemp(prefix="dedupe-benchmark-")
+    out_file = os.path.join(workdir, "result.json")
+    command = _child_command(config, root, workdir, out_file, page_cache)
+    strace_file = os.path.join(workdir, "strace.txt")
+    if strace:
+        command = ["strace", "-f", "-c", "-o", strace_file, "--"] + command
+    try:
+        process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f"{config} failed:\n{process.stderr.strip()}")
+        with open(out_file, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        if strace:
+            result["syscalls"] = _strace_total(strace_file)
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _strace_total(path):
+    """Number of calls on the "total" line of an strace -c summary"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if fields and fields[-1] == "total":
+                return int(fields[3])
+    return None
+
+
+def _median(runs):
+    numeric = {key for run in runs for key, value in run.items() if isinstance(value, (int, float))}
+    return {key: statistics.median(run[key] for run in runs if key in run) for key in sorted(numeric)}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _host():
+    return {
+        "name": platform.node(),
+        "system": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_benchmarks(tree, spec, configs, repeat=DEFAULT_REPEAT, page_cache="cold", strace=False,
+                   results_file=RESULTS_FILE, on_result=None):
+    """Run configs on the tree built from spec and append their records to results_file"""
+    info = generate_tree(tree, spec, on_progress=lambda profile: print(f"🌱 Generating {profile} files..."))
+    commit = _git_commit()
+    host = _host()
+    records = []
+    for config in configs:
+        runs = [_run_once(config, tree, page_cache) for _ in range(repeat)]
+        if "skipped" in runs[0]:
+            record = {"config": config, "skipped": runs[0]["skipped"]}
+        else:
+            median = _median(runs)
+            if strace:
+                median["syscalls"] = _run_once(config, tree, page_cache, strace=True).get("syscalls")
+            record = {
+                "time": datetime.datetime.now().isoformat(timespec="seconds"),
+                "commit": commit,
+                "host": host,
+                "tree": {key: info[key] for key in ("fingerprint", "profile", "scale", "seed", "files", "bytes")},
+                "config": config,
+                "page_cache": page_cache,
+                "repeat": repeat,
+                "runs": runs,
+                "median": median,
+            }
+            with open(results_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        records.append(record)
+        if on_result:
+            on_result(record)
+    return records
+
+
+def _startup_once(target):
+    """Wall time of one fresh interpreter running the target, and the heavy modules it imported"""
+    folder = os.path.dirname(os.path.abspath(__file__))
+    code = _STARTUP_CHILD.format(folder=folder, code=STARTUP_TARGETS[target][1], heavy=HEAVY_MODULES)
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-c", code], cwd=folder, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if process.returncode != 0:
+        raise RuntimeError(f"startup {target} failed:\n{process.stderr.strip()}")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    if "skipped" not in result:
+        result["wall_seconds"] = round(wall, 4)
+    return result
+
+
+def run_startup(targets, repeat=DEFAULT_REPEAT, results_file=RESULTS_FILE, on_result=None):
+    """Time the startup targets and append their records to results_file"""
+    commit = _git_commit()
+    host = _host()
+    records = []
+    for target in targets:
+        _startup_once(target)  # untimed, so every timed run finds the same warm page cache and .pyc files
+        runs = [_startup_once(target) for _ in range(repeat)]
+        config = f"startup:{target}"
+        if "skipped" in runs[0]:
+            record = {"config": config, "skipped": runs[0]["skipped"]}
+        else:
+            record = {
+                "time": datetime.datetime.now().isoformat(timespec="seconds"),
+                "commit": commit,
+                "host": host,
+                "tree": None,
+                "config": config,
+                "page_cache": "warm",
+                "repeat": repeat,
+                "runs": [{"wall_seconds": run["wall_seconds"]} for run in runs],
+                "median": _median(runs),
+                "loaded": runs[0]["loaded"],
+            }
+            with open(results_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        records.append(record)
+        if on_result:
+            on_result(record)
+    return records
+
+
+def load_results(results_file=RESULTS_FILE):
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _comparable(record):
+    tree = record["tree"] or {}  # startup records have no tree
+    return (tree.get("fingerprint"), record["config"], record["page_cache"], record["host"]["name"])
+
+
+def compare_results(results):
+    """[(latest record, previous comparable record or None)] for each comparable series, latest last"""
+    latest = {}
+    previous = {}
+    for record in results:
+        key = _comparable(record)
+        if key in latest:
+            previous[key] = latest[key]
+        latest[key] = record
+    return [(record, previous.get(key)) for key, record in latest.items()]
+
+
+def _format_value(metric, value):
+    if value is None:
+        return "-"
+    if metric.endswith("_bytes") or metric == "bytes_hashed":
+        return f"{value / 1024 ** 2:.1f} MB"
+    if metric.endswith("_seconds"):
+        return f"{value:.3f} s"
+    return f"{value:,.0f}"
+
+
+def print_result(record, previous=None):
+    if "skipped" in record:
+        print(f"\n⏭️ {record['config']}: skipped ({record['skipped']})")
+        return
+    median = record["median"]
+    against = f" vs {previous['commit'] or '?'} of {previous['time']}" if previous else ""
+    print(f"\n📏 {record['config']} ({record['commit'] or 'no commit'}, median of {record['repeat']}){against}")
+    for metric in COMPARED_METRICS:
+        if metric not in median:
+            continue
+        line = f"   {metric:<19} {_format_value(metric, median[metric]):>14}"
+        old = previous["median"].get(metric) if previous else None
+        if old:
+            line += f"  {(median[metric] - old) / old:+.1%}"
+        print(line)
+    if "loaded" in record:
+        over = median["wall_seconds"] > STARTUP_BUDGET
+        print(f"   {'⚠️ over' if over else '✅ within'} the {STARTUP_BUDGET:g} s budget; heavy modules imported: "
+              f"{', '.join(record['loaded']) or 'none'}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the duplicate scan on synthetic trees")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def tree_options(command):
+        command.add_argument("--tree", default=DEFAULT_TREE, help=f"where the tree is generated (default: {DEFAULT_TREE})")
+        command.add_argument("--profile", choices=("all",) + PROFILES, default="all",
+                             help="which kind of files to generate (default: all)")
+        command.add_argument("--scale", type=float, default=1.0,
+                             help="multiplies file counts and sizes (default: 1.0, about 0.6 GB)")
+        command.add_argument("--seed", type=int, default=0, help="random seed of the tree (default: 0)")
+
+    generate = commands.add_parser("generate", help="write the synthetic tree")
+    tree_options(generate)
+    generate.add_argument("--force", action="store_true", help="write it again even if it is up to date")
+
+    run = commands.add_parser("run", help="run configurations and store their results")
+    tree_options(run)
+    run.add_argument("--config", action="append", choices=tuple(CONFIGS), metavar="NAME",
+                     help=f"configuration to run, repeatable (default: all of {', '.join(CONFIGS)})")
+    run.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                     help=f"runs per configuration, the median is stored (default: {DEFAULT_REPEAT})")
+    run.add_argument("--page-cache", choices=("cold", "warm"), default="cold",
+                     help="drop the tree from the page cache before each run (cold, default) or not")
+    run.add_argument("--strace", action="store_true", help="count all system calls in one extra run (needs strace)")
+    run.add_argument("--results", default=RESULTS_FILE, help=f"results file (default: {RESULTS_FILE})")
+
+    compare = commands.add_parser("compare", help="show the latest results against the previous ones")
+    compare.add_argument("--results", default=RESULTS_FILE, help=f"results file (default: {RESULTS_FILE})")
+
+    startup = commands.add_parser("startup", help="time how long the CLI and the GUI take to start")
+    startup.add_argument("--target", action="append", choices=tuple(STARTUP_TARGETS), metavar="NAME",
+                         help=f"what to start, repeatable (default: all of {', '.join(STARTUP_TARGETS)})")
+    startup.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                         help=f"runs per target, the median is stored (default: {DEFAULT_REPEAT})")
+    startup.add_argument("--results", default=RESULTS_FILE, help=f"results file (default: {RESULTS_FILE})")
+
+    memory = commands.add_parser("memory", help="bytes per file of the in-memory file index")
+    memory.add_argument("--files", type=int, default=DEFAULT_MEMORY_FILES,
+                        help=f"made-up files to index (default: {DEFAULT_MEMORY_FILES})")
+    memory.add_argument("--layout", action="append", choices=(*MEMORY_LAYOUTS, *MEMORY_SCANS), metavar="NAME",
+                        help=f"layout or scan to measure, repeatable "
+                             f"(default: all of {', '.join([*MEMORY_LAYOUTS, *MEMORY_SCANS])})")
+    memory.add_argument("--seed", type=int, default=0, help="random seed of the file sizes (default: 0)")
+    memory.add_argument("--results", default=RESULTS_FILE, help=f"results file (default: {RESULTS_FILE})")
+
+    child = commands.add_parser("child")  # one measured run, started by `run`
+    child.add_argument("config", choices=tuple(CONFIGS))
+    child.add_argument("root")
+    child.add_argument("workdir")
+    child.add_argument("out_file")
+    child.add_argument("--page-cache", choices=("cold", "warm"), default="cold")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.command == "child":
+        result = run_child(args.config, args.root, args.workdir, args.page_cache)
+        with open(args.out_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    if args.command == "generate":
+        info = generate_tree(args.tree, TreeSpec(args.profile, args.scale, args.seed), force=args.force,
+                             on_progress=lambda profile: print(f"🌱 Generating {profile} files..."))
+        print(f"✅ {info['files']} files, {info['bytes'] / 1024 ** 2:.1f} MB in `{args.tree}` "
+              f"(tree {info['fingerprint']}).")
+        return
+
+    if args.command == "startup":
+        history = compare_results(load_results(args.results))
+        previous = {_comparable(record): record for record, _ in history}
+        run_startup(args.target or list(STARTUP_TARGETS), args.repeat, args.results,
+                    lambda record: print_result(record, previous.get(_comparable(record))
+                                                if "skipped" not in record else None))
+        print(f"\n💾 Results appended to `{args.results}`.")
+        return
+
+    if args.command == "memory":
+        history = compare_results(load_results(args.results))
+        previous = {_comparable(record): record for record, _ in history}
+        records = run_memory(args.layout or [*MEMORY_LAYOUTS, *MEMORY_SCANS], args.files, args.seed, args.results,
+                             lambda record: print_result(record, previous.get(_comparable(record))))
+        if len(records) > 1:
+            smallest = min(records, key=lambda record: record["median"]["bytes_per_file"])
+            print()
+            for record in records:
+                ratio = record["median"]["bytes_per_file"] / smallest["median"]["bytes_per_file"]
+                print(f"   {record['config']:<18} {ratio:5.1f}x {smallest['config']}")
+        print(f"\n💾 Results appended to `{args.results}`.")
+        return
+
+    if args.command == "run":
+        if args.strace and not shutil.which("strace"):
+            print("❌ --strace needs strace to be installed.")
+            return
+        history = compare_results(load_results(args.results))
+        previous = {_comparable(record): record for record, _ in history}
+
+        def show(record):
+            print_result(record, previous.get(_comparable(record)) if "skipped" not in record else None)
+
+        spec = TreeSpec(args.profile, args.scale, args.seed)
+        run_benchmarks(args.tree, spec, args.config or list(CONFIGS), args.repeat, args.page_cache,
+                       args.strace, args.results, show)
+        print(f"\n💾 Results appended to `{args.results}`.")
+        return
+
+    results = load_results(args.results)
+    if not results:
+        print(f"❌ No results in `{args.results}` yet.")
+        return
+    for record, previous in compare_results(results):
+        print_result(record, previous)
+
+
+if __name__ == "__main__":
+    main()
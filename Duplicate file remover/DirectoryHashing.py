@@ -0,0 +1,176 @@
+"""
+Duplicate directory detection from Merkle-style subtree hashes.
+
+Once the file stages have run, every file that has an identical twin
+somewhere carries a full digest (it shared a size with its twin, so both went
+through the partial and full stages). A directory's hash is computed bottom
+up from its entries - file name + content digest, subdirectory name + its
+hash - so two directories have the same hash exactly when their trees hold
+the same names with the same contents. A file without a digest has no twin,
+so neither has any directory containing it; those are ruled out at once.
+
+Only the outermost copies are reported: a directory inside a duplicated
+directory is covered by its ancestor's group. Every directory that would be
+reported is listed once more without any filter, so folders holding files
+the scan did not look at (excluded patterns, pruned folders such as .git,
+symbolic links) are never treated as identical. Directories without files
+are ignored.
+"""
+
+import os
+import hashlib
+
+from DuplicateEngine import DuplicateGroup
+
+
+def _depth(path):
+    return path.count(os.sep)
+
+
+def _inside(path, directories):
+    """True if path lies in (or is) one of directories"""
+    while True:
+        if path in directories:
+            return True
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+
+
+def _count_entries(directory):
+    """Non-directory entries below directory, found without any filter"""
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(directory):
+        # Symbolic links to directories are not walked by the scan either
+        count += len(filenames) + sum(1 for name in dirnames if os.path.islink(os.path.join(dirpath, name)))
+    return count
+
+
+def directory_hashes(root, files, digests, aliases=None):
+    """
+    Merkle hash, file count, total size and height for every directory below
+    root that holds files. files are walked (path, size) pairs, digests maps
+    paths to content digests, aliases maps dropped hard link names to the
+    name that was hashed. Returns {directory: (hash or None, files, bytes, height)}.
+    """
+    root = os.path.normpath(root)
+    aliases = aliases or {}
+    entries = {}  # directory -> [(name, kind, path)]
+    sizes = {}
+    for path, size in files:
+        sizes[path] = size
+    for alias, first in aliases.items():
+        if first in sizes:
+            sizes[alias] = sizes[first]
+
+    for path in sizes:
+        directory = os.path.dirname(path)
+        entries.setdefault(directory, []).append((os.path.basename(path), "f", path))
+        # Register the chain of parents up to root, so empty levels still link up
+        while directory != root and os.path.dirname(directory) != directory:
+            parent = os.path.dirname(directory)
+            children = entries.setdefault(parent, [])
+            if (os.path.basename(directory), "d", directory) in children:
+                break
+            children.append((os.path.basename(directory), "d", directory))
+            directory = parent
+
+    hashes = {}
+    for directory in sorted(entries, key=_depth, reverse=True):
+        merkle = hashlib.sha256()
+        complete = True
+        count = 0
+        total = 0
+        height = 1
+        for name, kind, path in sorted(entries[directory]):
+            if kind == "f":
+                digest = digests.get(aliases.get(path, path))
+                count += 1
+                total += sizes[path]
+            else:
+                digest, sub_count, sub_total, sub_height = hashes[path]
+                count += sub_count
+                total += sub_total
+                height = max(height, sub_height + 1)
+            if digest is None:
+                complete = False
+            elif complete:
+                merkle.update(f"{kind}:{name}\0".encode("utf-8", "surrogateescape"))
+                merkle.update(digest)
+        hashes[directory] = (merkle.digest() if complete else None, count, total, height)
+    return hashes
+
+
+def content_digests(groups, hasher=None):
+    """
+    {path: content digest} for the members of file-level groups. Members of
+    perceptual ("image") groups are hashed with hasher, if one is given: equal
+    pictures are not necessarily equal files.
+    """
+    digests = {}
+    for group in groups:
+        if group.kind == "content":
+            digests.update(dict.fromkeys(group.members, group.digest))
+        elif group.kind == "image" and hasher:
+            for path in group.members:
+                try:
+                    digests[path] = hasher.full(path)
+                except OSError:
+                    pass  # leaves its directories out
+    return digests
+
+
+def find_duplicate_directories(root, files, groups, aliases=None, hasher=None):
+    """
+    DuplicateGroups of kind "directory" for identical directory trees below
+    root, built from the file-level DuplicateGroups of the same scan. Members
+    are in walk order; size is the size of one copy.
+    """
+    files = list(files)
+    hashes = directory_hashes(root, files, content_digests(groups, hasher), aliases)
+    first_file = {}
+    for i, (path, _) in enumerate(files):
+        directory = os.path.dirname(path)
+        while directory not in first_file and directory in hashes:
+            first_file[directory] = i
+            directory = os.path.dirname(directory)
+
+    by_hash = {}
+    for directory, (merkle, count, _, _) in hashes.items():
+        if merkle is not None and count and directory != os.path.normpath(root):
+            by_hash.setdefault(merkle, []).append(directory)
+    candidates = [members for members in by_hash.values() if len(members) > 1]
+    # Taller trees first: a directory's ancestors are always decided before it
+    candidates.sort(key=lambda members: hashes[members[0]][3], reverse=True)
+
+    result = []
+    reported = set()
+    for members in candidates:
+        # Copies inside an already reported directory are covered by that one
+        outer = [d for d in members if not _inside(os.path.dirname(d), reported)]
+        merkle, count, total, _ = hashes[members[0]]
+        outer = [d for d in outer if _count_entries(d) == count]
+        if len(outer) > 1:
+            outer.sort(key=lambda d: first_file.get(d, 0))
+            reported.update(outer)
+            result.append(DuplicateGroup(total, merkle, outer, "directory"))
+    result.sort(key=lambda group: first_file.get(group.original, 0))
+    return result
+
+
+def without_directories(groups, directory_groups):
+    """
+    File-level groups with the files inside duplicated directories taken out
+    (their directory is handled as a whole). Groups left with a single file
+    are dropped.
+    """
+    removed = {d for group in directory_groups for d in group.duplicates}
+    if not removed:
+        return list(groups)
+    result = []
+    for group in groups:
+        members = [path for path in group.members if not _inside(path, removed)]
+        if len(members) > 1:
+            result.append(DuplicateGroup(group.size, group.digest, members, group.kind))
+    return result
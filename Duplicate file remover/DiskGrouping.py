@@ -0,0 +1,423 @@
+"""
+Out-of-core duplicate grouping, for trees with more files than fit in memory.
+
+DuplicateEngine.iter_duplicate_groups() keeps every walked file in memory
+(compactly, see FileIndex), and HashCache keeps a dict per file; both still
+grow with the file count. DiskGrouper runs the same stages with the files in
+a scratch SQLite database instead:
+
+1. size    - walked files are inserted in batches; sizes shared by two or
+             more files are found with one GROUP BY
+2. partial - files of shared sizes are hashed (head and tail) a page at a time
+3. full    - files whose (size, partial hash) still collides are hashed
+             completely, and (size, digest) groups are read back in walk order
+
+Sizes are processed smallest first, in batches of about `batch` files, and
+each batch's groups are yielded as soon as they are confirmed.
+
+Memory is bounded by `budget` bytes, whatever the file count: it sizes
+SQLite's page cache, the insert batches and the pages of files hashed at a
+time, and SQLite sorts and groups in temporary files. The groups handed to
+the caller are not bounded: whoever keeps them (ScanEngine does, for the
+report and the actions) needs memory in proportion to the duplicates. The scratch database lives in `directory`
+(default: the system temp folder; keep it off a tmpfs).
+
+Given the scan database (`store`, e.g. duplicate_remover.db) it is attached:
+stored digests of unchanged files (same size, mtime_ns and inode, made with
+the same algorithm) are joined in with one UPDATE, and close() writes new
+signatures and digests back with one INSERT ... SELECT. hits, lookups and
+mismatches count like HashCache's, so ScanMetrics can report them.
+
+Images (with an image_hasher) are grouped by size + perceptual hash as in
+DuplicateEngine; those that cannot be decoded fall back to a content hash.
+"""
+
+import os
+import sqlite3
+import tempfile
+from functools import partial
+
+from DuplicateEngine import DuplicateGroup
+from FileIndex import FileRecord
+from HashEngine import DEFAULT_HASHER
+from ScanDatabase import CACHE_USE, CACHE_VERIFY, CACHE_MODES, connect, ensure_schema
+from WorkerPool import WorkerPool
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 ** 2
+MIN_MEMORY_BUDGET = 16 * 1024 ** 2
+ROW_BYTES = 1024  # generous size of one file while it is buffered or hashed, path and futures included
+
+_SCHEMA = '''
+    CREATE TABLE files (
+        row INTEGER PRIMARY KEY,     -- walk order
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime REAL,
+        mtime_ns INTEGER,
+        inode INTEGER,
+        device INTEGER,
+        nlink INTEGER,
+        image INTEGER NOT NULL,      -- 1: grouped by perceptual hash
+        stage INTEGER DEFAULT 0,     -- 1: needs a full hash, 2: its partial hash is the full one
+        partial BLOB,
+        digest BLOB,
+        image_hash TEXT,
+        dirty INTEGER DEFAULT 1      -- signature or digests to write back to the store
+    )
+'''
+
+_WRITE_BACK_SQL = '''
+    INSERT INTO store.scanned_files
+    (file_path, file_size, mtime, mtime_ns, inode, device, nlink, directory, partial_hash, file_hash, image_hash,
+     partial_algo, hash_algo, image_algo)
+    SELECT path, size, mtime, mtime_ns, inode, device, nlink, dirname(path), partial, digest, image_hash, ?, ?, ?
+    FROM files WHERE dirty
+    ON CONFLICT(file_path) DO UPDATE SET
+        file_size = excluded.file_size,
+        mtime = excluded.mtime,
+        mtime_ns = excluded.mtime_ns,
+        inode = excluded.inode,
+        device = excluded.device,
+        nlink = excluded.nlink,
+        directory = excluded.directory,
+        partial_hash = excluded.partial_hash,
+        file_hash = excluded.file_hash,
+        partial_algo = excluded.partial_algo,
+        hash_algo = excluded.hash_algo,
+        -- Scans without image hashing (the CLI) keep the GUI's image hashes
+        image_hash = CASE WHEN excluded.image_algo IS NULL THEN scanned_files.image_hash
+                          ELSE excluded.image_hash END,
+        image_algo = COALESCE(excluded.image_algo, scanned_files.image_algo)
+'''
+
+# Stored rows of unchanged files: same path, size, mtime_ns and inode
+_STORED_JOIN = '''
+    FROM store.scanned_files AS s
+    WHERE s.file_path = files.path AND s.file_size = files.size
+      AND s.mtime_ns = files.mtime_ns AND s.inode = files.inode
+'''
+
+
+def _partial_job(hasher, item):
+    _, path, size = item
+    return hasher.partial(path, size)
+
+
+def _full_job(hasher, item):
+    _, path, _ = item
+    return hasher.full(path)
+
+
+def _image_job(image_hasher, item):
+    _, path, _ = item
+    return image_hasher(path)
+
+
+class DiskGrouper:
+    """
+    Groups duplicates in a scratch database; see the module docstring.
+
+    Feed it (path, stat) pairs through groups(), which yields DuplicateGroups,
+    then close() it (or use it as a context manager).
+    """
+
+    def __init__(self, budget=DEFAULT_MEMORY_BUDGET, store=None, hasher=None, image_hasher=None,
+                 mode=CACHE_USE, directory=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.budget = max(MIN_MEMORY_BUDGET, int(budget))
+        self.store = store
+        self.mode = mode
+        self.hasher = hasher or DEFAULT_HASHER
+        self.image_hasher = image_hasher
+        self.algorithms = (self.hasher.partial_tag, self.hasher.algorithm,
+                           image_hasher.tag if image_hasher else None)
+        # A quarter of the budget for rows in Python, half for SQLite's page cache
+        self.batch = self.budget // 4 // ROW_BYTES
+        self.hits = 0
+        self.lookups = 0
+        self.mismatches = []
+        self.files = 0
+        self._pending = []
+
+        fd, self.db_file = tempfile.mkstemp(prefix="dedupe-groups-", suffix=".db", dir=directory)
+        os.close(fd)
+        self.conn = sqlite3.connect(self.db_file)
+        self.conn.create_function("dirname", 1, os.path.dirname, deterministic=True)
+        # Scratch data: nothing to recover after a crash
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("PRAGMA temp_store=FILE")
+        self.conn.execute(f"PRAGMA cache_size=-{self.budget // 2 // 1024}")  # in KiB
+        self.conn.execute(_SCHEMA)
+        if store:
+            conn = connect(store)
+            try:
+                ensure_schema(conn)
+            finally:
+                conn.close()
+            self.conn.execute("ATTACH DATABASE ? AS store", (store,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Filling
+
+    def add(self, path, stat):
+        image = bool(self.image_hasher and self.image_hasher.accepts(path))
+        self._pending.append((path, stat.st_size, stat.st_mtime, stat.st_mtime_ns, stat.st_ino, stat.st_dev,
+                              stat.st_nlink, int(image)))
+        self.files += 1
+        if len(self._pending) >= self.batch:
+            self._insert()
+
+    def _insert(self):
+        self.conn.executemany('''
+            INSERT INTO files (path, size, mtime, mtime_ns, inode, device, nlink, image)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', self._pending)
+        self._pending = []
+
+    def _load_stored(self):
+        """Mark files the store already knows unchanged, and take their digests (only in "use" mode)"""
+        self.conn.execute(f"UPDATE files SET dirty = s.nlink IS NULL OR s.directory IS NULL {_STORED_JOIN}")
+        if self.mode == CACHE_USE:
+            partial_algo, hash_algo, image_algo = self.algorithms
+            self.conn.execute(f'''
+                UPDATE files SET
+                    partial = CASE WHEN s.partial_algo = ? THEN s.partial_hash END,
+                    digest = CASE WHEN s.hash_algo = ? THEN s.file_hash END,
+                    image_hash = CASE WHEN s.image_algo = ? THEN s.image_hash END
+                {_STORED_JOIN}
+            ''', (partial_algo, hash_algo, image_algo))
+
+    # Grouping
+
+    def groups(self, files, stats=None, on_error=None, pool=None, image_pool=None):
+        """Insert (path, stat) pairs, then yield DuplicateGroups, smallest size first"""
+        pool = pool or WorkerPool(workers=1)
+        image_pool = image_pool or pool
+        if stats and self.image_hasher:
+            stats.add_stage("image")
+        for path, stat in files:
+            self.add(path, stat)
+        self._insert()
+        self.conn.execute("CREATE INDEX files_size ON files (size, row)")
+        if self.store:
+            self._load_stored()
+
+        # Stage 1: sizes shared by two or more files
+        self.conn.execute("CREATE TABLE shared (size INTEGER PRIMARY KEY, files INTEGER)")
+        if stats:
+            for size, count in self.conn.execute("SELECT size, COUNT(*) FROM files GROUP BY size"):
+                stats.enter("size", size, count)
+                if count > 1:
+                    stats.bytes_planned += size * count
+                else:
+                    stats.bytes_skipped["size"] += size
+        self.conn.execute("INSERT INTO shared SELECT size, COUNT(*) FROM files GROUP BY size HAVING COUNT(*) > 1")
+        self.conn.commit()
+
+        # Stages 2 and 3, a batch of sizes at a time
+        low = queued = 0
+        last = -1
+        while True:
+            rows = self.conn.execute("SELECT size, files FROM shared WHERE size > ? ORDER BY size LIMIT ?",
+                                     (last, self.batch)).fetchall()
+            for size, count in rows:
+                if not queued:
+                    low = size
+                queued += count
+                last = size
+                if queued >= self.batch:
+                    yield from self._confirm(low, size, stats, on_error, pool, image_pool)
+                    queued = 0
+            if not rows:
+                break
+        if queued:
+            yield from self._confirm(low, last, stats, on_error, pool, image_pool)
+
+    def _pages(self, sql, params):
+        """Rows of `SELECT row, path, size ... WHERE ...` in (size, row) order, a batch at a time"""
+        after = (-1, -1)
+        while True:
+            page = self.conn.execute(f"{sql} AND (size, row) > (?, ?) ORDER BY size, row LIMIT ?",
+                                     params + after + (self.batch,)).fetchall()
+            if not page:
+                return
+            yield page
+            after = (page[-1][2], page[-1][0])
+
+    def _confirm(self, low, high, stats, on_error, pool, image_pool):
+        candidates = '''
+            SELECT row, path, size, image, partial, image_hash FROM files
+            WHERE size BETWEEN ? AND ? AND size IN (SELECT size FROM shared WHERE size BETWEEN ? AND ?)
+        '''
+        for page in self._pages(candidates, (low, high, low, high)):
+            self._hash_page(page, stats, on_error, pool, image_pool)
+        self.conn.commit()
+
+        # Partial hashes that collide need a full hash, unless the partial hash read the whole file
+        self.conn.execute('''
+            UPDATE files SET stage = 1
+            WHERE size BETWEEN ? AND ? AND image = 0 AND partial IS NOT NULL AND (size, partial) IN (
+                SELECT size, partial FROM files
+                WHERE size BETWEEN ? AND ? AND image = 0 AND partial IS NOT NULL
+                GROUP BY size, partial HAVING COUNT(*) > 1)
+        ''', (low, high, low, high))
+        sizes = self.conn.execute('''
+            SELECT size, SUM(stage = 0), SUM(stage = 1) FROM files
+            WHERE size BETWEEN ? AND ? AND image = 0 AND partial IS NOT NULL GROUP BY size
+        ''', (low, high)).fetchall()
+        for size, ruled_out, survivors in sizes:
+            if stats:
+                stats.bytes_skipped["partial"] += (size - self.hasher.sampled_bytes(size)) * ruled_out
+            if survivors and self.hasher.partial_is_full(size):
+                self.conn.execute('''
+                    UPDATE files SET stage = 2, dirty = dirty OR digest IS NOT partial, digest = partial
+                    WHERE size = ? AND stage = 1
+                ''', (size,))
+
+        full = "SELECT row, path, size, digest FROM files WHERE size BETWEEN ? AND ? AND stage = 1"
+        for page in self._pages(full, (low, high)):
+            self._hash_full(page, stats, on_error, pool)
+        self.conn.commit()
+
+        # Confirmed groups, in the walk order of their originals
+        keys = self.conn.execute('''
+            SELECT 'content', size, digest, MIN(row) AS first FROM files
+            WHERE size BETWEEN ? AND ? AND stage > 0 AND digest IS NOT NULL
+            GROUP BY size, digest HAVING COUNT(*) > 1
+            UNION ALL
+            SELECT 'image', size, image_hash, MIN(row) AS first FROM files
+            WHERE size BETWEEN ? AND ? AND image = 1 AND image_hash IS NOT NULL
+            GROUP BY size, image_hash HAVING COUNT(*) > 1
+            ORDER BY first
+        ''', (low, high, low, high)).fetchall()
+        for kind, size, key, _ in keys:
+            if kind == "content":
+                sql = "SELECT path FROM files WHERE size = ? AND digest = ? AND stage > 0 ORDER BY row"
+            else:
+                sql = "SELECT path FROM files WHERE size = ? AND image_hash = ? AND image = 1 ORDER BY row"
+            members = [path for (path,) in self.conn.execute(sql, (size, key))]
+            yield DuplicateGroup(size, key, members, kind)
+
+    def _hash_page(self, page, stats, on_error, pool, image_pool):
+        """Perceptual hashes for the images of a page, partial hashes for everything else"""
+        images = []
+        partials = []
+        for row, path, size, image, partial_hash, image_hash in page:
+            stage = "image" if image else "partial"
+            if stats:
+                stats.enter(stage, size)
+            cached = image_hash if image else partial_hash
+            self.lookups += 1
+            if cached is not None:
+                self.hits += 1
+                if stats:
+                    stats.bytes_cached[stage] += size if image else self.hasher.sampled_bytes(size)
+            elif image:
+                images.append((row, path, size))
+            else:
+                partials.append((row, path, size))
+
+        updates = []
+        for item, image_hash, error in image_pool.map(partial(_image_job, self.image_hasher), images):
+            row, path, size = item
+            if stats:
+                stats.bytes_read["image"] += size
+            if image_hash:
+                updates.append((image_hash, row))
+            else:
+                # If image can't be opened, fallback to a content hash
+                self.conn.execute("UPDATE files SET image = 0 WHERE row = ?", (row,))
+                if stats:
+                    stats.enter("partial", size)
+                partials.append(item)
+        self.conn.executemany("UPDATE files SET image_hash = ?, dirty = 1 WHERE row = ?", updates)
+
+        updates = []
+        for (row, path, size), digest, error in pool.map(partial(_partial_job, self.hasher), partials):
+            if error:
+                if on_error:
+                    on_error(path, error)
+                continue
+            if stats:
+                stats.bytes_read["partial"] += self.hasher.sampled_bytes(size)
+            updates.append((digest, row))
+        self.conn.executemany("UPDATE files SET partial = ?, dirty = 1 WHERE row = ?", updates)
+
+    def _hash_full(self, page, stats, on_error, pool):
+        todo = []
+        for row, path, size, digest in page:
+            if stats:
+                stats.enter("full", size)
+            self.lookups += 1
+            if digest is not None:
+                self.hits += 1
+                if stats:
+                    stats.bytes_cached["full"] += size
+            else:
+                todo.append((row, path, size))
+
+        updates = []
+        failed = []
+        for (row, path, size), digest, error in pool.map(partial(_full_job, self.hasher), todo):
+            if error:
+                if on_error:
+                    on_error(path, error)
+                failed.append((row,))
+                continue
+            if stats:
+                stats.bytes_read["full"] += size
+            updates.append((digest, row))
+        self.conn.executemany("UPDATE files SET digest = ?, dirty = 1 WHERE row = ?", updates)
+        self.conn.executemany("UPDATE files SET stage = 0 WHERE row = ?", failed)
+
+    # Results
+
+    def __iter__(self):
+        """FileRecords of every file in walk order, like a FileIndex; read back a batch at a time"""
+        after = 0
+        while True:
+            page = self.conn.execute("SELECT row, path, size, mtime FROM files WHERE row > ? ORDER BY row LIMIT ?",
+                                     (after, self.batch)).fetchall()
+            if not page:
+                return
+            for row, path, size, mtime in page:
+                yield FileRecord(row, path, size, mtime)
+            after = page[-1][0]
+
+    def items(self):
+        """(path, size) pairs in walk order"""
+        for record in self:
+            yield record.path, record.size
+
+    def close(self):
+        """Write signatures and digests back to the store, and delete the scratch database"""
+        if self.conn is None:
+            return
+        try:
+            if self.store:
+                self._write_back()
+        finally:
+            self.conn.close()
+            self.conn = None
+            for suffix in ("", "-journal", "-wal", "-shm"):
+                try:
+                    os.remove(self.db_file + suffix)
+                except OSError:
+                    pass
+
+    def _write_back(self):
+        if self.mode == CACHE_VERIFY:
+            self.mismatches = [path for (path,) in self.conn.execute(f'''
+                SELECT path FROM files WHERE digest IS NOT NULL AND EXISTS (
+                    SELECT 1 {_STORED_JOIN} AND s.hash_algo = ? AND s.file_hash IS NOT NULL
+                    AND s.file_hash != files.digest)
+            ''', (self.algorithms[1],))]
+        self.conn.execute(_WRITE_BACK_SQL, self.algorithms)
+        self.conn.commit()
@@ -0,0 +1,532 @@
+"""
+Staged duplicate detection shared by FileRemover.py and AdvanceFileRemover.py.
+
+Files are compared in three stages, and each stage only reads what the
+previous one could not rule out:
+1. size    - a file whose st_size is unique cannot have a duplicate and is never opened
+2. partial - the first and last few KB of the remaining files are hashed
+3. full    - only files whose partial hashes still collide are hashed completely
+
+StageStats keeps track of how many files and bytes every stage read or skipped,
+and when each stage started (see ScanMetrics for rates and an ETA).
+Hashing is done by a HashEngine.FileHasher (sha256 unless configured otherwise).
+Both hashing stages run on a WorkerPool and can be given a ScanDatabase.HashCache,
+in which case digests of unchanged files are taken from the cache instead of
+being read again.
+
+iter_duplicate_groups() is the streaming entry point. While the walk is still
+running, files whose size already collides get their partial hash started on
+the pool, so hashing overlaps directory traversal. Once the walk is done it
+hashes the size groups in small chunks and yields every DuplicateGroup as soon
+as its members are confirmed, so callers can show or act on the first results
+long before the whole tree has been hashed.
+
+Walked files are kept in a FileIndex (row numbers, a directory table, array
+columns), not as path strings: a file's path only exists as a string while
+its chunk is being hashed, or once it is a member of a group. Results are
+handed out as DuplicateGroups; DuplicatePairs lists their (duplicate,
+original) pairs without a tuple per duplicate. When even the FileIndex is too
+large, DiskGrouping.DiskGrouper runs the same stages in a scratch database.
+"""
+
+import time
+import threading
+from array import array
+from concurrent.futures import wait
+from functools import partial
+from itertools import chain
+
+from FileIndex import FileIndex
+from HashEngine import DEFAULT_HASHER
+from WorkerPool import WorkerPool
+
+STAGES = ("size", "partial", "full")
+IDENTICAL_KINDS = ("content", "directory")  # group kinds whose members are byte-identical (not "image")
+
+CHUNK_FILES = 512  # files hashed together before the groups they confirm are yielded
+
+
+class DuplicateGroup:
+    """
+    All files sharing one content. members[0] is the original (the first copy
+    that was walked), the others are its duplicates.
+    kind is "content" for a digest match, "image" for a perceptual hash match.
+    Only the members of IDENTICAL_KINDS groups are byte-identical.
+    """
+
+    __slots__ = ("size", "digest", "members", "kind")
+
+    def __init__(self, size, digest, members, kind="content"):
+        self.size = size
+        self.digest = digest
+        self.members = members
+        self.kind = kind
+
+    @property
+    def original(self):
+        return self.members[0]
+
+    @property
+    def duplicates(self):
+        return self.members[1:]
+
+    def pairs(self):
+        """(duplicate, original) tuples, the format both scanners used to return"""
+        return [(dup, self.original) for dup in self.duplicates]
+
+    def wasted_bytes(self):
+        return self.size * (len(self.members) - 1)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __repr__(self):
+        return f"DuplicateGroup({self.kind}, size={self.size}, members={self.members!r})"
+
+
+class DuplicatePairs:
+    """
+    The (duplicate, original) pairs of DuplicateGroups, made on the fly while
+    iterating: the groups already hold every path, a list of pair tuples
+    would add a tuple per duplicate on top.
+    """
+
+    __slots__ = ("groups", "_count")
+
+    def __init__(self, groups=()):
+        self.groups = []
+        self._count = 0
+        for group in groups:
+            self.add(group)
+
+    def add(self, group):
+        self.groups.append(group)
+        self._count += len(group.members) - 1
+
+    def clear(self):
+        self.groups.clear()
+        self._count = 0
+
+    def copy(self):
+        return DuplicatePairs(self.groups)
+
+    def of_kinds(self, kinds):
+        """The pairs of the groups whose kind is in kinds"""
+        return DuplicatePairs(group for group in self.groups if group.kind in kinds)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for group in self.groups:
+            original = group.original
+            for dup in group.duplicates:
+                yield dup, original
+
+
+def as_pairs(items):
+    """Flatten DuplicateGroups into (duplicate, original) pairs; pairs pass through unchanged"""
+    for item in items:
+        if isinstance(item, DuplicateGroup):
+            yield from item.pairs()
+        else:
+            yield item
+
+
+class StageStats:
+    """Files and bytes read or skipped by every stage of a scan"""
+
+    def __init__(self):
+        self.files_in = {}
+        self.bytes_in = {}  # total size of the files that entered each stage
+        self.bytes_read = {}
+        self.bytes_skipped = {}
+        self.bytes_cached = {}
+        self.started = {}  # stage -> time.monotonic() of its first file
+        self.bytes_planned = 0  # size of every file sharing its size, known once the walk is done
+        for stage in STAGES:
+            self.add_stage(stage)
+
+    def add_stage(self, stage):
+        self.files_in.setdefault(stage, 0)
+        self.bytes_in.setdefault(stage, 0)
+        self.bytes_read.setdefault(stage, 0)
+        self.bytes_skipped.setdefault(stage, 0)
+        self.bytes_cached.setdefault(stage, 0)
+
+    def enter(self, stage, size, files=1):
+        """Count files of `size` bytes each entering a stage"""
+        if stage not in self.started:
+            self.started[stage] = time.monotonic()
+        self.files_in[stage] += files
+        self.bytes_in[stage] += size * files
+
+    def total_read(self):
+        return sum(self.bytes_read.values())
+
+    def total_skipped(self):
+        return sum(self.bytes_skipped.values())
+
+    def total_cached(self):
+        return sum(self.bytes_cached.values())
+
+    def summary_lines(self):
+        lines = []
+        for stage in self.files_in:
+            lines.append(
+                f"{stage:>8}: {self.files_in[stage]} files, "
+                f"read {format_bytes(self.bytes_read[stage])}, "
+                f"skipped {format_bytes(self.bytes_skipped[stage])}, "
+                f"cached {format_bytes(self.bytes_cached[stage])}"
+            )
+        return lines
+
+
+def format_bytes(num):
+    """Human readable byte count, e.g. 1.5 MB"""
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(num) < 1024 or unit == "TB":
+            return f"{num:.0f} {unit}" if unit == "B" else f"{num:.1f} {unit}"
+        num /= 1024
+
+
+def group_by_size(files, stats=None):
+    """
+    Stage 1: bucket (path, size) pairs by size.
+    Returns {size: [paths]} holding only the sizes shared by two or more files.
+    """
+    by_size = {}
+    for path, size in files:
+        by_size.setdefault(size, []).append(path)
+
+    collisions = {}
+    for size, paths in by_size.items():
+        if stats:
+            stats.enter("size", size, len(paths))
+        if len(paths) > 1:
+            collisions[size] = paths
+            if stats:
+                stats.bytes_planned += size * len(paths)
+        elif stats:
+            stats.bytes_skipped["size"] += size
+    return collisions
+
+
+def group_rows_by_size(index, stats=None):
+    """
+    Stage 1 over a FileIndex: {size: array of rows} for the sizes shared by
+    two or more files. Sizes are counted first, so rows of unique sizes never
+    end up in a list.
+    """
+    counts = {}
+    for size in index.sizes:
+        counts[size] = counts.get(size, 0) + 1
+
+    collisions = {}
+    for size, count in counts.items():
+        if stats:
+            stats.enter("size", size, count)
+        if count > 1:
+            collisions[size] = array("I")
+            if stats:
+                stats.bytes_planned += size * count
+        elif stats:
+            stats.bytes_skipped["size"] += size
+    for row, size in enumerate(index.sizes):
+        rows = collisions.get(size)
+        if rows is not None:
+            rows.append(row)
+    return collisions
+
+
+def _partial_job(hasher, item):
+    path, size = item
+    return hasher.partial(path, size)
+
+
+def _full_job(hasher, item):
+    path, _ = item
+    return hasher.full(path)
+
+
+def _cached_or_queued(paths_and_sizes, field, stage, stats, cache, results, hasher):
+    """Fill results from the cache and return the (path, size) items still to hash"""
+    todo = []
+    for path, size in paths_and_sizes:
+        if stats:
+            stats.enter(stage, size)
+        digest = cache.get(path, field) if cache else None
+        if digest is None:
+            todo.append((path, size))
+            continue
+        if stats:
+            stats.bytes_cached[stage] += hasher.sampled_bytes(size) if stage == "partial" else size
+        results[path] = digest
+    return todo
+
+
+class PartialPrefetch:
+    """
+    Partial hashes started during the walk, as soon as a second file of the
+    same size shows up. At most `limit` hashes are in flight; files beyond
+    that are hashed by the partial stage as usual.
+    """
+
+    def __init__(self, pool, hasher, cache=None, limit=None):
+        self.pool = pool
+        self.hasher = hasher
+        self.cache = cache
+        self.limit = limit or pool.io_depth
+        self._results = {}
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def add(self, path, size):
+        if self.cache and self.cache.has(path, "partial_hash"):
+            return
+        with self._lock:
+            if len(self._futures) >= self.limit:
+                return
+            future = self.pool.submit(partial(_partial_job, self.hasher), (path, size))
+            self._futures.add(future)
+        future.add_done_callback(partial(self._done, path))
+
+    def _done(self, path, future):
+        try:
+            result = (future.result(), None)
+        except OSError as e:
+            result = (None, e)
+        with self._lock:
+            self._results[path] = result
+            self._futures.discard(future)
+
+    def wait(self):
+        """Let every started hash finish"""
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures)
+
+    def take(self, path):
+        """(digest, error) for a prefetched file, or None if it was not prefetched"""
+        with self._lock:
+            return self._results.pop(path, None)
+
+
+def hash_candidates(size_groups, stats=None, on_error=None, cache=None, pool=None, hasher=None,
+                    prefetched=None):
+    """
+    Stages 2 and 3 for {size: [paths]} groups of equally sized files.
+    Returns {path: full digest} for every file that reached the full hash stage;
+    files ruled out by their partial hash, or unreadable ones, are left out.
+    Hashing runs on `pool` (a WorkerPool) when one is given; partial hashes
+    already computed by a PartialPrefetch are taken from `prefetched`.
+    """
+    pool = pool or WorkerPool(workers=1)
+    hasher = hasher or DEFAULT_HASHER
+    candidates = [(path, size) for size, paths in size_groups.items() for path in paths]
+
+    partials = {}
+    todo = _cached_or_queued(candidates, "partial_hash", "partial", stats, cache, partials, hasher)
+    ready = []
+    if prefetched:
+        remaining = []
+        for item in todo:
+            result = prefetched.take(item[0])
+            if result:
+                ready.append((item, *result))
+            else:
+                remaining.append(item)
+        todo = remaining
+    for (path, size), digest, error in chain(ready, pool.map(partial(_partial_job, hasher), todo)):
+        if error:
+            if on_error:
+                on_error(path, error)
+            continue
+        if stats:
+            stats.bytes_read["partial"] += hasher.sampled_bytes(size)
+        if cache:
+            cache.put(path, "partial_hash", digest)
+        partials[path] = digest
+
+    by_partial = {}
+    for path, size in candidates:
+        if path in partials:
+            by_partial.setdefault((size, partials[path]), []).append(path)
+
+    digests = {}
+    survivors = []
+    for (size, digest), group in by_partial.items():
+        if len(group) < 2:
+            if stats:
+                stats.bytes_skipped["partial"] += size - hasher.sampled_bytes(size)
+        elif hasher.partial_is_full(size):
+            # The partial hash already covered the whole file
+            for path in group:
+                digests[path] = digest
+                if cache:
+                    cache.put(path, "file_hash", digest)
+        else:
+            survivors.extend((path, size) for path in group)
+
+    todo = _cached_or_queued(survivors, "file_hash", "full", stats, cache, digests, hasher)
+    for (path, size), digest, error in pool.map(partial(_full_job, hasher), todo):
+        if error:
+            if on_error:
+                on_error(path, error)
+            continue
+        if stats:
+            stats.bytes_read["full"] += size
+        if cache:
+            cache.put(path, "file_hash", digest)
+        digests[path] = digest
+
+    # Same order as the input, whichever stage or worker produced a digest
+    return {path: digests[path] for path, _ in candidates if path in digests}
+
+
+def _hash_images(size_groups, stats, cache, image_hasher, image_pool):
+    """
+    Perceptual hashes for the images among size_groups. Returns {path: hash};
+    images that cannot be decoded are moved to the regular groups so that
+    they still get a content hash.
+    """
+    image_hashes = {}
+    jobs = []
+    for size, paths in size_groups.items():
+        for path in [p for p in paths if image_hasher.accepts(p)]:
+            paths.remove(path)
+            if stats:
+                stats.enter("image", size)
+            cached = cache.get(path, "image_hash") if cache else None
+            if cached:
+                if stats:
+                    stats.bytes_cached["image"] += size
+                image_hashes[path] = cached
+            else:
+                jobs.append((path, size))
+
+    image_pool = image_pool or WorkerPool(workers=1)
+    for (path, size), image_hash, error in image_pool.map(partial(_image_job, image_hasher), jobs):
+        if stats:
+            stats.bytes_read["image"] += size
+        if image_hash:
+            image_hashes[path] = image_hash
+            if cache:
+                cache.put(path, "image_hash", image_hash)
+        else:
+            # If image can't be opened, fallback to a content hash
+            size_groups[size].append(path)
+    return image_hashes
+
+
+def _image_job(image_hasher, item):
+    path, _ = item
+    return image_hasher(path)
+
+
+def iter_duplicate_groups(files, stats=None, on_error=None, cache=None, pool=None, hasher=None,
+                          image_hasher=None, image_pool=None, chunk_files=CHUNK_FILES, index=None):
+    """
+    Run all three stages over (path, size) pairs, e.g. straight from
+    FileWalker.walk_files(), and yield DuplicateGroups as they are confirmed.
+    The size stage needs the whole walk, so the first group arrives only
+    once the walk has finished (partial hashes of colliding sizes start
+    during it). Size groups are then processed smallest size first, about
+    `chunk_files` files at a time; members keep the order in which the files
+    were given.
+
+    image_hasher (optional) decides which files are images (.accepts(path))
+    and returns their perceptual hash when called; those files are grouped by
+    size + perceptual hash instead of content, on image_pool if given.
+
+    The files are added to index (a FileIndex; a new one if None), so a caller
+    passing its own can go through every walked file afterwards. Items may be
+    (path, size, mtime) to fill its mtime column too.
+    """
+    pool = pool or WorkerPool(workers=1)
+    hasher = hasher or DEFAULT_HASHER
+    index = FileIndex() if index is None else index
+    if stats and image_hasher:
+        stats.add_stage("image")
+
+    # Consume the walk, starting partial hashes for sizes that already collide
+    prefetch = PartialPrefetch(pool, hasher, cache) if pool.workers > 1 else None
+    first_of_size = {}  # size -> row of its first file, -1 once that file's partial hash was started
+    for item in files:
+        path, size = item[0], item[1]
+        row = index.add(*item)
+        if not prefetch or (image_hasher and image_hasher.accepts(path)):
+            continue
+        first = first_of_size.get(size)
+        if first is None:
+            first_of_size[size] = row
+            continue
+        if first >= 0:
+            prefetch.add(index.path(first), size)
+            first_of_size[size] = -1
+        prefetch.add(path, size)
+    first_of_size = None
+    if prefetch:
+        prefetch.wait()
+
+    def confirm(chunk):
+        # Paths of this chunk only; the row doubles as the walk position
+        row_of = {}
+        size_groups = {}
+        for size, rows in chunk.items():
+            paths = size_groups[size] = []
+            for row in rows:
+                path = index.path(row)
+                row_of[path] = row
+                paths.append(path)
+
+        by_key = {}
+        if image_hasher:
+            image_hashes = _hash_images(size_groups, stats, cache, image_hasher, image_pool)
+            for path, image_hash in image_hashes.items():
+                by_key.setdefault(("image", index.sizes[row_of[path]], image_hash), []).append(path)
+        regular = {size: paths for size, paths in size_groups.items() if len(paths) > 1}
+        for path, digest in hash_candidates(regular, stats, on_error, cache, pool, hasher, prefetch).items():
+            by_key.setdefault(("content", index.sizes[row_of[path]], digest), []).append(path)
+
+        groups = []
+        for (kind, size, digest), members in by_key.items():
+            if len(members) > 1:
+                members.sort(key=row_of.__getitem__)
+                groups.append(DuplicateGroup(size, digest, members, kind))
+        groups.sort(key=lambda group: row_of[group.original])
+        return groups
+
+    size_groups = group_rows_by_size(index, stats)
+    chunk = {}
+    queued = 0
+    for size in sorted(size_groups):
+        chunk[size] = size_groups.pop(size)
+        queued += len(chunk[size])
+        if queued >= chunk_files:
+            yield from confirm(chunk)
+            chunk = {}
+            queued = 0
+    if chunk:
+        yield from confirm(chunk)
+
+
+def find_duplicate_groups(files, stats=None, on_error=None, cache=None, pool=None, hasher=None,
+                          image_hasher=None, image_pool=None):
+    """
+    Collect iter_duplicate_groups() into a list ordered like the input,
+    so groups[0].original is the first file that was seen.
+    """
+    index = FileIndex()
+    groups = list(iter_duplicate_groups(files, stats, on_error, cache, pool, hasher,
+                                        image_hasher, image_pool, index=index))
+    # Walk positions of the originals only, not of every file
+    position = {group.original: None for group in groups}
+    for row, (path, _) in enumerate(index.items()):
+        if path in position:
+            position[path] = row
+    groups.sort(key=lambda group: position[group.original])
+    return groups
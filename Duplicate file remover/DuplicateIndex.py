@@ -0,0 +1,262 @@
+"""
+Incrementally maintained duplicate groups for watch mode.
+
+A full scan answers "which files are duplicates" once. DuplicateIndex keeps
+that answer up to date while files come and go: it remembers the size and
+signature of every file, and the digest of every file whose size is shared,
+so a change only costs hashing the changed file (plus, the first time a size
+collides, the one file it now collides with). The I/O of keeping a folder
+deduplicated is then proportional to the churn, not to the tree size.
+
+build() does one staged scan (see DuplicateEngine); afterwards update(),
+update_tree() and apply() take the paths reported by a FolderWatcher.
+"""
+
+import os
+from stat import S_ISREG
+
+from DuplicateEngine import DuplicateGroup, StageStats, group_by_size, hash_candidates
+from FileWalker import ACCEPT_ALL, walk_files, collapse_hardlinks, inode_key
+from HashEngine import DEFAULT_HASHER
+from ScanDatabase import file_signature
+
+
+class DuplicateIndex:
+    """
+    Files below root, grouped by size and, where sizes collide, by full digest.
+
+    Files are remembered in the order they were first seen; the first member of
+    a group is its original. A HashCache (optional) supplies and stores digests.
+    """
+
+    def __init__(self, root, hasher=None, cache=None, file_filter=ACCEPT_ALL, on_error=None):
+        self.root = os.path.abspath(root)
+        self.hasher = hasher or DEFAULT_HASHER
+        self.cache = cache
+        self.file_filter = file_filter
+        self.on_error = on_error
+        self.bytes_read = 0  # file data hashed since build() started
+        self._files = {}  # path -> (size, signature, order, inode key)
+        self._by_size = {}  # size -> {path: None}, insertion ordered
+        self._digests = {}  # path -> full digest, only for sizes that collide
+        self._by_key = {}  # (size, digest) -> {path: None}
+        self._inodes = {}  # inode key -> path, for files with several hard links
+        self._order = 0
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, path):
+        return path in self._files
+
+    # Initial scan
+
+    def build(self, fanout=1, pool=None, stats=None):
+        """Walk root and hash every size collision with the staged engine"""
+        stats = stats or StageStats()
+        entries = walk_files(self.root, self.file_filter, self.on_error, fanout)
+        for path, stat in collapse_hardlinks(entries):
+            self._remember(path, stat)
+        sizes = group_by_size(((path, info[0]) for path, info in self._files.items()), stats)
+        digests = hash_candidates(sizes, stats, self.on_error, self.cache, pool, self.hasher)
+        for path, digest in digests.items():
+            self._set_digest(path, digest)
+        self.bytes_read += stats.total_read()
+        if self.cache:
+            self.cache.flush()
+        return stats
+
+    # Incremental updates
+
+    def update(self, path):
+        """
+        Bring one path up to date (created, modified or deleted).
+        Returns the (size, digest) keys of the groups that changed.
+        """
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is None or not self._accepts(path, stat):
+            return self._forget(path)
+
+        known = self._files.get(path)
+        if known and known[1] == file_signature(stat):
+            return set()
+        touched = self._forget(path)
+        # A modified file keeps its place, so it stays the original of its group
+        touched |= self._add(path, stat, known[2] if known else None)
+        return touched
+
+    def update_tree(self, directory):
+        """
+        Re-list a directory that appeared, disappeared or may have lost events:
+        new and changed files are hashed, vanished ones dropped.
+        """
+        directory = os.path.abspath(directory)
+        prefix = os.path.join(directory, "")
+        touched = set()
+        seen = set()
+        if os.path.isdir(directory) and self._accepts_dirs(directory):
+            for path, stat in walk_files(directory, _SubtreeFilter(self, directory), self.on_error):
+                seen.add(path)
+                known = self._files.get(path)
+                if known and known[1] == file_signature(stat):
+                    continue
+                touched |= self._forget(path)
+                touched |= self._add(path, stat, known[2] if known else None)
+        for path in [p for p in self._files if p.startswith(prefix) and p not in seen]:
+            touched |= self._forget(path)
+        return touched
+
+    def apply(self, paths=(), directories=()):
+        """
+        Reconcile a batch of changes. Returns {(size, digest): group} for every
+        group that changed, with None for groups that no longer have duplicates.
+        """
+        touched = set()
+        for directory in sorted(directories):
+            touched |= self.update_tree(directory)
+        for path in sorted(paths):
+            touched |= self.update(path)
+        if self.cache:
+            self.cache.flush()
+        return {key: self.group(key) for key in touched}
+
+    # Results
+
+    def group(self, key):
+        """The DuplicateGroup for a (size, digest) key, or None if it has a single member"""
+        members = self._by_key.get(key)
+        if not members or len(members) < 2:
+            return None
+        size, digest = key
+        return DuplicateGroup(size, digest, sorted(members, key=self._position))
+
+    def groups(self):
+        """All current duplicate groups, ordered by their original"""
+        groups = [self.group(key) for key in self._by_key]
+        groups = [group for group in groups if group]
+        groups.sort(key=lambda group: self._position(group.original))
+        return groups
+
+    # Internals
+
+    def _position(self, path):
+        return self._files[path][2]
+
+    def _accepts(self, path, stat):
+        if not S_ISREG(stat.st_mode) or not self.file_filter.accepts_size(stat.st_size):
+            return False
+        if not path.startswith(os.path.join(self.root, "")) or not self._accepts_dirs(os.path.dirname(path)):
+            return False
+        rel_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+        return self.file_filter.accepts_name(os.path.basename(path), rel_path)
+
+    def _accepts_dirs(self, directory):
+        """False if directory lies in (or is) a folder the filter prunes"""
+        rel_dir = os.path.relpath(directory, self.root).replace(os.sep, "/")
+        if rel_dir == ".":
+            return True
+        if rel_dir == ".." or rel_dir.startswith("../"):
+            return False
+        parts = rel_dir.split("/")
+        return all(self.file_filter.accepts_dir(name, "/".join(parts[:i + 1]))
+                   for i, name in enumerate(parts))
+
+    def _remember(self, path, stat, order=None):
+        key = inode_key(stat) if stat.st_nlink > 1 else None
+        if key is not None:
+            if self._inodes.get(key, path) != path:
+                return False  # another name of a file already indexed
+            self._inodes[key] = path
+        if order is None:
+            self._order += 1
+            order = self._order
+        self._files[path] = (stat.st_size, file_signature(stat), order, key)
+        self._by_size.setdefault(stat.st_size, {})[path] = None
+        if self.cache:
+            self.cache.add(path, stat)
+        return True
+
+    def _add(self, path, stat, order=None):
+        if not self._remember(path, stat, order):
+            return set()
+        peers = self._by_size[stat.st_size]
+        if len(peers) < 2:
+            return set()
+        touched = set()
+        # The first collision of a size also needs the digest of the file it collides with
+        for peer in list(peers):
+            if peer not in self._digests:
+                digest = self._digest(peer)
+                if digest is not None:
+                    touched.add(self._set_digest(peer, digest))
+        return touched
+
+    def _digest(self, path):
+        digest = self.cache.get(path, "file_hash") if self.cache else None
+        if digest is not None:
+            return digest
+        try:
+            digest = self.hasher.full(path)
+        except OSError as e:
+            if self.on_error:
+                self.on_error(path, e)
+            return None
+        self.bytes_read += self._files[path][0]
+        if self.cache:
+            self.cache.put(path, "file_hash", digest)
+        return digest
+
+    def _set_digest(self, path, digest):
+        key = (self._files[path][0], digest)
+        self._digests[path] = digest
+        self._by_key.setdefault(key, {})[path] = None
+        return key
+
+    def _forget(self, path):
+        info = self._files.pop(path, None)
+        if info is None:
+            return set()
+        size, _, _, inode = info
+        if inode is not None and self._inodes.get(inode) == path:
+            del self._inodes[inode]
+        peers = self._by_size[size]
+        del peers[path]
+        if not peers:
+            del self._by_size[size]
+        digest = self._digests.pop(path, None)
+        if digest is None:
+            return set()
+        key = (size, digest)
+        members = self._by_key[key]
+        del members[path]
+        if not members:
+            del self._by_key[key]
+        return {key}
+
+
+class _SubtreeFilter:
+    """
+    The index's FileFilter for walking a subdirectory: walk_files() passes paths
+    relative to the directory it walks, the patterns expect them relative to root.
+    """
+
+    def __init__(self, index, directory):
+        self.index = index
+        self.directory = directory
+
+    def _rel(self, rel_path):
+        full = os.path.join(self.directory, rel_path)
+        return os.path.relpath(full, self.index.root).replace(os.sep, "/")
+
+    def accepts_name(self, name, rel_path):
+        return self.index.file_filter.accepts_name(name, self._rel(rel_path))
+
+    def accepts_dir(self, name, rel_path):
+        return self.index.file_filter.accepts_dir(name, self._rel(rel_path))
+
+    def accepts_size(self, size):
+        return self.index.file_filter.accepts_size(size)
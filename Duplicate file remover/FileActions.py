@@ -0,0 +1,234 @@
+"""
+Link-based deduplication shared by both duplicate removers.
+
+Instead of moving a duplicate away, "hardlink" and "reflink" replace it in
+place with a link to the original, so the space is reclaimed immediately and
+nothing has to be copied into trash_bin:
+- hardlink: both names point at the same inode (same filesystem only). Editing
+            one name changes the other.
+- reflink:  a copy-on-write clone (Btrfs, XFS, APFS, ...). Both files stay
+            independent; blocks are shared until one of them is modified.
+
+The duplicate is replaced atomically: the link is created under a temporary
+name next to it and renamed over it, so a failure never leaves it missing.
+Right before the rename both files are compared byte for byte, so a file that
+changed since the scan, or that only matched by perceptual hash, is never
+replaced by a link to different content.
+
+Duplicates may also be whole directories (see DirectoryHashing): every file
+in the copy is then linked to the file at the same place in the original.
+
+run_actions() applies one action to a stream of (duplicate, original) pairs on
+a pool of worker threads, journaling each operation as soon as it completes
+(see ActionJournal). Moves into duplicates/ or trash_bin/ are a plain rename
+when both sides are on the same filesystem; data is only copied across
+devices. Safe deletes can go to a content-addressed TrashStore instead.
+"""
+
+import os
+import sys
+import errno
+import shutil
+import datetime
+import threading
+
+from FileWalker import inode_key
+from WorkerPool import WorkerPool, DEFAULT_WORKERS
+
+LINK_ACTIONS = ("hardlink", "reflink")
+MOVE_ACTIONS = ("move", "safe_delete")
+ACTIONS = MOVE_ACTIONS + ("permanent_delete",) + LINK_ACTIONS
+
+FICLONE = 0x40049409  # Linux ioctl, see ioctl_ficlone(2)
+COMPARE_CHUNK = 1024 * 1024
+
+
+def reflink(src, dst):
+    """Create dst as a copy-on-write clone of src; OSError(EOPNOTSUPP) if the filesystem cannot"""
+    if sys.platform.startswith("linux"):
+        import fcntl
+        with open(src, "rb") as source, open(dst, "xb") as target:
+            try:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            except OSError:
+                target.close()
+                os.remove(dst)
+                raise
+        return
+    if sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), dst)
+        return
+    raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform", dst)
+
+
+def _temporary_name(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.dedupe-tmp")
+
+
+def same_content(path, other):
+    """True if both files hold the same bytes"""
+    with open(path, "rb") as a, open(other, "rb") as b:
+        if os.fstat(a.fileno()).st_size != os.fstat(b.fileno()).st_size:
+            return False
+        while True:
+            chunk = a.read(COMPARE_CHUNK)
+            if chunk != b.read(COMPARE_CHUNK):
+                return False
+            if not chunk:
+                return True
+
+
+def tree_files(directory):
+    """Paths of the files below directory, relative to it"""
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            yield os.path.relpath(os.path.join(dirpath, name), directory)
+
+
+def replace_with_link(dup, original, mode="hardlink"):
+    """Replace dup by a hardlink or reflink of original (file by file for directories)"""
+    if mode not in LINK_ACTIONS:
+        raise ValueError(f"Unknown link mode: {mode}")
+    if os.path.isdir(dup):
+        for rel_path in tree_files(dup):
+            replace_with_link(os.path.join(dup, rel_path), os.path.join(original, rel_path), mode)
+        return
+    dup_stat = os.stat(dup)
+    original_stat = os.stat(original)
+    if dup_stat.st_size != original_stat.st_size:
+        raise OSError(errno.EINVAL, "File changed since the scan (sizes differ)", dup)
+    if mode == "hardlink" and inode_key(dup_stat) and inode_key(dup_stat) == inode_key(original_stat):
+        return  # already the same file
+
+    tmp = _temporary_name(dup)
+    try:
+        if mode == "hardlink":
+            os.link(original, tmp)
+        else:
+            reflink(original, tmp)
+            shutil.copystat(dup, tmp)  # a clone is a separate file: keep the duplicate's own metadata
+        if not same_content(tmp, dup):
+            raise OSError(errno.EINVAL, "Content differs from the original; not replaced", dup)
+        os.replace(tmp, dup)
+    except OSError:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def break_link(path):
+    """Undo replace_with_link(): give path its own copy of the content again"""
+    if os.path.isdir(path):
+        for rel_path in tree_files(path):
+            break_link(os.path.join(path, rel_path))
+        return
+    tmp = _temporary_name(path)
+    try:
+        shutil.copy2(path, tmp)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def remove_path(path):
+    """Delete a file, or a directory with everything in it"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def move_path(src, dst):
+    """Move a file or directory: a rename on the same filesystem, copy and delete across devices"""
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+
+class DestinationAllocator:
+    """
+    Unique destinations inside a folder for concurrent moves. A taken name
+    gets a timestamp suffix (and a counter if that is taken too); names handed
+    out are reserved, so two workers never pick the same one.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._reserved = set()
+        self._lock = threading.Lock()
+
+    def _taken(self, dest):
+        return dest in self._reserved or os.path.lexists(dest)
+
+    def reserve(self, path):
+        base, ext = os.path.splitext(os.path.join(self.folder, os.path.basename(path)))
+        with self._lock:
+            dest = base + ext
+            if self._taken(dest):
+                stamp = f"{base}_{datetime.datetime.now().timestamp():.0f}"
+                dest = stamp + ext
+                counter = 1
+                while self._taken(dest):
+                    dest = f"{stamp}_{counter}{ext}"
+                    counter += 1
+            self._reserved.add(dest)
+            return dest
+
+
+def _apply_action(action, destinations, versioning, journal, trash, pair):
+    dup, original = pair
+    # Absolute paths keep the journal usable from any working directory
+    record = {"path": os.path.abspath(dup), "action": action, "original": os.path.abspath(original)}
+    if versioning:
+        stat = os.stat(dup)
+        record.update(size=stat.st_size, mtime=stat.st_mtime)
+
+    if action == "safe_delete" and trash:
+        record["trash"] = trash.put(dup)
+    elif action in MOVE_ACTIONS:
+        dest = destinations[action].reserve(dup)
+        move_path(dup, dest)
+        record.update({"from": os.path.abspath(dest), "to": record["path"]})
+    elif action == "permanent_delete":
+        remove_path(dup)
+    else:
+        replace_with_link(dup, original, action)
+
+    if journal:
+        journal.append(record)
+    return record
+
+
+def run_actions(pairs, action, journal=None, folders=None, workers=DEFAULT_WORKERS, versioning=False,
+                trash=None):
+    """
+    Apply action to every (duplicate, original) pair, `workers` at a time.
+    folders maps "move" / "safe_delete" to their destination folder; with a
+    TrashStore as trash, safe_delete stores duplicates there instead.
+    Yields (duplicate, record, error) in the order of pairs; record is what
+    was journaled, error the OSError if the operation failed.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action: {action}")
+    destinations = {}
+    if action in MOVE_ACTIONS and not (action == "safe_delete" and trash):
+        folder = (folders or {})[action]
+        os.makedirs(folder, exist_ok=True)
+        destinations[action] = DestinationAllocator(folder)
+
+    def job(pair):
+        return _apply_action(action, destinations, versioning, journal, trash, pair)
+
+    with WorkerPool(workers) as pool:
+        for (dup, _), record, error in pool.map(job, pairs):
+            yield dup, record, error
@@ -0,0 +1,104 @@
+"""
+Compact, column-oriented table of the files a scan has walked.
+
+Keeping one Python object per file does not scale to tens of millions of
+files: an absolute path string alone is about 100 bytes, its os.stat_result
+another 180, and every dict keyed by path (walk position, size, stat) adds an
+entry on top. FileIndex stores a file as a row number instead:
+
+- a directory table: each directory path is stored once, and a row only
+  keeps the 4-byte id of its directory
+- file names, fs-encoded, are concatenated in one bytearray, with an array of
+  end offsets
+- sizes and mtimes are array columns, 8 bytes each
+
+Rows are numbered in the order files were added (the walk order), so a row
+number also is a file's position. path(row) rebuilds the full path when it is
+needed: while the file is hashed, or once it is a member of a DuplicateGroup.
+A row costs about 28 bytes plus the length of its name; `python Benchmark.py
+memory` measures this against the per-path dicts and the old hash_map layout.
+"""
+
+import os
+from array import array
+
+
+class FileRecord:
+    """One row of a FileIndex"""
+
+    __slots__ = ("row", "path", "size", "mtime")
+
+    def __init__(self, row, path, size, mtime):
+        self.row = row
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+
+    def __repr__(self):
+        return f"FileRecord({self.row}, {self.path!r}, size={self.size})"
+
+
+class FileIndex:
+    """Files by row number: directory table, packed names, size and mtime columns"""
+
+    def __init__(self):
+        self._dirs = []  # directory id -> path
+        self._dir_ids = {}  # directory path -> id
+        self._last_dir = (None, None)  # (path, id) of the previous add; walks add a directory's files in a row
+        self.dir_ids = array("I")
+        self._names = bytearray()
+        self._name_ends = array("Q")
+        self.sizes = array("Q")
+        self.mtimes = array("d")
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def add(self, path, size, mtime=0.0):
+        """Append a file and return its row"""
+        directory, name = os.path.split(path)
+        last_path, dir_id = self._last_dir
+        if directory != last_path:
+            dir_id = self._dir_ids.get(directory)
+            if dir_id is None:
+                dir_id = self._dir_ids[directory] = len(self._dirs)
+                self._dirs.append(directory)
+            self._last_dir = (directory, dir_id)
+        self.dir_ids.append(dir_id)
+        self._names += os.fsencode(name)
+        self._name_ends.append(len(self._names))
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        return len(self.sizes) - 1
+
+    def name(self, row):
+        start = self._name_ends[row - 1] if row else 0
+        return os.fsdecode(bytes(self._names[start:self._name_ends[row]]))
+
+    def path(self, row):
+        return os.path.join(self._dirs[self.dir_ids[row]], self.name(row))
+
+    def record(self, row):
+        return FileRecord(row, self.path(row), self.sizes[row], self.mtimes[row])
+
+    def __iter__(self):
+        """FileRecords in row order"""
+        for row in range(len(self)):
+            yield self.record(row)
+
+    def items(self):
+        """(path, size) pairs in row order, like the walk that filled the index"""
+        for row in range(len(self)):
+            yield self.path(row), self.sizes[row]
+
+    def directories(self):
+        return len(self._dirs)
+
+    def directory(self, dir_id):
+        return self._dirs[dir_id]
+
+    def nbytes(self):
+        """Approximate memory of the columns and the directory table"""
+        columns = (self.dir_ids, self._name_ends, self.sizes, self.mtimes)
+        return (sum(column.itemsize * len(column) for column in columns) + len(self._names)
+                + sum(len(directory) + 49 for directory in self._dirs))
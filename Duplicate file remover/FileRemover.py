@@ -1,158 +1,360 @@
 import os
-import hashlib
-import shutil
+import sys
 import datetime
-import json
+import argparse
+
+from DuplicateEngine import StageStats, iter_duplicate_groups, as_pairs, format_bytes
+from FileIndex import FileIndex
+from DiskGrouping import DiskGrouper
+from ScanDatabase import HashCache, DirectorySummaries, CACHE_USE, CACHE_VERIFY
+from WorkerPool import WorkerPool, DEFAULT_WORKERS
+from FileWalker import FileFilter, ACCEPT_ALL, DEFAULT_FANOUT, walk_files, collapse_hardlinks
+from FileActions import LINK_ACTIONS, run_actions
+from ActionJournal import ActionJournal, JOURNAL_SUFFIX
+from RecoveryIndex import RecoveryIndex, parse_time
+from ScanMetrics import ScanMetrics, MetricsReporter, DEFAULT_REPORT_INTERVAL
+from TrashStore import TrashStore, MANIFEST_FILE, DEFAULT_COMPRESS_LEVEL, parse_size
+from DirectoryHashing import find_duplicate_directories, without_directories
+from HashEngine import FileHasher, DEFAULT_HASHER, DEFAULT_ALGORITHM, DEFAULT_BUFFER_SIZE, available_algorithms
 
 RECOVERY_FOLDER = "recovery_logs"
 DUPLICATE_FOLDER = "duplicates"
 TRASH_FOLDER = "trash_bin"
 DELETED_LOGS_FOLDER = "deleted_file_logs"  # New folder for storing log files
 
-# Generate hash for a file
-def get_file_hash(filepath):
-    hasher = hashlib.sha256()
+# Generate hash for a file (hex string)
+def get_file_hash(filepath, hasher=DEFAULT_HASHER):
     try:
-        with open(filepath, 'rb') as file:
-            while chunk := file.read(4096):
-                hasher.update(chunk)
-        return hasher.hexdigest()
+        return hasher.full(filepath).hex()
     except Exception as e:
         print(f"[Error] Unable to read file: {filepath}. Skipped. ({e})")
         return None
 
-# Recursively find duplicates in a folder
-def find_duplicates(folder_path):
+# Recursively find duplicates in a folder, yielding each DuplicateGroup as soon as it is confirmed
+# (the first one once the walk is done: grouping by size needs every file)
+# cache_file: optional SQLite database (e.g. the GUI's duplicate_remover.db) whose
+# stored hashes are reused for files that did not change since the last scan
+# workers / io_depth: hashing threads and the maximum number of files queued for them
+# hasher: HashEngine.FileHasher choosing the algorithm and read buffer size
+# file_filter: FileWalker.FileFilter with include/exclude patterns and pruned folders
+# fanout: directories listed concurrently (helps on NFS/SMB; output order does not change)
+# skip_unchanged_dirs: take the files of folders whose mtime did not change from the cache
+# instead of listing them (needs cache_file; misses files modified in place)
+# detect_directories: report identical folders as one group each, before the remaining files;
+# groups are then only yielded once the whole scan is done
+# metrics_file: write throughput metrics there at the end (JSON, or Prometheus text for *.prom)
+# progress_interval: seconds between live status lines (0 = none)
+# memory_budget: group the files in a scratch database in spill_dir (default: the temp folder)
+# instead of in memory, using about this many bytes whatever the file count (see DiskGrouping)
+def scan_duplicates(folder_path, cache_file=None, cache_mode=CACHE_USE, invalidate_cache=False,
+                    workers=DEFAULT_WORKERS, io_depth=None, hasher=DEFAULT_HASHER, file_filter=ACCEPT_ALL,
+                    fanout=DEFAULT_FANOUT, skip_unchanged_dirs=False, detect_directories=False,
+                    metrics_file=None, progress_interval=DEFAULT_REPORT_INTERVAL, memory_budget=None,
+                    spill_dir=None):
+    if memory_budget and detect_directories:
+        raise ValueError("Identical folders can only be detected with every file in memory")
     print(f"\n🔍 Scanning folder: {folder_path}\n")
-    hash_map = {}
-    duplicates = []
-
-    for root, _, files in os.walk(folder_path):
-        for file in sorted(files):
-            full_path = os.path.join(root, file)
-            file_hash = get_file_hash(full_path)
-            if file_hash:
-                if file_hash in hash_map:
-                    duplicates.append((full_path, hash_map[file_hash]))
-                else:
-                    hash_map[file_hash] = full_path
-    return duplicates
+
+    cache = None
+    summaries = None
+    if cache_file:
+        cache = HashCache(cache_file, cache_mode, hasher)
+        if invalidate_cache:
+            cache.invalidate(folder_path)
+        if memory_budget:
+            # The grouper joins in and writes back the stored digests itself
+            cache.close()
+            cache = None
+        # Verifying means looking at every file, so no folder is skipped then; under a
+        # memory budget the file rows the summaries rely on are only written at the end
+        if skip_unchanged_dirs and cache_mode == CACHE_USE and not memory_budget:
+            folder_path = os.path.abspath(folder_path)  # summaries are stored by absolute path
+            summaries = DirectorySummaries(cache_file, file_filter.key)
+
+    def report_unreadable(path, e):
+        print(f"[Error] Unable to read file: {path}. Skipped. ({e})")
+
+    grouper = None
+    if memory_budget:
+        grouper = DiskGrouper(memory_budget, cache_file, hasher, mode=cache_mode, directory=spill_dir)
+    cached = grouper if cache is None else cache  # whichever reuses stored digests, if any
+
+    # Only files that share a size are read, and only colliding ones completely
+    stats = StageStats()
+    metrics = ScanMetrics(stats, cached)
+
+    # Files stream from the walk into the hashing stages; extra hard links are dropped
+    hardlinks = {}
+    index = FileIndex()  # every walked file, kept compactly by row
+
+    def walked():
+        entries = walk_files(folder_path, file_filter, report_unreadable, fanout, summaries)
+        if cache:
+            # Every name is recorded, hard links included, so stored folder listings stay complete
+            entries = cache.track(entries)
+        for full_path, stat in collapse_hardlinks(entries, hardlinks):
+            metrics.walked(stat.st_size)
+            yield full_path, stat
+        metrics.walk_finished()
+
+    def show_progress(line):
+        print(f"⏱️ {line}", file=sys.stderr, flush=True)
+
+    try:
+        with WorkerPool(workers, io_depth) as pool, MetricsReporter(metrics, show_progress, progress_interval):
+            metrics.watch_queue("hash", lambda: pool.in_flight)
+            if grouper is not None:
+                groups = grouper.groups(walked(), stats, report_unreadable, pool)
+            else:
+                groups = iter_duplicate_groups(
+                    ((path, stat.st_size) for path, stat in walked()), stats,
+                    on_error=report_unreadable,
+                    cache=cache,
+                    pool=pool,
+                    hasher=hasher,
+                    index=index,
+                )
+            if not detect_directories:
+                yield from groups
+            else:
+                # A folder's hash needs the digests of all its files, so this waits for the whole scan
+                groups = list(groups)
+                directories = find_duplicate_directories(folder_path, list(index.items()), groups, hardlinks, hasher)
+                if directories:
+                    print(f"📂 {len(directories)} duplicate folders found; their files are not listed separately.")
+                yield from directories
+                yield from without_directories(groups, directories)
+    finally:
+        if hardlinks:
+            print(f"🔗 {len(hardlinks)} hard links to already scanned files were not hashed.")
+        if summaries:
+            summaries.close()
+            print(f"📁 {summaries.reused_dirs} unchanged folders ({summaries.reused_files} files) taken from the cache, "
+                  f"{summaries.listed_dirs} folders listed.")
+        if cache:
+            cache.close()
+        if grouper is not None:
+            grouper.close()
+        if cache_file:
+            print(f"💾 Hash cache: {cached.hits} hits, {format_bytes(stats.total_cached())} not re-read.")
+            for path in cached.mismatches:
+                print(f"[Warning] Content changed but size/mtime/inode did not: {path}")
+        print(f"📊 Read {format_bytes(stats.total_read())}, skipped {format_bytes(stats.total_skipped())}:")
+        for line in stats.summary_lines():
+            print(f"   {line}")
+        metrics.finish()
+        print(f"⏱️ {metrics.status_line()}")
+        if metrics_file:
+            print(f"📈 Metrics written to `{metrics.write_report(metrics_file)}`.")
+
+# Recursively find duplicates in a folder, returning (duplicate, original) pairs once the scan is done
+def find_duplicates(folder_path, **options):
+    return list(as_pairs(scan_duplicates(folder_path, **options)))
 
 # Take action on duplicates
-def handle_duplicates(duplicates, action):
-    log_entries = []
-    recovery_data = {}
+# Operations run on `workers` threads; each one is journaled as soon as it completes,
+# so the recovery log survives a crash halfway through
+# trash: TrashStore keeping one (optionally compressed) copy per content for safe_delete
+def handle_duplicates(duplicates, action, workers=DEFAULT_WORKERS, trash=None):
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    log_file = f"duplicate_log_{timestamp}.txt"
-    recovery_file = os.path.join(RECOVERY_FOLDER, f"recovery_{timestamp}.json")
+    log_file = os.path.join(DELETED_LOGS_FOLDER, f"duplicate_log_{timestamp}.txt")
+    recovery_file = os.path.join(RECOVERY_FOLDER, f"recovery_{timestamp}{JOURNAL_SUFFIX}")
 
     os.makedirs(RECOVERY_FOLDER, exist_ok=True)
     os.makedirs(DELETED_LOGS_FOLDER, exist_ok=True)  # Ensure log folder exists
-    
-    if action == "move":
-        os.makedirs(DUPLICATE_FOLDER, exist_ok=True)
-    if action == "safe_delete":
-        os.makedirs(TRASH_FOLDER, exist_ok=True)
-
-    for dup, original in duplicates:
-        try:
-            if action == "move":
-                dest = os.path.join(DUPLICATE_FOLDER, os.path.basename(dup))
-                if os.path.exists(dest):
-                    base, ext = os.path.splitext(dest)
-                    dest = f"{base}_{datetime.datetime.now().timestamp():.0f}{ext}"
-                shutil.move(dup, dest)
-                log_entries.append(f"Moved: {dup} → {dest}")
-                recovery_data[dup] = {"action": "move", "from": dest, "to": dup}
 
+    folders = {"move": DUPLICATE_FOLDER, "safe_delete": TRASH_FOLDER}
+    handled = 0
+    # duplicates may be a list of pairs or a stream of DuplicateGroups still being scanned
+    with ActionJournal(recovery_file) as journal, open(log_file, "w", encoding="utf-8") as log:
+        for dup, record, error in run_actions(as_pairs(duplicates), action, journal, folders, workers,
+                                              trash=trash):
+            if error:
+                entry = f"[Error] Failed to process {dup}: {error}"
+            elif action == "move":
+                entry = f"Moved: {dup} → {record['from']}"
             elif action == "safe_delete":
-                dest = os.path.join(TRASH_FOLDER, os.path.basename(dup))
-                if os.path.exists(dest):
-                    base, ext = os.path.splitext(dest)
-                    dest = f"{base}_{datetime.datetime.now().timestamp():.0f}{ext}"
-                shutil.move(dup, dest)
-                log_entries.append(f"Safely Deleted (moved to trash): {dup} → {dest}")
-                recovery_data[dup] = {"action": "safe_delete", "from": dest, "to": dup}
-
+                entry = f"Safely Deleted (moved to trash): {dup} → {record.get('from', TRASH_FOLDER)}"
             elif action == "permanent_delete":
-                os.remove(dup)
-                log_entries.append(f"Permanently Deleted: {dup}")
-                recovery_data[dup] = {"action": "permanent_delete"}
-
+                entry = f"Permanently Deleted: {dup}"
             else:
-                log_entries.append(f"Duplicate found: {dup} (Original: {original})")
+                entry = f"Replaced with {action}: {dup} → {record['original']}"
+            log.write(("\n" if handled else "") + entry)
+            handled += 1
 
-        except Exception as e:
-            log_entries.append(f"[Error] Failed to process {dup}: {e}")
-
-    # Write the duplicate log file with utf-8 encoding
-    with open(log_file, "w", encoding="utf-8") as f:
-        f.write("\n".join(log_entries))
-
-    # Move the log file into the deleted_file_logs folder
-    shutil.move(log_file, os.path.join(DELETED_LOGS_FOLDER, log_file))
-
-    # Write the recovery JSON log
-    with open(recovery_file, "w", encoding="utf-8") as f:
-        json.dump(recovery_data, f, indent=4)
-
-    print(f"\n✅ Action completed. Log saved to `{os.path.join(DELETED_LOGS_FOLDER, log_file)}`.")
-    print(f"♻️ Recovery log saved to `{recovery_file}`.")
-
-# Print summary
-def preview_duplicates(duplicates):
-    if not duplicates:
+    if not handled:
+        os.remove(log_file)
+        os.remove(recovery_file)
         print("\n✅ No duplicates found.")
         return
-    print(f"\n📁 Found {len(duplicates)} duplicate files:\n")
-    for dup, original in duplicates:
-        print(f"- {dup}\n  ↪ Original: {original}\n")
-
-# Recover from recovery log
-def recover_files():
-    os.makedirs(RECOVERY_FOLDER, exist_ok=True)
-    logs = sorted([f for f in os.listdir(RECOVERY_FOLDER) if f.endswith(".json")])
-
-    if not logs:
-        print("❌ No recovery logs found in 'recovery_logs'.")
-        return
 
-    print(f"\n📝 Found {len(logs)} recovery log(s) in '{RECOVERY_FOLDER}':")
-    for idx, log in enumerate(logs, 1):
-        print(f"{idx}. {log}")
-
-    try:
-        choice = input("\n🔢 Enter the log number to restore [1-{}] or 0 to cancel: ".format(len(logs))).strip()
-        if not choice.isdigit() or int(choice) == 0:
-            print("🔙 Recovery cancelled.")
-            return
+    print(f"\n✅ Action completed. Log saved to `{log_file}`.")
+    print(f"♻️ Recovery log saved to `{recovery_file}`.")
 
-        log_index = int(choice) - 1
-        if log_index < 0 or log_index >= len(logs):
-            print("❌ Invalid choice.")
+# Print duplicates as they arrive (a list of pairs or a stream of DuplicateGroups)
+# keep: also return what was printed, so it can be acted on once the scan is done
+def preview_duplicates(duplicates, keep=False):
+    count = 0
+    kept = []
+    for item in duplicates:
+        if keep:
+            kept.append(item)
+        for dup, original in as_pairs([item]):
+            if not count:
+                print("\n📁 Duplicate files:\n")
+            if os.path.isdir(dup):
+                print(f"- 📂 {dup}{os.sep}\n  ↪ Original folder: {original}{os.sep}\n")
+            else:
+                print(f"- {dup}\n  ↪ Original: {original}\n")
+            count += 1
+    if not count:
+        print("\n✅ No duplicates found.")
+        return kept
+    print(f"\n📁 Found {count} duplicates.")
+    return kept
+
+# Deletes are confirmed once the scan is done and its totals are known
+def confirm_delete(groups, action):
+    count = sum(len(group.duplicates) for group in groups)
+    freed = sum(group.wasted_bytes() for group in groups)
+    what = "permanently delete" if action == "permanent_delete" else "move to the trash"
+    warning = " This cannot be undone." if action == "permanent_delete" else ""
+    confirm = input(f"⚠️ {what.capitalize()} these {count} duplicates in {len(groups)} groups "
+                    f"({format_bytes(freed)})?{warning} [yes/no]: ").strip().lower()
+    return confirm == "yes"
+
+# Restore from the indexed recovery journals, optionally only below a path and/or after a time
+def recover_files(workers=DEFAULT_WORKERS):
+    with RecoveryIndex(RECOVERY_FOLDER) as index:
+        index.sync()
+        journals = index.journals()
+
+        if not journals:
+            print(f"❌ No recovery logs found in '{RECOVERY_FOLDER}'.")
             return
 
-        recovery_file = os.path.join(RECOVERY_FOLDER, logs[log_index])
-        with open(recovery_file, "r", encoding="utf-8") as f:
-            recovery_data = json.load(f)
-
-        for original, action_info in recovery_data.items():
-            if action_info["action"] == "move" or action_info["action"] == "safe_delete":
-                try:
-                    shutil.move(action_info["from"], action_info["to"])
-                    print(f"✅ Restored: {action_info['from']} → {action_info['to']}")
-                except Exception as e:
-                    print(f"❌ Failed to restore {action_info['from']}: {e}")
-            elif action_info["action"] == "permanent_delete":
-                print(f"⚠️ Cannot recover permanently deleted file: {original} → Reason: File was permanently deleted.")
+        print(f"\n📝 Found {len(journals)} recovery log(s) in '{RECOVERY_FOLDER}':")
+        for idx, (name, entries, pending, first, last) in enumerate(journals, 1):
+            print(f"{idx}. {name} ({entries} entries, {pending} not restored, "
+                  f"{_format_time(first)} → {_format_time(last)})")
 
-        print("\n♻️ Recovery attempt completed.")
+        try:
+            choice = input("\n🔢 Enter the log number to restore [1-{}], 'a' for all logs "
+                           "or 0 to cancel: ".format(len(journals))).strip().lower()
+            if choice == "a":
+                journal = None
+            elif not choice.isdigit() or int(choice) == 0:
+                print("🔙 Recovery cancelled.")
+                return
+            elif int(choice) > len(journals):
+                print("❌ Invalid choice.")
+                return
+            else:
+                journal = journals[int(choice) - 1][0]
+
+            prefix = input("📂 Only restore paths under (blank for all): ").strip() or None
+            since = parse_time(input("🕒 Only actions at or after (YYYY-MM-DD [HH:MM], blank for any): "))
+            filters = dict(prefix=prefix, since=since, journal=journal)
+
+            total = index.count(**filters)
+            permanent = index.count(**filters, permanent=True)
+            if permanent:
+                print(f"⚠️ {permanent} permanently deleted files in this selection cannot be recovered.")
+            if not total:
+                print("✅ Nothing to restore.")
+                return
+            print(f"\n♻️ Restoring {total} entries...")
+
+            def report(done, entry, error):
+                if error:
+                    print(f"❌ Failed to restore {entry.path}: {error}")
+                elif entry.action in LINK_ACTIONS:
+                    print(f"✅ Restored independent copy: {entry.path}")
+                else:
+                    print(f"✅ Restored: {entry.src} → {entry.dst}")
+                if done % 1000 == 0 or done == total:
+                    print(f"   ... {done}/{total}")
+
+            trash = TrashStore(TRASH_FOLDER) if os.path.exists(os.path.join(TRASH_FOLDER, MANIFEST_FILE)) else None
+            try:
+                restored, failed = index.restore(index.query(**filters), workers, report, trash)
+            finally:
+                if trash:
+                    trash.close()
+            print(f"\n♻️ Recovery attempt completed: {restored} restored, {failed} failed.")
 
-    except Exception as e:
-        print(f"❌ Error during recovery: {e}")
+        except Exception as e:
+            print(f"❌ Error during recovery: {e}")
+
+def _format_time(stamp):
+    if stamp is None:
+        return "?"
+    return datetime.datetime.fromtimestamp(stamp).strftime("%Y-%m-%d %H:%M:%S")
+
+# Command line options (the menu itself stays interactive)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Duplicate File Remover")
+    parser.add_argument("--cache", metavar="DB_FILE",
+                        help="SQLite hash cache to reuse between scans, e.g. duplicate_remover.db")
+    parser.add_argument("--verify-cache", action="store_true",
+                        help="re-hash every file and report cached hashes that no longer match")
+    parser.add_argument("--invalidate-cache", action="store_true",
+                        help="forget cached hashes of the scanned folder before scanning")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"hashing threads, also used for moving or deleting duplicates (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--io-depth", type=int, default=None,
+                        help="maximum number of files queued for hashing (default: 4 per worker)")
+    parser.add_argument("--hash", choices=available_algorithms(), default=DEFAULT_ALGORITHM,
+                        help=f"algorithm confirming duplicates (default: {DEFAULT_ALGORITHM})")
+    parser.add_argument("--prefilter", choices=available_algorithms(), default=None,
+                        help="algorithm for the partial-hash stage, e.g. crc32 (default: same as --hash)")
+    parser.add_argument("--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE,
+                        help=f"read buffer size in bytes (default: {DEFAULT_BUFFER_SIZE})")
+    parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                        help="only scan files matching this glob (or re:regex); repeatable")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="skip files matching this glob (or re:regex); repeatable")
+    parser.add_argument("--exclude-dir", action="append", default=[], metavar="PATTERN",
+                        help="do not descend into folders matching this pattern, e.g. .git; repeatable")
+    parser.add_argument("--walkers", type=int, default=DEFAULT_FANOUT,
+                        help=f"directories listed concurrently, useful on network mounts (default: {DEFAULT_FANOUT})")
+    parser.add_argument("--skip-unchanged-dirs", action="store_true",
+                        help="reuse the cached files of folders whose mtime is unchanged instead of listing them "
+                             "(needs --cache; misses files modified in place)")
+    parser.add_argument("--dirs", action="store_true",
+                        help="report identical folders as a whole and act on them as one item")
+    parser.add_argument("--trash-compress", type=int, nargs="?", const=DEFAULT_COMPRESS_LEVEL, default=0,
+                        metavar="LEVEL", choices=range(10),
+                        help=f"zlib-compress safe-deleted files in the trash (level 1-9, default {DEFAULT_COMPRESS_LEVEL})")
+    parser.add_argument("--trash-limit", type=parse_size, default=None, metavar="SIZE",
+                        help="evict the least recently used trash contents beyond this size, e.g. 20G "
+                             "(evicted files can no longer be recovered)")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write scan throughput metrics to FILE at the end: JSON, or Prometheus text "
+                             "if FILE ends in .prom (e.g. for node_exporter's textfile collector)")
+    parser.add_argument("--progress", type=float, default=DEFAULT_REPORT_INTERVAL, metavar="SECONDS",
+                        help=f"print a live status line every SECONDS to stderr, 0 = never "
+                             f"(default: {DEFAULT_REPORT_INTERVAL:g})")
+    parser.add_argument("--memory-budget", type=parse_size, default=None, metavar="SIZE",
+                        help="group files in a scratch database on disk, using about SIZE of memory (e.g. 512M) "
+                             "whatever the file count; for trees too large to group in memory")
+    parser.add_argument("--act-while-scanning", action="store_true",
+                        help="delete duplicates as soon as they are found, instead of listing them all and "
+                             "asking for confirmation once the scan is done")
+    parser.add_argument("--spill-dir", default=None, metavar="DIR",
+                        help="where --memory-budget keeps its scratch database (default: the temp folder; "
+                             "avoid a tmpfs)")
+    args = parser.parse_args(argv)
+    if args.skip_unchanged_dirs and not args.cache:
+        parser.error("--skip-unchanged-dirs needs --cache")
+    if args.memory_budget and args.dirs:
+        parser.error("--dirs needs every file in memory; it cannot be combined with --memory-budget")
+    return args
 
 # Main Menu
-def main():
+def main(args=None):
+    if args is None:
+        args = parse_args()
     print("=== 🔁 Duplicate File Remover ===\n")
     print("1. Scan folder and manage duplicates")
     print("2. Recover from last action")
@@ -166,37 +368,71 @@ def main():
             print("\n❌ Invalid folder path.")
             return
 
-        duplicates = find_duplicates(folder)
-        if not duplicates:
-            print("\n✅ No duplicates found.")
-            return
-
         print("\nChoose an action:")
         print("1. Preview only")
         print("2. Move duplicates to `duplicates/` folder")
         print("3. Safe delete (recoverable)")
         print("4. Permanent delete (NOT recoverable)")
-        print("5. Exit")
+        print("5. Replace duplicates with hard links (same filesystem only)")
+        print("6. Replace duplicates with reflinks (copy-on-write clones, e.g. Btrfs/XFS/APFS)")
+        print("7. Exit")
 
-        choice = input("\nEnter your choice [1-5]: ").strip()
+        choice = input("\nEnter your choice [1-7]: ").strip()
+        if choice not in ("1", "2", "3", "4", "5", "6"):
+            print("👋 Exiting. No action taken.")
+            return
+        deleting = {"3": "safe_delete", "4": "permanent_delete"}.get(choice)
+        if deleting == "permanent_delete" and args.act_while_scanning:
+            confirm = input("⚠️ Delete duplicates permanently while the scan runs, without seeing them first? "
+                            "[yes/no]: ").lower()
+            if confirm != "yes":
+                print("❌ Permanent deletion cancelled.")
+                return
+
+        # Duplicates are previewed, moved or linked group by group while the scan is still running;
+        # deletes wait for the whole list unless --act-while-scanning is given
+        duplicates = scan_duplicates(
+            folder,
+            cache_file=args.cache,
+            cache_mode=CACHE_VERIFY if args.verify_cache else CACHE_USE,
+            invalidate_cache=args.invalidate_cache,
+            workers=args.workers,
+            io_depth=args.io_depth,
+            hasher=FileHasher(args.hash, args.prefilter, buffer_size=args.buffer_size),
+            file_filter=FileFilter(args.include, args.exclude, args.exclude_dir),
+            fanout=args.walkers,
+            skip_unchanged_dirs=args.skip_unchanged_dirs,
+            detect_directories=args.dirs,
+            metrics_file=args.metrics,
+            progress_interval=args.progress,
+            memory_budget=args.memory_budget,
+            spill_dir=args.spill_dir,
+        )
+
+        if deleting and not args.act_while_scanning:
+            duplicates = preview_duplicates(duplicates, keep=True)
+            if not duplicates:
+                return
+            if not confirm_delete(duplicates, deleting):
+                print("❌ Deletion cancelled. No files were changed.")
+                return
 
         if choice == "1":
             preview_duplicates(duplicates)
         elif choice == "2":
-            handle_duplicates(duplicates, "move")
+            handle_duplicates(duplicates, "move", args.workers)
         elif choice == "3":
-            handle_duplicates(duplicates, "safe_delete")
+            with TrashStore(TRASH_FOLDER, args.trash_compress, args.trash_limit) as trash:
+                handle_duplicates(duplicates, "safe_delete", args.workers, trash)
         elif choice == "4":
-            confirm = input("⚠️ Are you sure you want to permanently delete duplicates? [yes/no]: ").lower()
-            if confirm == "yes":
-                handle_duplicates(duplicates, "permanent_delete")
-            else:
-                print("❌ Permanent deletion cancelled.")
+            handle_duplicates(duplicates, "permanent_delete", args.workers)
+        elif choice == "5":
+            handle_duplicates(duplicates, "hardlink", args.workers)
         else:
-            print("👋 Exiting. No action taken.")
+            handle_duplicates(duplicates, "reflink", args.workers)
 
     elif main_choice == "2":
-        recover_files()
+        recover_files(args.workers)
     else:
         print("👋 Goodbye!")
 
@@ -0,0 +1,240 @@
+"""
+Change tracking for watch mode.
+
+A watcher collects the paths that changed below a folder; take() hands them
+over as (paths, directories), ready for DuplicateIndex.apply(): `paths` are
+files to re-check, `directories` are trees to re-list (new or moved-in
+folders, removed folders, or the whole root after lost events).
+
+- InotifyWatcher: Linux inotify through ctypes, one watch per directory and a
+  background thread reading events. Costs nothing while the folder is idle.
+  If it runs out of watches later (a new folder beyond the limit), it reports
+  that through on_error and behaves like a PollingWatcher from then on.
+- PollingWatcher: fallback for other platforms, or when the inotify watch
+  limit (fs.inotify.max_user_watches) is too low for the tree. Every take()
+  asks for the whole root to be re-listed; unchanged files are recognised by
+  their signature, so only stat calls are spent on them, no reads.
+
+create_watcher() picks the best one available.
+"""
+
+import os
+import sys
+import errno
+import select
+import struct
+import threading
+
+from FileWalker import ACCEPT_ALL
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class PollingWatcher:
+    """Re-lists the whole folder on every take()"""
+
+    def __init__(self, root, file_filter=ACCEPT_ALL, on_error=None):
+        self.root = os.path.abspath(root)
+
+    def start(self):
+        return self
+
+    def take(self):
+        return set(), {self.root}
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Watches every directory below root that file_filter does not prune.
+    Raises OSError from start() if inotify is unavailable or the watch limit
+    is reached.
+    """
+
+    def __init__(self, root, file_filter=ACCEPT_ALL, on_error=None):
+        self.root = os.path.abspath(root)
+        self.file_filter = file_filter
+        self.on_error = on_error
+        self._libc = None
+        self._fd = None
+        self._watches = {}  # wd -> directory
+        self._paths = set()
+        self._directories = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.polling = False  # set once events can no longer be trusted to cover the tree
+
+    def start(self):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        try:
+            self._watch_tree(self.root)
+        except OSError:
+            self.close()
+            raise
+        self._thread = threading.Thread(target=self._run, name="InotifyWatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def take(self):
+        """(paths, directories) changed since the last call"""
+        with self._lock:
+            paths, directories = self._paths, self._directories
+            self._paths, self._directories = set(), set()
+            if self.polling:
+                directories.add(self.root)
+        return paths, directories
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _add_watch(self, directory):
+        import ctypes
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify watch limit reached (fs.inotify.max_user_watches)", directory)
+            if self.on_error:
+                self.on_error(directory, OSError(err, os.strerror(err), directory))
+            return
+        self._watches[wd] = directory
+
+    def _watch_tree(self, top):
+        """Watch top and every directory below it that the filter does not prune"""
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            self._add_watch(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False) and self._accepts_dir(entry.path):
+                            stack.append(entry.path)
+            except OSError as e:
+                if self.on_error:
+                    self.on_error(directory, e)
+
+    def _unwatch_tree(self, top):
+        prefix = os.path.join(top, "")
+        for wd, directory in list(self._watches.items()):
+            if directory == top or directory.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+
+    def _accepts_dir(self, path):
+        rel_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+        return self.file_filter.accepts_dir(os.path.basename(path), rel_path)
+
+    def _run(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._fd], [], [], 0.5)
+            if not readable:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                self._fall_back(self.root, e)
+                return
+            self._handle(data)
+
+    def _fall_back(self, path, error):
+        """Stop trusting events: report why, and have every take() re-list the whole root"""
+        with self._lock:
+            if self.polling:
+                return
+            self.polling = True
+        if self.on_error:
+            self.on_error(path, OSError(error.errno, f"{error.strerror}; watching by polling from now on", path))
+
+    def _handle(self, data):
+        offset = 0
+        paths, directories = set(), set()
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: only a full re-listing is safe
+                directories.add(self.root)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                continue
+            if not name:
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    directories.add(directory)
+                continue
+
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and self._accepts_dir(path) and not self.polling:
+                    try:
+                        self._watch_tree(path)
+                    except OSError as e:
+                        # Out of watches: changes below path would go unnoticed
+                        self._fall_back(path, e)
+                elif mask & IN_MOVED_FROM:
+                    self._unwatch_tree(path)
+                directories.add(path)
+            else:
+                paths.add(path)
+
+        with self._lock:
+            self._paths |= paths
+            self._directories |= directories
+
+
+def create_watcher(root, file_filter=ACCEPT_ALL, on_error=None, polling=False):
+    """
+    Start an InotifyWatcher on Linux, falling back to a PollingWatcher.
+    Returns (watcher, reason) where reason says why polling is used, or None.
+    """
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root, file_filter, on_error).start(), None
+        except (OSError, AttributeError) as e:
+            return PollingWatcher(root, file_filter, on_error).start(), f"inotify unavailable ({e})"
+    reason = None if polling else "inotify is only available on Linux"
+    return PollingWatcher(root, file_filter, on_error).start(), reason
@@ -0,0 +1,156 @@
+"""
+Pluggable, low-allocation file hashing shared by both duplicate removers.
+
+Files are read into one preallocated buffer per thread with readinto() and
+handed to the hash object as a memoryview, so no bytes object is created per
+chunk. Files of at least `mmap_threshold` bytes are memory-mapped and hashed
+in one call instead. Digests are returned as raw bytes; call .hex() to show one.
+
+Algorithms:
+- "sha256"   - default, cryptographic
+- "blake2b"  - cryptographic, usually faster than sha256 on 64-bit CPUs
+- "xxh3_128" - non-cryptographic, needs the optional `xxhash` package
+- "crc32"    - non-cryptographic, stdlib only; meant as a fast pre-filter for the
+               partial-hash stage, too weak to confirm duplicates on its own
+
+Non-cryptographic algorithms trade collision resistance for throughput and
+should only confirm duplicates on trusted data.
+"""
+
+import os
+import hashlib
+import mmap
+import threading
+import zlib
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None  # xxh3_128 won't be available
+
+DEFAULT_ALGORITHM = "sha256"
+DEFAULT_BUFFER_SIZE = 1024 * 1024  # 1 MiB
+DEFAULT_MMAP_THRESHOLD = 64 * 1024 * 1024  # files of 64 MiB and more are memory-mapped
+
+
+class _Crc32:
+    """hashlib-style wrapper around zlib.crc32"""
+
+    def __init__(self):
+        self._crc = 0
+
+    def update(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+
+    def digest(self):
+        return self._crc.to_bytes(4, "big")
+
+
+ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+    "crc32": _Crc32,
+}
+if xxhash:
+    ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+
+
+def available_algorithms():
+    return sorted(ALGORITHMS)
+
+
+class FileHasher:
+    """
+    Hashes whole files, or the head and tail of a file for the partial stage.
+
+    algorithm:        used for full hashes
+    prefilter:        used for partial hashes (defaults to algorithm)
+    partial_bytes:    bytes sampled from the head and from the tail of a file
+    buffer_size:      size of the reusable read buffer
+    mmap_threshold:   files at least this large are hashed through mmap
+    """
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, prefilter=None, partial_bytes=4096,
+                 buffer_size=DEFAULT_BUFFER_SIZE, mmap_threshold=DEFAULT_MMAP_THRESHOLD):
+        prefilter = prefilter or algorithm
+        for name in (algorithm, prefilter):
+            if name not in ALGORITHMS:
+                raise ValueError(f"Unknown or unavailable hash algorithm: {name} "
+                                 f"(available: {', '.join(available_algorithms())})")
+        self.algorithm = algorithm
+        self.prefilter = prefilter
+        self.partial_bytes = partial_bytes
+        self.buffer_size = max(4096, int(buffer_size))
+        self.mmap_threshold = mmap_threshold
+        self._local = threading.local()
+
+    # Worker processes get a copy without the thread-local buffers
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def partial_tag(self):
+        """Identifies how partial digests were made, so cached ones are only reused when comparable"""
+        return f"{self.prefilter}:{self.partial_bytes}"
+
+    def sampled_bytes(self, size):
+        """How much of a file of this size the partial stage reads"""
+        return min(size, 2 * self.partial_bytes)
+
+    def partial_is_full(self, size):
+        """True if the partial digest of a file this size is also its full digest"""
+        return size <= 2 * self.partial_bytes and self.prefilter == self.algorithm
+
+    def _buffer(self):
+        view = getattr(self._local, "view", None)
+        if view is None or len(view) != self.buffer_size:
+            view = memoryview(bytearray(self.buffer_size))
+            self._local.view = view
+        return view
+
+    def _update_from(self, file, hasher, length):
+        view = self._buffer()
+        while length > 0:
+            n = file.readinto(view[:min(len(view), length)])
+            if not n:
+                break
+            hasher.update(view[:n])
+            length -= n
+
+    def full(self, filepath):
+        """Digest of the whole file"""
+        hasher = ALGORITHMS[self.algorithm]()
+        with open(filepath, 'rb', buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size and size >= self.mmap_threshold:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    hasher.update(mapped)
+            else:
+                view = self._buffer()
+                while n := f.readinto(view):
+                    hasher.update(view[:n])
+        return hasher.digest()
+
+    def partial(self, filepath, size):
+        """
+        Digest of the head and tail of a file. Files no larger than the two sampled
+        windows are read completely.
+        """
+        hasher = ALGORITHMS[self.prefilter]()
+        with open(filepath, 'rb', buffering=0) as f:
+            if size <= 2 * self.partial_bytes:
+                self._update_from(f, hasher, size)
+            else:
+                self._update_from(f, hasher, self.partial_bytes)
+                f.seek(size - self.partial_bytes)
+                self._update_from(f, hasher, self.partial_bytes)
+        return hasher.digest()
+
+
+DEFAULT_HASHER = FileHasher()
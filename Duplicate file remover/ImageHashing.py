@@ -0,0 +1,100 @@
+"""
+Perceptual image hashing for AdvanceFileRemover.py.
+
+Kept in its own module so that image decoding can run in worker processes
+(see WorkerPool): the functions here must stay importable and picklable
+without the GUI.
+
+Decoding is the expensive part of hashing a photo, and a perceptual hash only
+looks at a tiny grayscale version of it. Images are therefore decoded at the
+smallest size that still covers DECODE_SIZE: JPEGs through PIL's draft mode,
+which lets libjpeg scale by 1/2, 1/4 or 1/8 while decoding (skipping most of
+the IDCT work), other formats through Image.reduce() before imagehash resizes
+them.
+
+Methods:
+- "ahash" - average hash, the fastest (default, what earlier versions stored)
+- "dhash" - difference hash, more robust against brightness/contrast changes
+- "phash" - DCT based hash, the most robust against re-encoding and resizing
+
+PIL and imagehash take a good part of a second to import, so they are only
+imported once an image is hashed (or a PerceptualHasher is created, which
+fails early if they are missing). Importing this module stays cheap enough for
+the GUI and the command lines to read IMAGE_EXTENSIONS and HASH_METHODS.
+"""
+
+import os
+
+# Supported image extensions for perceptual hashing
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff'}
+
+# Method -> imagehash function
+HASH_METHODS = {
+    "ahash": "average_hash",
+    "dhash": "dhash",
+    "phash": "phash",
+}
+DEFAULT_METHOD = "ahash"
+DEFAULT_HASH_SIZE = 8  # 8x8 = 64 bit hashes
+
+DECODE_SIZE = 128  # pHash resamples to 32x32, so this leaves ample detail
+
+
+def load_imaging():
+    """(PIL.Image, PIL.UnidentifiedImageError, imagehash), imported on first use"""
+    from PIL import Image, UnidentifiedImageError
+    import imagehash
+    return Image, UnidentifiedImageError, imagehash
+
+
+def load_reduced(img, size=DECODE_SIZE):
+    """Decode img in grayscale at roughly the smallest scale not below size x size"""
+    # Only JPEG (and MPO) decoders support draft mode; for the rest this is a no-op
+    img.draft("L", (size, size))
+    img = img.convert("L")
+    factor = min(img.width // size, img.height // size)
+    if factor > 1:
+        img = img.reduce(factor)
+    return img
+
+
+def perceptual_hash(filepath, method=DEFAULT_METHOD, hash_size=DEFAULT_HASH_SIZE):
+    """Perceptual hash of an image as a hex string, or None if it cannot be decoded"""
+    Image, UnidentifiedImageError, imagehash = load_imaging()
+    try:
+        with Image.open(filepath) as img:
+            return str(getattr(imagehash, HASH_METHODS[method])(load_reduced(img), hash_size=hash_size))
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+
+def average_hash(filepath):
+    """Perceptual (average) hash of an image as a hex string, or None if it cannot be decoded"""
+    return perceptual_hash(filepath, "ahash")
+
+
+class PerceptualHasher:
+    """
+    Image hook for DuplicateEngine.iter_duplicate_groups(): accepts() picks the
+    files to compare by perceptual hash, calling the instance hashes one.
+    Plain attributes only, so it can be sent to worker processes.
+    """
+
+    def __init__(self, extensions=IMAGE_EXTENSIONS, method=DEFAULT_METHOD, hash_size=DEFAULT_HASH_SIZE):
+        if method not in HASH_METHODS:
+            raise ValueError(f"Unknown image hash method: {method} (available: {', '.join(HASH_METHODS)})")
+        load_imaging()  # ImportError here rather than in every worker
+        self.extensions = set(extensions)
+        self.method = method
+        self.hash_size = hash_size
+
+    @property
+    def tag(self):
+        """Identifies how image hashes were made, so cached ones are only reused when comparable"""
+        return f"{self.method}:{self.hash_size}"
+
+    def accepts(self, filepath):
+        return os.path.splitext(filepath)[1].lower() in self.extensions
+
+    def __call__(self, filepath):
+        return perceptual_hash(filepath, self.method, self.hash_size)
@@ -0,0 +1,175 @@
+"""
+Near-duplicate image search for AdvanceFileRemover.py.
+
+Exact perceptual-hash equality misses resized or re-encoded copies, whose
+hashes usually differ in a few bits. Finding every pair within `max_distance`
+bits uses multi-index hashing instead of comparing all pairs: a hash is cut
+into m = max_distance // 2 + 1 chunks, and by the pigeonhole principle two
+hashes that differ in at most max_distance bits differ in at most
+max_distance // m (0 or 1) bits in at least one chunk. Each chunk position
+gets a dict from chunk value to hashes; a query looks up its own chunk values
+and their one-bit variants, and only compares against the hashes found there,
+a tiny fraction of the library for the small radii used here.
+
+Images within the distance of each other are joined with a union-find, so a
+similarity group is a connected cluster: A~B and B~C put A, B and C together
+even if A and C are further apart.
+"""
+
+from functools import partial
+from itertools import combinations
+
+from DuplicateEngine import DuplicateGroup
+from WorkerPool import WorkerPool
+
+DEFAULT_MAX_DISTANCE = 5  # bits out of 64 for an 8x8 hash
+HASH_BITS = 64
+
+
+def hamming(a, b):
+    """Number of differing bits between two integer hashes"""
+    return bin(a ^ b).count("1")
+
+
+class HammingIndex:
+    """
+    Multi-index hash table over integer hashes of `bits` bits, answering
+    "which stored hashes are within max_distance bits of this one".
+    Equal hashes are stored once.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, bits=HASH_BITS):
+        self.max_distance = max_distance
+        chunks = min(max_distance // 2 + 1, bits)
+        self._chunk_radius = max_distance // chunks
+        bounds = [bits * i // chunks for i in range(chunks + 1)]
+        self._chunks = [(low, high - low) for low, high in zip(bounds, bounds[1:])]
+        self._tables = [{} for _ in self._chunks]
+        self._values = set()
+
+    def _keys(self, value):
+        return [(value >> shift) & ((1 << width) - 1) for shift, width in self._chunks]
+
+    def add(self, value):
+        """Insert value; returns False if it was already stored"""
+        if value in self._values:
+            return False
+        self._values.add(value)
+        for table, key in zip(self._tables, self._keys(value)):
+            table.setdefault(key, []).append(value)
+        return True
+
+    def _probes(self, key, width):
+        # The chunk value itself and every variant within the chunk radius
+        yield key
+        for radius in range(1, self._chunk_radius + 1):
+            for bits in combinations(range(width), radius):
+                variant = key
+                for bit in bits:
+                    variant ^= 1 << bit
+                yield variant
+
+    def search(self, value):
+        """All (hash, distance) pairs stored within max_distance of value"""
+        found = []
+        seen = set()
+        for table, key, (_, width) in zip(self._tables, self._keys(value), self._chunks):
+            for probe in self._probes(key, width):
+                for candidate in table.get(probe, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = hamming(value, candidate)
+                    if distance <= self.max_distance:
+                        found.append((candidate, distance))
+        return found
+
+    def __len__(self):
+        return len(self._values)
+
+
+def similarity_groups(hashes, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    Cluster {path: hex hash} into lists of paths whose hashes are connected by
+    steps of at most max_distance bits. Only clusters of two or more images
+    are returned; members keep the order of hashes, and clusters are ordered
+    by their first member.
+    """
+    by_hash = {}
+    for path, image_hash in hashes.items():
+        by_hash.setdefault(int(image_hash, 16), []).append(path)
+
+    parent = {value: value for value in by_hash}
+
+    def find(value):
+        while parent[value] != value:
+            parent[value] = parent[parent[value]]
+            value = parent[value]
+        return value
+
+    if max_distance > 0:
+        # Each hash is compared with the ones inserted before it, so every
+        # close pair is found exactly once
+        bits = max(HASH_BITS, max(value.bit_length() for value in by_hash))
+        index = HammingIndex(max_distance, bits)
+        for value in by_hash:
+            for neighbour, _ in index.search(value):
+                root_a, root_b = find(value), find(neighbour)
+                if root_a != root_b:
+                    parent[root_b] = root_a
+            index.add(value)
+
+    clusters = {}
+    for path, image_hash in hashes.items():
+        clusters.setdefault(find(int(image_hash, 16)), []).append(path)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def _hash_job(image_hasher, path):
+    return image_hasher(path)
+
+
+def find_similar_images(files, image_hasher, max_distance=DEFAULT_MAX_DISTANCE,
+                        cache=None, pool=None, stats=None):
+    """
+    Perceptually hash every image among (path, size) pairs (taking unchanged
+    ones from the cache) and return their similarity groups as DuplicateGroups
+    of kind "similar". members[0] is the first image of the cluster; size and
+    digest are those of that image.
+    """
+    pool = pool or WorkerPool(workers=1)
+    if stats:
+        stats.add_stage("similar")
+
+    size_of = {}
+    hashes = {}
+    todo = []
+    for path, size in files:
+        if not image_hasher.accepts(path):
+            continue
+        size_of[path] = size
+        if stats:
+            stats.enter("similar", size)
+        cached = cache.get(path, "image_hash") if cache else None
+        if cached:
+            if stats:
+                stats.bytes_cached["similar"] += size
+            hashes[path] = cached
+        else:
+            hashes[path] = None  # keeps the input order
+            todo.append(path)
+
+    for path, image_hash, error in pool.map(partial(_hash_job, image_hasher), todo):
+        if stats and not error:
+            stats.bytes_read["similar"] += size_of[path]
+        if image_hash:
+            hashes[path] = image_hash
+            if cache:
+                cache.put(path, "image_hash", image_hash)
+    hashes = {path: image_hash for path, image_hash in hashes.items() if image_hash}
+
+    groups = []
+    for members in similarity_groups(hashes, max_distance):
+        original = members[0]
+        groups.append(DuplicateGroup(size_of[original], hashes[original], members, "similar"))
+    return groups
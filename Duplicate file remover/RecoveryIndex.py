@@ -0,0 +1,270 @@
+"""
+Indexed recovery over the action journals.
+
+Restoring used to mean loading one whole recovery log with json.load() and
+undoing every entry in it, one after the other. RecoveryIndex imports the
+journals of a recovery folder (see ActionJournal) into a small SQLite
+database next to them, indexed by path and time, so a restore can select
+exactly what it needs - "everything under /data/projects moved after T" -
+without parsing the logs again:
+
+    index = RecoveryIndex(RECOVERY_FOLDER)
+    index.sync()
+    entries = index.query(prefix="/data/projects", since=parse_time("2024-06-01 12:00"))
+    index.restore(entries, workers=8, on_progress=print)
+
+sync() is incremental: it remembers how far each journal was read and only
+imports lines appended since, skipping a line still being written. Restores
+run on a pool of worker threads; restored entries are marked, so running the
+same restore again does not try to undo them twice. Permanent deletes are
+journaled too, but left out of queries by default: there is nothing to restore.
+"""
+
+import os
+import time
+import datetime
+from functools import partial
+
+from ActionJournal import JOURNAL_SUFFIX, read_records, read_journal, is_recovery_log
+from FileActions import MOVE_ACTIONS, LINK_ACTIONS, break_link, move_path
+from ScanDatabase import connect, path_range
+from WorkerPool import WorkerPool, DEFAULT_WORKERS
+
+INDEX_FILE = "recovery_index.db"
+
+_BATCH = 10000
+
+_COLUMNS = ("id", "journal", "time", "path", "action", "src", "dst", "original", "trash", "restored")
+
+# Columns added after the first release, created on demand
+_LATER_COLUMNS = {
+    "trash": "INTEGER",
+}
+
+
+def parse_time(text):
+    """Timestamp from "YYYY-MM-DD" or "YYYY-MM-DD HH:MM[:SS]" (local time); None for blank text"""
+    text = text.strip()
+    if not text:
+        return None
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+
+class RecoveryEntry:
+    """One journaled action, as returned by RecoveryIndex.query()"""
+
+    __slots__ = _COLUMNS
+
+    def __init__(self, row):
+        for name, value in zip(_COLUMNS, row):
+            setattr(self, name, value)
+
+    @property
+    def recoverable(self):
+        return self.action in MOVE_ACTIONS or self.action in LINK_ACTIONS
+
+
+def restore_entry(entry, trash=None):
+    """Undo one action; raises OSError if it cannot be undone"""
+    if entry.trash is not None:
+        if trash is None:
+            raise OSError(f"No trash store given to restore {entry.path}")
+        trash.restore(entry.trash, entry.path)
+    elif entry.action in MOVE_ACTIONS:
+        if os.path.lexists(entry.dst):
+            raise FileExistsError(f"{entry.dst} exists again, not overwriting it")
+        parent = os.path.dirname(entry.dst)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        move_path(entry.src, entry.dst)
+    elif entry.action in LINK_ACTIONS:
+        break_link(entry.path)
+    else:
+        raise OSError(f"Cannot recover permanently deleted file: {entry.path}")
+    return entry
+
+
+class RecoveryIndex:
+    """SQLite index of the journals in a recovery folder"""
+
+    def __init__(self, folder, db_file=None):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.conn = connect(db_file or os.path.join(folder, INDEX_FILE))
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS actions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                journal TEXT,
+                time REAL,
+                path TEXT,
+                action TEXT,
+                src TEXT,
+                dst TEXT,
+                original TEXT,
+                restored REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_actions_path ON actions (path);
+            CREATE INDEX IF NOT EXISTS idx_actions_time ON actions (time);
+            CREATE TABLE IF NOT EXISTS journals (
+                name TEXT PRIMARY KEY,
+                offset INTEGER
+            );
+        ''')
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(actions)")}
+        for column, column_type in _LATER_COLUMNS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE actions ADD COLUMN {column} {column_type}")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    # Import
+
+    def sync(self):
+        """Import new journal lines (and legacy .json logs not seen yet); returns the number imported"""
+        offsets = dict(self.conn.execute("SELECT name, offset FROM journals"))
+        imported = 0
+        for name in sorted(os.listdir(self.folder)):
+            if not is_recovery_log(name):
+                continue
+            path = os.path.join(self.folder, name)
+            if name.endswith(JOURNAL_SUFFIX):
+                imported += self._import_journal(name, path, offsets.get(name, 0))
+            elif name not in offsets:
+                imported += self._import_legacy(name, path)
+        return imported
+
+    def _insert(self, name, records):
+        self.conn.executemany(
+            "INSERT INTO actions (journal, time, path, action, src, dst, original, trash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(name, record.get("time"), os.path.abspath(record["path"]), record.get("action"),
+              record.get("from"), record.get("to"), record.get("original"), record.get("trash"))
+             for record in records])
+
+    def _set_offset(self, name, offset):
+        self.conn.execute("INSERT OR REPLACE INTO journals (name, offset) VALUES (?, ?)", (name, offset))
+        self.conn.commit()
+
+    def _import_journal(self, name, path, offset):
+        if os.path.getsize(path) <= offset:
+            return 0
+        imported = 0
+        batch = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for record, end in read_records(f, offset):
+                batch.append(record)
+                offset = end
+                if len(batch) >= _BATCH:
+                    self._insert(name, batch)
+                    self._set_offset(name, offset)
+                    imported += len(batch)
+                    batch = []
+        self._insert(name, batch)
+        self._set_offset(name, offset)
+        return imported + len(batch)
+
+    def _import_legacy(self, name, path):
+        try:
+            recovery_data = read_journal(path)
+        except ValueError:
+            return 0  # not a recovery log
+        stamp = os.path.getmtime(path)
+        self._insert(name, [{"time": stamp, "path": dup, **info} for dup, info in recovery_data.items()])
+        self._set_offset(name, os.path.getsize(path))
+        return len(recovery_data)
+
+    # Queries
+
+    def _where(self, prefix=None, since=None, until=None, journal=None, include_restored=False, permanent=False):
+        clauses, params = [], []
+        if permanent is not None:
+            clauses.append("action IS 'permanent_delete'" if permanent else "action IS NOT 'permanent_delete'")
+        if prefix:
+            prefix = os.path.abspath(prefix)
+            low, high = path_range(prefix)
+            clauses.append("(path = ? OR (path >= ? AND path < ?))")
+            params += [prefix, low, high]
+        if since is not None:
+            clauses.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("time < ?")
+            params.append(until)
+        if journal:
+            clauses.append("journal = ?")
+            params.append(journal)
+        if not include_restored:
+            clauses.append("restored IS NULL")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM actions{where}", params).fetchone()[0]
+
+    def query(self, **filters):
+        """
+        Matching entries in the order they were journaled. Filters: prefix
+        (a path and everything below it), since / until (timestamps), journal
+        (file name), include_restored and permanent (False: no permanent
+        deletes, the default; True: only those; None: everything).
+        Entries are read a batch at a time, so the index can be written while
+        they are consumed.
+        """
+        where, params = self._where(**filters)
+        where = f"{where} AND id > ?" if where else " WHERE id > ?"
+        last = 0
+        while True:
+            rows = self.conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM actions{where} ORDER BY id LIMIT {_BATCH}",
+                                     params + [last]).fetchall()
+            for row in rows:
+                yield RecoveryEntry(row)
+            if len(rows) < _BATCH:
+                return
+            last = rows[-1][0]
+
+    def journals(self):
+        """[(name, entries, restorable and not yet restored, first time, last time)] of every imported journal"""
+        return self.conn.execute('''
+            SELECT journal, COUNT(*), SUM(restored IS NULL AND action IS NOT 'permanent_delete'), MIN(time), MAX(time)
+            FROM actions GROUP BY journal ORDER BY journal
+        ''').fetchall()
+
+    # Restore
+
+    def restore(self, entries, workers=DEFAULT_WORKERS, on_progress=None, trash=None):
+        """
+        Undo entries `workers` at a time and mark the ones that succeeded.
+        trash is the TrashStore that safe deletes were stored in, if any.
+        on_progress(done, entry, error) is called for each entry in order.
+        Returns (restored, failed).
+        """
+        restored, failed = 0, 0
+        done_ids = []
+        with WorkerPool(workers) as pool:
+            for done, (entry, _, error) in enumerate(pool.map(partial(restore_entry, trash=trash), entries), 1):
+                if error:
+                    failed += 1
+                else:
+                    restored += 1
+                    done_ids.append(entry.id)
+                    if len(done_ids) >= _BATCH:
+                        self._mark_restored(done_ids)
+                        done_ids = []
+                if on_progress:
+                    on_progress(done, entry, error)
+        self._mark_restored(done_ids)
+        return restored, failed
+
+    def _mark_restored(self, ids):
+        stamp = time.time()
+        self.conn.executemany("UPDATE actions SET restored = ? WHERE id = ?", [(stamp, i) for i in ids])
+        self.conn.commit()
@@ -0,0 +1,178 @@
+"""
+Virtualized duplicate group list for AdvanceFileRemover.py.
+
+A ttk.Treeview holding one item per file becomes unusable long before a
+million rows: every insert allocates a Tk item, and scrolling, resizing and
+clearing all walk the whole item list. GroupTreeView keeps the rows in a
+Python list instead and lets the Treeview show only the window that is
+visible (a few dozen items), re-filling it when the view scrolls. Adding a
+group is an append to that list; the cost of drawing stays the same however
+many groups there are.
+
+Rows are group headers (collapsed by default) and, for expanded groups,
+their members. Double-click or Enter toggles a group; the scrollbar, the
+mouse wheel and the arrow / page keys move the window.
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+from DuplicateEngine import format_bytes
+
+COLUMNS = (
+    ("path", "Original / Duplicate", 520),
+    ("kind", "Kind", 80),
+    ("files", "Files", 60),
+    ("size", "Size", 90),
+    ("reclaimable", "Reclaimable", 100),
+)
+
+DEFAULT_ROW_HEIGHT = 20
+
+
+class GroupTreeView(ttk.Frame):
+    """Scrollable list of DuplicateGroups that only materialises the visible rows"""
+
+    def __init__(self, master, height=12, **kwargs):
+        super().__init__(master, **kwargs)
+        self.groups = []
+        self._rows = []  # (group index, member index or -1 for the header)
+        self._expanded = set()
+        self._offset = 0
+        self._visible = height
+        self._selected = None  # row index
+
+        self.tree = ttk.Treeview(self, columns=[name for name, _, _ in COLUMNS], show="headings",
+                                 height=height, selectmode="browse")
+        for name, title, width in COLUMNS:
+            self.tree.heading(name, text=title)
+            self.tree.column(name, width=width, stretch=(name == "path"),
+                             anchor="w" if name == "path" else "e")
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<Double-1>", self._on_toggle)
+        self.tree.bind("<Return>", self._on_toggle)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units", 3))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units", 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units", 3))
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-1, "pages"))
+        self.tree.bind("<Next>", lambda e: self.scroll(1, "pages"))
+
+    # Model
+
+    def add_groups(self, groups):
+        """Append groups (called with batches from the UI queue)"""
+        start = len(self.groups)
+        self.groups.extend(groups)
+        self._rows.extend((i, -1) for i in range(start, len(self.groups)))
+        self._refresh()
+
+    def set_groups(self, groups):
+        self.groups = list(groups)
+        self._rows = [(i, -1) for i in range(len(self.groups))]
+        self._expanded.clear()
+        self._offset = 0
+        self._selected = None
+        self._refresh()
+
+    def clear(self):
+        self.set_groups([])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def selected_group(self):
+        if self._selected is None or self._selected >= len(self._rows):
+            return None
+        return self.groups[self._rows[self._selected][0]]
+
+    def toggle(self, row):
+        """Expand or collapse the group of a row"""
+        group_index, member = self._rows[row]
+        header = row - (member + 1 if member >= 0 else 0)
+        members = len(self.groups[group_index])
+        if group_index in self._expanded:
+            self._expanded.discard(group_index)
+            del self._rows[header + 1:header + 1 + members]
+        else:
+            self._expanded.add(group_index)
+            self._rows[header + 1:header + 1] = [(group_index, m) for m in range(members)]
+        self._selected = header
+        self._refresh()
+
+    # View
+
+    def scroll(self, amount, what="units", step=1):
+        if what == "pages":
+            step = max(1, self._visible - 1)
+        self._offset += amount * step
+        self._refresh()
+        return "break"
+
+    def _values(self, row):
+        group_index, member = self._rows[row]
+        group = self.groups[group_index]
+        if member < 0:
+            mark = "▾" if group_index in self._expanded else "▸"
+            return (f"{mark} {group.original}", group.kind, len(group), format_bytes(group.size),
+                    format_bytes(group.wasted_bytes()))
+        path = group.members[member]
+        return (f"      {'★' if member == 0 else '↪'} {path}", "", "", "", "")
+
+    def _refresh(self):
+        self._offset = max(0, min(self._offset, len(self._rows) - self._visible))
+        end = min(len(self._rows), self._offset + self._visible)
+        self.tree.delete(*self.tree.get_children())
+        for row in range(self._offset, end):
+            self.tree.insert("", tk.END, iid=str(row), values=self._values(row))
+        if self._selected is not None and self._offset <= self._selected < end:
+            self.tree.selection_set(str(self._selected))
+        if self._rows:
+            self.scrollbar.set(self._offset / len(self._rows), end / len(self._rows))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _on_scrollbar(self, command, value, what=None):
+        if command == "moveto":
+            self._offset = int(float(value) * len(self._rows))
+            self._refresh()
+        else:
+            self.scroll(int(value), what)
+
+    def _on_resize(self, event):
+        row_height = int(ttk.Style(self).lookup("Treeview", "rowheight") or DEFAULT_ROW_HEIGHT)
+        visible = max(1, event.height // row_height - 1)  # minus the heading
+        if visible != self._visible:
+            self._visible = visible
+            self._refresh()
+
+    def _on_select(self, event):
+        selection = self.tree.selection()
+        if selection:
+            self._selected = int(selection[0])
+
+    def _on_toggle(self, event):
+        item = self.tree.identify_row(event.y) if event.type == tk.EventType.ButtonPress else self.tree.focus()
+        if item:
+            self.toggle(int(item))
+        return "break"
+
+    def _move_selection(self, step):
+        if not self._rows:
+            return "break"
+        row = self._offset if self._selected is None else self._selected + step
+        self._selected = max(0, min(row, len(self._rows) - 1))
+        # Keep the selected row in the window
+        if self._selected < self._offset:
+            self._offset = self._selected
+        elif self._selected >= self._offset + self._visible:
+            self._offset = self._selected - self._visible + 1
+        self._refresh()
+        self.tree.focus(str(self._selected))
+        return "break"
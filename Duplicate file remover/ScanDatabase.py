@@ -0,0 +1,521 @@
+"""
+SQLite storage for scan results and the persistent hash cache.
+
+Both FileRemover.py and AdvanceFileRemover.py keep their scan results in the
+`scanned_files` table. Every row remembers the signature of the file it was
+hashed from (size, mtime_ns and inode), so a rescan can reuse the stored
+digests of files that did not change instead of reading them again.
+
+DirectorySummaries remembers, per directory, its mtime, its (filtered)
+entries and a digest of them. A directory whose mtime did not change since it
+was listed has not gained, lost or renamed entries, so its files can be taken
+from `scanned_files` without listing or stat-ing them again.
+
+Writes during a scan go through ScanWriter, a background thread that batches
+rows with executemany() into large transactions on a WAL-mode database, so
+recording a file no longer costs an fsync.
+
+Cache modes:
+- "use"    - reuse stored digests when the signature still matches (default)
+- "verify" - hash everything again and report files whose content changed
+             although their signature did not
+"""
+
+import os
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
+
+from HashEngine import DEFAULT_HASHER
+
+DB_FILE = "duplicate_remover.db"
+
+CACHE_USE = "use"
+CACHE_VERIFY = "verify"
+CACHE_MODES = (CACHE_USE, CACHE_VERIFY)
+
+# Columns added after the first release, created on demand by ensure_schema()
+_CACHE_COLUMNS = {
+    "mtime_ns": "INTEGER",
+    "inode": "INTEGER",
+    "partial_hash": "BLOB",
+    "image_hash": "TEXT",
+    "hash_algo": "TEXT",
+    "partial_algo": "TEXT",
+    "image_algo": "TEXT",
+    "device": "INTEGER",
+    "nlink": "INTEGER",
+    "directory": "TEXT",
+}
+
+_ALGO_COLUMNS = {"partial_hash": "partial_algo", "file_hash": "hash_algo", "image_hash": "image_algo"}
+
+# HashCache compares walked files with their stored rows this many at a time
+# (below SQLite's default limit of bound parameters) and writes rows in batches
+_LOOKUP_BATCH = 500
+_ROW_BATCH = 10000
+
+# The signature row of a new or changed file; stored digests are kept only
+# while size, mtime_ns and inode stay the same
+_SIGNATURE_SQL = '''
+    INSERT INTO scanned_files (file_path, file_size, mtime, mtime_ns, inode, device, nlink, directory)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(file_path) DO UPDATE SET
+        partial_hash = CASE WHEN {unchanged} THEN scanned_files.partial_hash END,
+        file_hash = CASE WHEN {unchanged} THEN scanned_files.file_hash END,
+        image_hash = CASE WHEN {unchanged} THEN scanned_files.image_hash END,
+        file_size = excluded.file_size,
+        mtime = excluded.mtime,
+        mtime_ns = excluded.mtime_ns,
+        inode = excluded.inode,
+        device = excluded.device,
+        nlink = excluded.nlink,
+        directory = excluded.directory
+'''.format(unchanged="(scanned_files.file_size IS excluded.file_size AND scanned_files.mtime_ns IS "
+                     "excluded.mtime_ns AND scanned_files.inode IS excluded.inode)")
+
+# A directory modified within this long before it was listed may change again
+# without its mtime changing (coarse timestamps), so its listing is not reused
+RACY_NS = 2 * 10**9
+
+_INDEXES = {
+    "idx_scanned_files_hash": "file_hash",
+    "idx_scanned_files_size": "file_size",
+    "idx_scanned_files_directory": "directory",
+}
+
+
+def connect(db_file=DB_FILE, timeout=30, check_same_thread=True):
+    """Open the database in WAL mode, so readers never block the scan writer"""
+    conn = sqlite3.connect(db_file, timeout=timeout, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def ensure_schema(conn):
+    """Create the scanned_files table, or upgrade one written by an older version"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scanned_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT UNIQUE,
+            file_hash TEXT,
+            file_size INTEGER,
+            mtime REAL,
+            is_duplicate INTEGER,
+            original_file TEXT,
+            scan_time TEXT
+        )
+    ''')
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(scanned_files)")}
+    for column, column_type in _CACHE_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE scanned_files ADD COLUMN {column} {column_type}")
+    for index, column in _INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index} ON scanned_files ({column})")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scanned_dirs (
+            dir_path TEXT PRIMARY KEY,
+            mtime_ns INTEGER,
+            entry_count INTEGER,
+            subdirs TEXT,
+            digest BLOB,
+            filter_key TEXT,
+            listed_ns INTEGER
+        )
+    ''')
+    conn.commit()
+
+
+def path_range(folder):
+    """
+    Lower and upper bound of all paths below folder, so that a prefix query
+    can use the UNIQUE index on file_path instead of a LIKE scan.
+    """
+    prefix = os.path.join(os.path.abspath(folder), "")
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def file_signature(stat):
+    """What has to stay the same for a stored digest to be trusted"""
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+class HashCache:
+    """
+    Digests of previously scanned files, keyed on path + size + mtime_ns + inode.
+
+    add() (or track()) every file the walk yields, then let the hashing stages
+    ask for and store digests. Nothing is kept per walked file: walked files
+    are compared with their stored rows a batch at a time, and the rows of
+    new or changed ones are written back in batches (with the digests of
+    changed ones cleared). get() looks a digest up in the database, so only
+    files that reach hashing cost a query. New digests are held until
+    flush(), or until _ROW_BATCH files have some, and the paths of changed
+    files for the whole session.
+    """
+
+    def __init__(self, db_file=DB_FILE, mode=CACHE_USE, hasher=None, writer=None, image_hasher=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        hasher = hasher or DEFAULT_HASHER
+        self.db_file = db_file
+        self.mode = mode
+        self.algorithms = {
+            "file_hash": hasher.algorithm,
+            "partial_hash": hasher.partial_tag,
+            "image_hash": image_hasher.tag if image_hasher else None,
+        }
+        # Watch mode builds the cache on one thread and flushes it from scheduler jobs
+        self.conn = connect(db_file, check_same_thread=False)
+        ensure_schema(self.conn)
+        self.writer = writer  # optional ScanWriter that rows are handed to
+        self.hits = 0
+        self.lookups = 0
+        self.mismatches = []  # paths whose digest changed behind an unchanged signature
+        self._walked = []  # (path, stat) not yet compared with the stored rows
+        self._rows = []  # signature rows of new or changed files, written every _ROW_BATCH
+        self._stale = set()  # paths whose stored signature no longer matches: stored digests are void
+        self._fresh = {}  # path -> {field: digest} hashed in this session, not yet written
+
+    def add(self, path, stat):
+        """Register a walked file; stored digests survive only if its signature matches"""
+        self._walked.append((os.path.abspath(path), stat))
+        if len(self._walked) >= _LOOKUP_BATCH:
+            self._compare()
+
+    def track(self, entries):
+        """add() every walked (path, stat) pair while passing it through"""
+        for path, stat in entries:
+            self.add(path, stat)
+            yield path, stat
+
+    def _compare(self):
+        walked, self._walked = self._walked, []
+        if not walked:
+            return
+        paths = [path for path, _ in walked]
+        stored = {path: row for path, *row in self.conn.execute(f'''
+            SELECT file_path, file_size, mtime_ns, inode, nlink IS NOT NULL AND directory IS NOT NULL
+            FROM scanned_files WHERE file_path IN ({", ".join("?" * len(paths))})
+        ''', paths)}
+        for path, stat in walked:
+            row = stored.get(path)
+            signature = file_signature(stat)
+            if row and tuple(row[:3]) == signature and row[3]:
+                continue
+            if row and tuple(row[:3]) != signature:
+                self._stale.add(path)
+                self._fresh.pop(path, None)
+            # New, changed, or written by an older version (no nlink or directory): DirectorySummaries
+            # needs it complete
+            self._rows.append((path, stat.st_size, stat.st_mtime, stat.st_mtime_ns, stat.st_ino, stat.st_dev,
+                               stat.st_nlink, os.path.dirname(path)))
+        if len(self._rows) >= _ROW_BATCH:
+            self._write_rows()
+
+    def _write_rows(self):
+        rows, self._rows = self._rows, []
+        self._write(_SIGNATURE_SQL, rows)
+
+    def _write(self, sql, rows):
+        if not rows:
+            return
+        if self.writer:
+            self.writer.write_many(sql, rows)
+        else:
+            self.conn.executemany(sql, rows)
+            self.conn.commit()
+
+    def _stored(self, path, field):
+        """The stored digest of an unchanged file, made with our algorithm, or None"""
+        if path in self._stale:
+            return None
+        row = self.conn.execute(
+            f"SELECT {field}, {_ALGO_COLUMNS[field]} FROM scanned_files WHERE file_path = ?", (path,)).fetchone()
+        # Digests made with another algorithm cannot be compared with ours
+        if row is None or row[1] != self.algorithms[field]:
+            return None
+        return row[0]
+
+    def get(self, path, field):
+        """Cached digest ("partial_hash", "file_hash" or "image_hash"), or None"""
+        self._compare()
+        path = os.path.abspath(path)
+        digest = self._fresh.get(path, {}).get(field)
+        if digest is None and self.mode == CACHE_USE:
+            digest = self._stored(path, field)
+        self.lookups += 1
+        if digest is not None:
+            self.hits += 1
+        return digest
+
+    def has(self, path, field):
+        """Like get() != None, without counting a hit"""
+        self._compare()
+        path = os.path.abspath(path)
+        if self._fresh.get(path, {}).get(field) is not None:
+            return True
+        return self.mode == CACHE_USE and self._stored(path, field) is not None
+
+    def put(self, path, field, digest):
+        """Store the digest of a walked file"""
+        self._compare()
+        path = os.path.abspath(path)
+        fresh = self._fresh.setdefault(path, {})
+        if fresh.get(field) == digest:
+            return
+        if self.mode == CACHE_VERIFY and field not in fresh:
+            previous = self._stored(path, field)
+            if previous is not None and previous != digest:
+                self.mismatches.append(path)
+        fresh[field] = digest
+        if len(self._fresh) >= _ROW_BATCH:
+            self._write_digests()
+
+    def flush(self):
+        """Write new signatures and digests back to the database (or to the writer)"""
+        self._compare()
+        self._write_digests()
+        if not self.writer:
+            # The rows of changed files are committed, their old digests gone
+            self._stale.clear()
+
+    def _write_digests(self):
+        self._write_rows()  # first, so that every digest has a row to go to
+        fresh, self._fresh = self._fresh, {}
+        for field, algo_column in _ALGO_COLUMNS.items():
+            self._write(f"UPDATE scanned_files SET {field} = ?, {algo_column} = ? WHERE file_path = ?",
+                        [(digests[field], self.algorithms[field], path)
+                         for path, digests in fresh.items() if field in digests])
+
+    def invalidate(self, folder=None):
+        """Forget the stored digests below folder (or all of them)"""
+        if folder is None:
+            where, params = "", ()
+        else:
+            where, params = "WHERE file_path >= ? AND file_path < ?", path_range(folder)
+        self.conn.execute(f'''
+            UPDATE scanned_files
+            SET partial_hash = NULL, file_hash = NULL, image_hash = NULL, mtime_ns = NULL, inode = NULL
+            {where}
+        ''', params)
+        self.conn.execute(f"DELETE FROM scanned_dirs {where.replace('file_path', 'dir_path')}", params)
+        self.conn.commit()
+        self._fresh.clear()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class StoredStat:
+    """The parts of an os.stat_result that a scan uses, rebuilt from a scanned_files row"""
+
+    __slots__ = ("st_size", "st_mtime", "st_mtime_ns", "st_ino", "st_dev", "st_nlink")
+
+    def __init__(self, size, mtime, mtime_ns, inode, device, nlink):
+        self.st_size = size
+        self.st_mtime = mtime
+        self.st_mtime_ns = mtime_ns
+        self.st_ino = inode
+        self.st_dev = device
+        self.st_nlink = nlink
+
+
+def listing_digest(files, subdirs):
+    """Digest of a directory's filtered entries: file names and signatures, subdirectory names"""
+    digest = hashlib.sha1()
+    for path, stat in files:
+        digest.update(f"{os.path.basename(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0{stat.st_ino}\n".encode(
+            "utf-8", "surrogateescape"))
+    for path in subdirs:
+        digest.update(f"{os.path.basename(path)}/\n".encode("utf-8", "surrogateescape"))
+    return digest.digest()
+
+
+class DirectorySummaries:
+    """
+    Per-directory summaries for FileWalker.walk_files(summaries=...).
+
+    reuse() answers a directory from the previous scan when its mtime is
+    unchanged, the previous listing used the same filter and the stored file
+    rows still match the listing's digest; record() stores a fresh listing.
+    Only safe where files are not modified in place without being renamed (an
+    in-place write does not touch the directory's mtime): archives, photo
+    libraries, backups. Files are taken from the rows HashCache wrote, so use
+    it together with a HashCache on the same database. Summaries and rows are
+    looked up per directory as the walk reaches it; nothing is loaded up front.
+    """
+
+    def __init__(self, db_file=DB_FILE, filter_key="", writer=None):
+        self.db_file = db_file
+        self.filter_key = filter_key
+        self.conn = connect(db_file, check_same_thread=False)
+        ensure_schema(self.conn)
+        self.writer = writer
+        self.reused_dirs = 0
+        self.reused_files = 0
+        self.listed_dirs = 0
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def reuse(self, directory, dir_stat):
+        """(files, subdirs) as list_directory() would return them, or None if it has to be listed"""
+        # Walker threads share the connection
+        with self._lock:
+            summary = self.conn.execute('''
+                SELECT mtime_ns, entry_count, subdirs, digest, filter_key, listed_ns
+                FROM scanned_dirs WHERE dir_path = ?
+            ''', (directory,)).fetchone()
+            if summary is None:
+                return None
+            mtime_ns, entry_count, names, digest, filter_key, listed_ns = summary
+            if (mtime_ns != dir_stat.st_mtime_ns or filter_key != self.filter_key or digest is None
+                    or listed_ns - mtime_ns < RACY_NS):
+                return None
+            rows = self.conn.execute('''
+                SELECT file_path, file_size, mtime, mtime_ns, inode, device, nlink
+                FROM scanned_files WHERE directory = ? AND nlink IS NOT NULL
+            ''', (directory,)).fetchall()
+        files = sorted(((path, StoredStat(*stat)) for path, *stat in rows),
+                       key=lambda item: os.path.basename(item[0]))
+        names = names.split("\0") if names else []
+        if len(files) + len(names) != entry_count:
+            return None  # rows missing, e.g. written without a cache
+        subdirs = [os.path.join(directory, name) for name in names]
+        if listing_digest(files, subdirs) != digest:
+            return None  # rows rewritten since the listing, e.g. by a scan with another filter
+        with self._lock:
+            self.reused_dirs += 1
+            self.reused_files += len(files)
+        return files, subdirs
+
+    def record(self, directory, dir_stat, files, subdirs):
+        row = (directory, dir_stat.st_mtime_ns, len(files) + len(subdirs),
+               "\0".join(os.path.basename(path) for path in subdirs),
+               listing_digest(files, subdirs), self.filter_key, time.time_ns())
+        with self._lock:
+            self.listed_dirs += 1
+            self._rows.append(row)
+
+    def flush(self):
+        sql = '''
+            INSERT INTO scanned_dirs (dir_path, mtime_ns, entry_count, subdirs, digest, filter_key, listed_ns)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(dir_path) DO UPDATE SET
+                mtime_ns = excluded.mtime_ns,
+                entry_count = excluded.entry_count,
+                subdirs = excluded.subdirs,
+                digest = excluded.digest,
+                filter_key = excluded.filter_key,
+                listed_ns = excluded.listed_ns
+        '''
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if self.writer:
+            self.writer.write_many(sql, rows)
+        else:
+            self.conn.executemany(sql, rows)
+            self.conn.commit()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class ScanWriter:
+    """
+    Background thread owning its own connection. Rows handed to write() are
+    queued (at most `max_queued`, so a slow disk applies back-pressure instead
+    of growing memory) and written with executemany() in transactions of up to
+    `batch_size` rows, or whatever arrived within `flush_interval` seconds.
+    """
+
+    def __init__(self, db_file=DB_FILE, batch_size=10000, flush_interval=1.0, max_queued=100000):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ScanWriter", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self.error:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, sql, params):
+        self._queue.put((sql, params))
+
+    def queue_depth(self):
+        """Rows waiting to be written"""
+        return self._queue.qsize()
+
+    def write_many(self, sql, rows):
+        for params in rows:
+            self._queue.put((sql, params))
+
+    def close(self):
+        """Write everything still queued, then stop the thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self.error:
+            raise self.error
+
+    def _run(self):
+        try:
+            conn = connect(self.db_file)
+            ensure_schema(conn)
+        except sqlite3.Error as e:
+            self.error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = False
+            if item is None:
+                stopping = True
+            elif item:
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            if batch and not self.error:
+                try:
+                    self._commit(conn, batch)
+                except sqlite3.Error as e:
+                    # Keep draining the queue so producers never block; close() re-raises
+                    self.error = e
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+        conn.close()
+
+    def _commit(self, conn, batch):
+        # Consecutive rows for the same statement go into one executemany()
+        with conn:
+            start = 0
+            while start < len(batch):
+                sql = batch[start][0]
+                end = start
+                while end < len(batch) and batch[end][0] == sql:
+                    end += 1
+                conn.executemany(sql, [params for _, params in batch[start:end]])
+                start = end
+        self.rows_written += len(batch)
@@ -0,0 +1,590 @@
+"""
+Headless scan / action engine behind AdvanceFileRemover.py and BatchRemover.py.
+
+Everything the GUI does besides drawing lives here: file filters, staged and
+perceptual hashing, near-duplicate images, identical folders, recording scan
+results in SQLite, watch mode, the journaled actions and recovery. Nothing in
+this module imports Tkinter, so the same feature set runs on a server
+without a display:
+
+    engine = ScanEngine(ScanSettings(include="*.jpg;*.png", workers=16))
+    report = engine.scan("/data/photos", on_group=print)
+    engine.run_action("move", report.duplicates)
+    engine.export_manifest("/data/photos", "photos.dfm")  # see ScanManifest
+
+Settings are plain values (ScanSettings); the GUI fills them from its Tk
+variables. Progress is reported through callbacks - log(message, level) for
+log lines, on_group(group) for each DuplicateGroup as soon as it is
+confirmed, on_status(line) for the live metrics line - which are called from
+the thread running the engine; a GUI has to hand them over to its own thread.
+Failures are raised to the caller.
+"""
+
+import os
+import socket
+import datetime
+
+from DuplicateEngine import StageStats, DuplicatePairs, IDENTICAL_KINDS, iter_duplicate_groups, format_bytes
+from FileIndex import FileIndex
+from DiskGrouping import DiskGrouper
+from ScanDatabase import DB_FILE, HashCache, DirectorySummaries, ScanWriter, CACHE_USE, CACHE_VERIFY, \
+    connect, ensure_schema
+from WorkerPool import WorkerPool, DEFAULT_WORKERS, default_io_depth
+from HashEngine import FileHasher, DEFAULT_ALGORITHM
+from FileWalker import FileFilter, DEFAULT_EXCLUDE_DIRS, DEFAULT_FANOUT, parse_patterns, walk_files, collapse_hardlinks
+from FileActions import LINK_ACTIONS, run_actions
+from ActionJournal import ActionJournal, JOURNAL_SUFFIX
+from RecoveryIndex import RecoveryIndex
+from TrashStore import TrashStore, MANIFEST_FILE
+from DirectoryHashing import find_duplicate_directories, without_directories
+from DuplicateIndex import DuplicateIndex
+from FolderWatcher import create_watcher
+from ScanMetrics import ScanMetrics, MetricsReporter, DEFAULT_REPORT_INTERVAL
+from ScanManifest import build_manifest
+from ImageHashing import PerceptualHasher, DEFAULT_METHOD
+from ImageIndex import find_similar_images
+
+DUPLICATE_FOLDER = "duplicates"
+TRASH_FOLDER = "trash_bin"
+RECOVERY_FOLDER = "recovery_data"
+
+# Digests are written by the cache; rows here only record the scan outcome
+_RECORD_SQL = '''
+    INSERT INTO scanned_files
+    (file_path, file_size, mtime, is_duplicate, original_file, scan_time)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(file_path) DO UPDATE SET
+        file_size = excluded.file_size,
+        mtime = excluded.mtime,
+        is_duplicate = excluded.is_duplicate,
+        original_file = excluded.original_file,
+        scan_time = excluded.scan_time
+'''
+
+
+class ScanSettings:
+    """
+    What to scan and how. Patterns are ";"-separated globs (or re:regexes),
+    sizes are in bytes (max_size None = no limit). images turns perceptual
+    hashing of images on (needs PIL and imagehash; without them images are
+    compared by content, unless image_hash_method or similarity_distance
+    asks for them); similarity_distance > 0 additionally lists near-duplicate
+    images. With a memory_budget, files are grouped in a scratch database
+    next to db_file instead of in memory; the groups found (and their pairs)
+    are still kept in memory for the report and the actions, so memory then
+    grows with the number of duplicates.
+    """
+
+    def __init__(self, include="*", exclude="", exclude_dirs=";".join(DEFAULT_EXCLUDE_DIRS),
+                 min_size=0, max_size=None, verify_cache=False, workers=DEFAULT_WORKERS, io_depth=None,
+                 hash_algorithm=DEFAULT_ALGORITHM, walk_threads=DEFAULT_FANOUT, images=True,
+                 image_hash_method=None, similarity_distance=0, detect_dirs=False, skip_unchanged_dirs=False,
+                 versioning=True, db_file=DB_FILE, memory_budget=None):
+        self.include = include
+        self.exclude = exclude
+        self.exclude_dirs = exclude_dirs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.verify_cache = verify_cache
+        self.workers = workers
+        self.io_depth = io_depth or default_io_depth(workers)
+        self.hash_algorithm = hash_algorithm
+        self.walk_threads = walk_threads
+        self.images = images
+        self.image_hash_method = image_hash_method  # None = ImageHashing.DEFAULT_METHOD
+        self.similarity_distance = similarity_distance
+        self.detect_dirs = detect_dirs
+        self.skip_unchanged_dirs = skip_unchanged_dirs
+        self.versioning = versioning
+        self.db_file = db_file
+        self.memory_budget = memory_budget  # bytes; groups files on disk (DiskGrouping) instead of in memory
+
+    def file_filter(self):
+        # Name filters and pruned folders are checked before any stat call
+        return FileFilter(
+            include=parse_patterns(self.include),
+            exclude=parse_patterns(self.exclude),
+            exclude_dirs=parse_patterns(self.exclude_dirs),
+            min_size=self.min_size,
+            max_size=self.max_size,
+        )
+
+    def image_hasher(self):
+        """A PerceptualHasher, or None with images off; raises ImportError without PIL / imagehash"""
+        if not self.images:
+            return None
+        return PerceptualHasher(method=self.image_hash_method or DEFAULT_METHOD)
+
+
+class ScanReport:
+    """Outcome of ScanEngine.scan()"""
+
+    def __init__(self, folder, groups, duplicates, files, stats, metrics):
+        self.folder = folder
+        self.groups = groups  # DuplicateGroups; "similar" ones are listed for review only
+        self.duplicates = duplicates  # DuplicatePairs: (duplicate, original) pairs the actions apply to
+        self.files = files  # files scanned
+        self.stats = stats
+        self.metrics = metrics
+
+    def as_dict(self):
+        kinds = {}
+        for group in self.groups:
+            kinds[group.kind] = kinds.get(group.kind, 0) + 1
+        return {
+            "folder": self.folder,
+            "files": self.files,
+            "groups": len(self.groups),
+            "groups_by_kind": kinds,
+            "duplicates": len(self.duplicates),
+            "wasted_bytes": sum(group.wasted_bytes() for group in self.groups if group.kind != "similar"),
+            "bytes_read": self.stats.total_read(),
+            "bytes_skipped": self.stats.total_skipped(),
+            "elapsed_seconds": self.metrics.snapshot()["elapsed_seconds"],
+        }
+
+
+class ManifestReport:
+    """Outcome of ScanEngine.export_manifest()"""
+
+    def __init__(self, manifest_file, volume, folder, files, stats, metrics):
+        self.manifest_file = manifest_file
+        self.volume = volume
+        self.folder = folder
+        self.files = files  # files in the manifest
+        self.stats = stats
+        self.metrics = metrics
+
+    def as_dict(self):
+        return {
+            "manifest": self.manifest_file,
+            "volume": self.volume,
+            "folder": self.folder,
+            "files": self.files,
+            "bytes_read": self.stats.total_read(),
+            "bytes_cached": self.stats.total_cached(),
+            "elapsed_seconds": self.metrics.snapshot()["elapsed_seconds"],
+        }
+
+
+class ActionReport:
+    """Outcome of ScanEngine.run_action()"""
+
+    def __init__(self, action, handled, failed, recovery_file):
+        self.action = action
+        self.handled = handled
+        self.failed = failed
+        self.recovery_file = recovery_file
+
+    def as_dict(self):
+        return {"action": self.action, "handled": self.handled, "failed": self.failed,
+                "recovery_file": self.recovery_file}
+
+
+def group_record(group):
+    """A DuplicateGroup as a JSON-ready dict"""
+    digest = group.digest.hex() if isinstance(group.digest, bytes) else str(group.digest)
+    return {
+        "kind": group.kind,
+        "size": group.size,
+        "digest": digest,
+        "original": group.original,
+        "duplicates": group.duplicates,
+        "wasted_bytes": group.wasted_bytes() if group.kind != "similar" else 0,
+    }
+
+
+def extension_counts(duplicates):
+    """{extension: count} of (duplicate, original) pairs, for the type chart"""
+    counts = {}
+    for dup_path, _ in duplicates:
+        ext = os.path.splitext(dup_path)[1].lower()
+        counts[ext] = counts.get(ext, 0) + 1
+    return counts
+
+
+def _ignore(*args):
+    pass
+
+
+class ScanEngine:
+    """Scans, watches and acts on duplicates with one ScanSettings; see the module docstring"""
+
+    def __init__(self, settings=None, log=None):
+        self.settings = settings or ScanSettings()
+        self.log = log or _ignore
+        conn = connect(self.settings.db_file)
+        try:
+            ensure_schema(conn)
+        finally:
+            conn.close()
+
+    def log_access_error(self, path, error):
+        self.log(f"[Error] Cannot access {path}: {str(error)}", 'error')
+
+    # Scanning
+
+    def scan(self, folder, on_group=None, on_status=None, status_interval=DEFAULT_REPORT_INTERVAL,
+             metrics_file=None):
+        """
+        Scan folder and return a ScanReport. on_group(group) receives every
+        group as soon as it is confirmed (with detect_dirs, once the whole
+        scan is done, since a folder's hash needs all its files).
+        """
+        settings = self.settings
+        on_group = on_group or _ignore
+        file_filter = settings.file_filter()
+        duplicates = DuplicatePairs()
+        groups_found = []
+
+        # Results are recorded by a background writer in batched transactions;
+        # the same database holds the hash cache
+        if settings.memory_budget and settings.detect_dirs:
+            raise ValueError("Identical folders can only be detected with every file in memory; "
+                             "turn off either folder detection or the memory budget.")
+        folder = os.path.abspath(folder)
+        hasher = FileHasher(settings.hash_algorithm)
+        try:
+            image_hasher = settings.image_hasher()
+        except ImportError as e:
+            if settings.image_hash_method or settings.similarity_distance:
+                raise  # asked for by name, so not silently dropped
+            # Perceptual hashing is an extra: without PIL / imagehash images are compared like any file
+            self.log(f"⚠️ {e.name} is not installed, images are compared by content only.", 'warn')
+            image_hasher = None
+        cache_mode = CACHE_VERIFY if settings.verify_cache else CACHE_USE
+        writer = ScanWriter(settings.db_file)
+        cache = grouper = None
+        if settings.memory_budget:
+            # Out of core: files are grouped in a scratch database next to the scan
+            # database, which supplies and receives the cached digests (see DiskGrouping)
+            grouper = DiskGrouper(settings.memory_budget, settings.db_file, hasher, image_hasher, cache_mode,
+                                  os.path.dirname(os.path.abspath(settings.db_file)))
+        else:
+            cache = HashCache(settings.db_file, cache_mode, hasher, writer, image_hasher)
+        cached = grouper if cache is None else cache  # whichever reuses stored digests
+        summaries = None
+        if settings.skip_unchanged_dirs and not settings.verify_cache and not settings.memory_budget:
+            summaries = DirectorySummaries(settings.db_file, file_filter.key, writer)
+
+        scan_start_time = datetime.datetime.now().isoformat()
+
+        # Files stream from the walk into the hashing stages; nothing is read
+        # until two files share a size
+        index = grouper if grouper is not None else FileIndex()  # every walked file by row: path, size, mtime
+        hardlinks = {}  # extra names of already walked inodes -> first name
+
+        # File hash calculation, staged: size -> partial hash -> full hash.
+        # Images are compared by size + perceptual hash (more tolerant).
+        stats = StageStats()
+        metrics = ScanMetrics(stats, cached, writer)
+
+        def walked():
+            entries = walk_files(folder, file_filter, self.log_access_error, settings.walk_threads, summaries)
+            if cache:
+                # Every name is recorded, hard links included, so stored folder listings stay complete
+                entries = cache.track(entries)
+            for full_path, stat in collapse_hardlinks(entries, hardlinks):
+                metrics.walked(stat.st_size)
+                yield full_path, stat
+            metrics.walk_finished()
+
+        unreadable = set()
+
+        def on_hash_error(path, e):
+            unreadable.add(path)
+            self.log(f"[Error] Cannot hash file {path}: {str(e)}", 'error')
+
+        original_of = {}  # duplicate path -> original path
+
+        def record(group):
+            groups_found.append(group)
+            duplicates.add(group)
+            for dup in group.duplicates:
+                original_of[dup] = group.original
+
+        try:
+            # Decoding holds the GIL, so images are hashed in worker processes.
+            # Groups are reported and recorded as soon as they are confirmed.
+            with WorkerPool(settings.workers, settings.io_depth) as hash_pool, \
+                    WorkerPool(settings.workers, settings.io_depth, processes=True) as image_pool, \
+                    MetricsReporter(metrics, on_status or _ignore, status_interval if on_status else 0):
+                metrics.watch_queue("hash", lambda: hash_pool.in_flight)
+                metrics.watch_queue("image", lambda: image_pool.in_flight)
+                if grouper is not None:
+                    groups = grouper.groups(walked(), stats, on_hash_error, hash_pool, image_pool)
+                else:
+                    files = ((path, stat.st_size, stat.st_mtime) for path, stat in walked())
+                    groups = iter_duplicate_groups(files, stats, on_hash_error, cache, hash_pool, hasher,
+                                                   image_hasher, image_pool, index=index)
+                if not settings.detect_dirs:
+                    for group in groups:
+                        record(group)
+                        on_group(group)
+                else:
+                    # Identical folders become one item each; their files drop out of the file groups
+                    for group in groups:
+                        record(group)
+                    directories = find_duplicate_directories(folder, list(index.items()), groups_found, hardlinks,
+                                                             hasher)
+                    if directories:
+                        groups_found[:] = directories + without_directories(groups_found, directories)
+                        duplicates = DuplicatePairs(groups_found)
+                        self.log(f"📂 {len(directories)} duplicate folders; the remaining file groups "
+                                 f"no longer list their contents.")
+                    for group in groups_found:
+                        on_group(group)
+
+                # Near-duplicates: every remaining image, whatever its size, clustered
+                # by Hamming distance. Listed for review, not part of the bulk actions.
+                if image_hasher and settings.similarity_distance > 0:
+                    remaining = ((path, size) for path, size in index.items()
+                                 if path not in unreadable and path not in original_of)
+                    similar = find_similar_images(remaining, image_hasher, settings.similarity_distance, cache,
+                                                  image_pool, stats)
+                    for group in similar:
+                        groups_found.append(group)
+                        on_group(group)
+                    if similar:
+                        self.log(f"🖼️ {len(similar)} groups of similar images listed for review; "
+                                 f"they are not moved or deleted by the actions.")
+
+            # Log every file in the db: duplicates with their original, the rest is unique
+            # or the original of its group
+            for entry in index:
+                if entry.path in unreadable:
+                    continue
+                original = original_of.get(entry.path)
+                writer.write(_RECORD_SQL, (entry.path, entry.size, entry.mtime, int(original is not None), original,
+                                           scan_start_time))
+        finally:
+            if cache:
+                cache.close()
+            if summaries:
+                summaries.close()
+            writer.close()
+            if grouper is not None:
+                # After the writer, so the two never wait for each other's transactions
+                grouper.close()
+            metrics.finish()
+
+        if metrics_file:
+            try:
+                metrics.write_report(metrics_file)
+            except OSError as e:
+                self.log(f"[Error] Cannot write metrics report {metrics_file}: {e}", 'error')
+        if summaries:
+            self.log(f"📁 {summaries.reused_dirs} unchanged folders ({summaries.reused_files} files) reused, "
+                     f"{summaries.listed_dirs} folders listed.")
+        if hardlinks:
+            self.log(f"🔗 {len(hardlinks)} hard links to already scanned files were not hashed.")
+        if cached.hits:
+            self.log(f"Hash cache: {cached.hits} stored hashes of unchanged files reused.")
+        for path in cached.mismatches:
+            self.log(f"[Warning] Content changed but size/mtime/inode did not: {path}", 'warn')
+
+        self.log(f"Read {format_bytes(stats.total_read())}, skipped {format_bytes(stats.total_skipped())} of file data.")
+        for line in stats.summary_lines():
+            self.log(f"  {line}")
+        if not duplicates:
+            self.log("✅ No duplicates found.", 'success')
+        else:
+            self.log(f"⚠️ Found {len(duplicates)} duplicates in {len(groups_found)} groups.", 'warn')
+        return ScanReport(folder, groups_found, duplicates, metrics.walk_files, stats, metrics)
+
+    def export_manifest(self, folder, manifest_file, volume=None, on_status=None,
+                        status_interval=DEFAULT_REPORT_INTERVAL):
+        """
+        Hash every file below folder completely and write a ScanManifest to
+        manifest_file, for merging with the manifests of other volumes or
+        hosts. volume names the folder in merged results (default: the host
+        name). Uses the filters, algorithm and hash cache of the settings.
+        """
+        settings = self.settings
+        folder = os.path.abspath(folder)
+        volume = volume or socket.gethostname()
+        hasher = FileHasher(settings.hash_algorithm)
+        cache = HashCache(settings.db_file, CACHE_VERIFY if settings.verify_cache else CACHE_USE, hasher)
+        file_filter = settings.file_filter()
+        stats = StageStats()
+        metrics = ScanMetrics(stats, cache, progress_stages=("full",))
+        hardlinks = {}
+
+        def walked():
+            entries = cache.track(walk_files(folder, file_filter, self.log_access_error, settings.walk_threads))
+            for path, stat in collapse_hardlinks(entries, hardlinks):
+                metrics.walked(stat.st_size)
+                yield path, stat.st_size, stat.st_mtime
+            metrics.walk_finished()
+
+        def on_hash_error(path, e):
+            self.log(f"[Error] Cannot hash file {path}: {str(e)}", 'error')
+
+        try:
+            with WorkerPool(settings.workers, settings.io_depth) as pool, \
+                    MetricsReporter(metrics, on_status or _ignore, status_interval if on_status else 0):
+                metrics.watch_queue("hash", lambda: pool.in_flight)
+                builder = build_manifest(walked(), hasher, stats, on_hash_error, cache, pool)
+            builder.write(manifest_file, volume, folder)
+        finally:
+            cache.close()
+            metrics.finish()
+
+        if hardlinks:
+            self.log(f"🔗 {len(hardlinks)} hard links to already listed files were left out.")
+        if cache.hits:
+            self.log(f"Hash cache: {cache.hits} stored hashes of unchanged files reused.")
+        for path in cache.mismatches:
+            self.log(f"[Warning] Content changed but size/mtime/inode did not: {path}", 'warn')
+        self.log(f"📝 Manifest of {len(builder)} files written to {manifest_file} "
+                 f"(read {format_bytes(stats.total_read())}, {format_bytes(stats.total_cached())} cached).", 'success')
+        return ManifestReport(manifest_file, volume, folder, len(builder), stats, metrics)
+
+    # Watch mode
+
+    def watch(self, folder, polling_interval=None):
+        """Index folder and start watching it; returns a FolderWatch to reconcile() periodically"""
+        return FolderWatch(self, folder, polling_interval)
+
+    # Actions
+
+    def run_action(self, action, duplicates, trash_compress=0, trash_limit=None, on_result=None):
+        """
+        Apply action to (duplicate, original) pairs on the worker threads,
+        journaling each as soon as it completes. Safe deletes go to the
+        content-addressed trash, one blob per content. Links only replace
+        members of byte-identical groups, never perceptual image matches.
+        on_result(dup, record, error) is called for each pair. Returns an ActionReport.
+        """
+        if action in LINK_ACTIONS and isinstance(duplicates, DuplicatePairs):
+            identical = duplicates.of_kinds(IDENTICAL_KINDS)
+            if len(identical) < len(duplicates):
+                self.log(f"{len(duplicates) - len(identical)} image duplicates are not byte-identical "
+                         f"and are left out of {action}.", 'warn')
+            duplicates = identical
+        os.makedirs(RECOVERY_FOLDER, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        recovery_file = os.path.join(RECOVERY_FOLDER, f"recovery_{timestamp}{JOURNAL_SUFFIX}")
+        folders = {"move": DUPLICATE_FOLDER, "safe_delete": TRASH_FOLDER}
+        handled = failed = 0
+        trash = None
+        try:
+            if action == "safe_delete":
+                trash = TrashStore(TRASH_FOLDER, trash_compress, trash_limit)
+            with ActionJournal(recovery_file) as journal:
+                for dup, record, error in run_actions(duplicates, action, journal, folders,
+                                                      self.settings.workers, self.settings.versioning, trash):
+                    if on_result:
+                        on_result(dup, record, error)
+                    if error:
+                        failed += 1
+                        self.log(f"[Error] Failed to process {dup}: {str(error)}", 'error')
+                        continue
+                    handled += 1
+                    if action == "move":
+                        self.log(f"Moved: {dup} → {record['from']}")
+                    elif action == "safe_delete":
+                        self.log(f"Safely Deleted (moved to trash): {dup}")
+                    elif action == "permanent_delete":
+                        self.log(f"Permanently Deleted: {dup}")
+                    else:
+                        self.log(f"Replaced with {action}: {dup} → {record['original']}")
+        finally:
+            if trash:
+                trash.close()
+
+        self.log(f"✅ {action.replace('_', ' ').title()} completed for {handled} files. "
+                 f"Recovery data saved to {recovery_file}", 'success')
+        return ActionReport(action, handled, failed, recovery_file)
+
+    def recover(self, prefix=None, since=None, journal=None, on_progress=None):
+        """
+        Undo journaled actions, optionally only below prefix, at or after
+        since (a timestamp) and from one journal. on_progress(done, entry,
+        error) is called for each entry. Returns (restored, failed).
+        """
+        filters = dict(prefix=prefix, since=since, journal=journal)
+        # The index is opened here: SQLite connections stay in the thread that made them
+        with RecoveryIndex(RECOVERY_FOLDER) as index:
+            index.sync()
+            total = index.count(**filters)
+            permanent = index.count(**filters, permanent=True)
+            if permanent:
+                self.log(f"⚠️ {permanent} permanently deleted files in this selection cannot be recovered.", 'warn')
+            self.log(f"♻️ Restoring {total} entries...")
+
+            def report(done, entry, error):
+                if error:
+                    self.log(f"[Error] Failed to restore {entry.path}: {str(error)}", 'error')
+                if done % 1000 == 0 or done == total:
+                    self.log(f"♻️ {done}/{total} processed")
+                if on_progress:
+                    on_progress(done, entry, error)
+
+            trash = None
+            if os.path.exists(os.path.join(TRASH_FOLDER, MANIFEST_FILE)):
+                trash = TrashStore(TRASH_FOLDER)
+            try:
+                restored, failed = index.restore(index.query(**filters), self.settings.workers, report, trash)
+            finally:
+                if trash:
+                    trash.close()
+        self.log(f"♻️ Recovery completed: {restored} files restored, {failed} failed.", 'success')
+        return restored, failed
+
+
+class FolderWatch:
+    """
+    An indexed folder kept current from file change events (see
+    DuplicateIndex and FolderWatcher). Call reconcile() periodically - the
+    GUI does from an APScheduler job, BatchRemover.py from a loop - and
+    close() when done.
+    """
+
+    def __init__(self, engine, folder, polling_interval=None):
+        settings = engine.settings
+        self.engine = engine
+        self.folder = os.path.abspath(folder)
+        file_filter = settings.file_filter()
+        hasher = FileHasher(settings.hash_algorithm)
+        self.cache = HashCache(settings.db_file, CACHE_USE, hasher)
+        self.watcher = None
+        try:
+            self.index = DuplicateIndex(self.folder, hasher, self.cache, file_filter, engine.log_access_error)
+
+            # Start collecting events before the walk, so nothing changing during it is missed
+            self.watcher, reason = create_watcher(self.folder, file_filter, engine.log_access_error)
+            if reason:
+                every = f" every {polling_interval} s" if polling_interval else ""
+                engine.log(f"[Warning] Watching by polling{every}: {reason}", 'warn')
+            with WorkerPool(settings.workers, settings.io_depth) as pool:
+                self.index.build(settings.walk_threads, pool)
+        except BaseException:
+            self.close()
+            raise
+        engine.log(f"👁️ Watching {len(self.index)} files ({format_bytes(self.index.bytes_read)} hashed).", 'success')
+
+    def groups(self):
+        return self.index.groups()
+
+    def reconcile(self):
+        """Apply the changes seen since the last call; returns {key: group or None} of changed groups"""
+        paths, directories = self.watcher.take()
+        if not paths and not directories:
+            return {}
+        bytes_before = self.index.bytes_read
+        changed = self.index.apply(paths, directories)
+        self.engine.log(f"👁️ {len(paths)} files and {len(directories)} folders changed, "
+                        f"{format_bytes(self.index.bytes_read - bytes_before)} hashed.")
+        updated = sum(1 for group in changed.values() if group)
+        if changed:
+            self.engine.log(f"{updated} duplicate groups updated, {len(changed) - updated} resolved.", 'warn')
+        return changed
+
+    def close(self):
+        if self.watcher:
+            self.watcher.close()
+            self.watcher = None
+        if self.cache:
+            self.cache.close()
+            self.cache = None
@@ -0,0 +1,271 @@
+"""
+Mergeable scan manifests: duplicates across volumes and hosts without rescanning.
+
+A scan only compares the files below one folder. A manifest records the full
+digest of every file of a volume, sorted, so that any number of manifests -
+written on different disks or hosts, in parallel - can be merged later into
+one list of duplicate groups without reading a single file again:
+
+    python BatchRemover.py manifest /data nas1-data.dfm --volume nas1
+    python BatchRemover.py manifest /home laptop-home.dfm --volume laptop
+    python BatchRemover.py merge nas1-data.dfm laptop-home.dfm --across
+
+Every file is hashed completely (a size unique on one volume may well collide
+with another volume), but digests of unchanged files are taken from the hash
+cache, so a volume that has been scanned before is mostly not read again.
+
+File layout (little-endian):
+
+    magic     8 bytes, MAGIC
+    header    u16 format version, u32 length, then that many bytes of JSON:
+              volume, host, root, algorithm, digest_size, files, bytes,
+              directories, created
+    dirs      `directories` times: u16 length + fs-encoded absolute path
+    records   `files` times: u64 size, digest (digest_size bytes), u32 directory,
+              u16 name length + fs-encoded file name
+
+Records are sorted by (size, digest), files with equal keys in walk order,
+so merging is a streaming k-way merge that only keeps one record per
+manifest and the current group in memory. A record costs 14 bytes plus the
+digest and the file name; directory paths are stored once.
+
+Merged groups are DuplicateGroups whose members are "volume:path" locations.
+"""
+
+import os
+import json
+import heapq
+import socket
+import struct
+import datetime
+from functools import partial
+from itertools import groupby
+
+from DuplicateEngine import DuplicateGroup
+from FileIndex import FileIndex
+from HashEngine import ALGORITHMS, DEFAULT_HASHER
+from WorkerPool import WorkerPool
+
+MAGIC = b"DFRMANIF"
+FORMAT_VERSION = 1
+MANIFEST_SUFFIX = ".dfm"
+
+_PREAMBLE = struct.Struct("<HI")
+_LENGTH = struct.Struct("<H")
+
+
+def digest_size(algorithm):
+    """Length in bytes of the digests `algorithm` makes"""
+    return len(ALGORITHMS[algorithm]().digest())
+
+
+def _record_struct(size):
+    return struct.Struct(f"<Q{size}sIH")
+
+
+def _manifest_job(hasher, item):
+    path, _, _, digest = item
+    return digest if digest is not None else hasher.full(path)
+
+
+class ManifestEntry:
+    """One record read back from a manifest"""
+
+    __slots__ = ("size", "digest", "path")
+
+    def __init__(self, size, digest, path):
+        self.size = size
+        self.digest = digest
+        self.path = path
+
+    def __repr__(self):
+        return f"ManifestEntry({self.size}, {self.digest.hex()[:12]}, {self.path!r})"
+
+
+class ManifestBuilder:
+    """Walked files with their full digests, written sorted by write()"""
+
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.digest_size = digest_size(algorithm)
+        self.index = FileIndex()
+        self.digests = bytearray()
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, path, size, mtime, digest):
+        if len(digest) != self.digest_size:
+            raise ValueError(f"{self.algorithm} digests are {self.digest_size} bytes, got {len(digest)}")
+        self.index.add(path, size, mtime)
+        self.digests += digest
+
+    def _digest(self, row):
+        return bytes(self.digests[row * self.digest_size:(row + 1) * self.digest_size])
+
+    def write(self, manifest_file, volume=None, root=""):
+        """Write the manifest, replacing manifest_file only once it is complete"""
+        index = self.index
+        order = sorted(range(len(index)), key=lambda row: (index.sizes[row], self._digest(row)))
+        header = json.dumps({
+            "volume": volume or socket.gethostname(),
+            "host": socket.gethostname(),
+            "root": root,
+            "algorithm": self.algorithm,
+            "digest_size": self.digest_size,
+            "files": len(index),
+            "bytes": sum(index.sizes),
+            "directories": index.directories(),
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        }).encode("utf-8")
+        record = _record_struct(self.digest_size)
+        partial_file = manifest_file + ".part"
+        with open(partial_file, "wb") as f:
+            f.write(MAGIC)
+            f.write(_PREAMBLE.pack(FORMAT_VERSION, len(header)))
+            f.write(header)
+            for dir_id in range(index.directories()):
+                encoded = os.fsencode(index.directory(dir_id))
+                f.write(_LENGTH.pack(len(encoded)))
+                f.write(encoded)
+            for row in order:
+                name = os.fsencode(index.name(row))
+                f.write(record.pack(index.sizes[row], self._digest(row), index.dir_ids[row], len(name)))
+                f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial_file, manifest_file)
+
+
+def build_manifest(files, hasher=None, stats=None, on_error=None, cache=None, pool=None):
+    """
+    ManifestBuilder with the full digest of every (path, size, mtime) in files,
+    in their order. Cached digests are reused (cache: a ScanDatabase.HashCache)
+    and new ones stored; unreadable files are passed to on_error and left out.
+    """
+    hasher = hasher or DEFAULT_HASHER
+    pool = pool or WorkerPool(1)
+    builder = ManifestBuilder(hasher.algorithm)
+
+    def with_cached(files):
+        # Cache lookups stay on this thread; workers only hash
+        for path, size, mtime in files:
+            if stats:
+                stats.bytes_planned += size
+            yield path, size, mtime, cache.get(path, "file_hash") if cache else None
+
+    for (path, size, mtime, cached), digest, error in pool.map(partial(_manifest_job, hasher), with_cached(files)):
+        if error:
+            if on_error:
+                on_error(path, error)
+            continue
+        if stats:
+            stats.enter("full", size)  # on completion, so that bytes_in["full"] measures progress
+        if cached is None:
+            if stats:
+                stats.bytes_read["full"] += size
+            if cache:
+                cache.put(path, "file_hash", digest)
+        elif stats:
+            stats.bytes_cached["full"] += size
+        builder.add(path, size, mtime, digest)
+    return builder
+
+
+class ManifestReader:
+    """
+    Reads a manifest's header and directory table on open; iterating yields
+    its ManifestEntries in file order, streaming.
+    """
+
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self._file = open(manifest_file, "rb")
+        try:
+            if self._file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a scan manifest: {manifest_file}")
+            version, length = _PREAMBLE.unpack(self._read(_PREAMBLE.size))
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported manifest version {version}: {manifest_file}")
+            self.header = json.loads(self._read(length).decode("utf-8"))
+            self._dirs = [os.fsdecode(self._read(_LENGTH.unpack(self._read(_LENGTH.size))[0]))
+                          for _ in range(self.header["directories"])]
+        except Exception:
+            self._file.close()
+            raise
+        self._records = self._file.tell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def volume(self):
+        return self.header["volume"]
+
+    @property
+    def algorithm(self):
+        return self.header["algorithm"]
+
+    @property
+    def files(self):
+        return self.header["files"]
+
+    def _read(self, length):
+        data = self._file.read(length)
+        if len(data) != length:
+            raise ValueError(f"Truncated scan manifest: {self.manifest_file}")
+        return data
+
+    def __iter__(self):
+        self._file.seek(self._records)
+        record = _record_struct(self.header["digest_size"])
+        read = self._read
+        dirs = self._dirs
+        for _ in range(self.header["files"]):
+            size, digest, dir_id, length = record.unpack(read(record.size))
+            yield ManifestEntry(size, digest, os.path.join(dirs[dir_id], os.fsdecode(read(length))))
+
+
+def location(volume, path):
+    """How merged groups name a file: "volume:path" """
+    return f"{volume}:{path}"
+
+
+def merge_manifests(readers, across_only=False):
+    """
+    Yield a DuplicateGroup for every (size, digest) found more than once in
+    the ManifestReaders, smallest size first. Members are "volume:path"
+    locations in reader order (members[0], the original, comes from the first
+    reader that has the content). The same location listed by overlapping
+    manifests counts once. across_only keeps groups spread over several manifests.
+    """
+    readers = list(readers)
+    algorithms = {reader.algorithm for reader in readers}
+    if len(algorithms) > 1:
+        raise ValueError(f"Manifests made with different hash algorithms cannot be merged: "
+                         f"{', '.join(sorted(algorithms))}")
+
+    def keyed(number, reader):
+        for entry in reader:
+            yield entry.size, entry.digest, number, entry.path
+
+    # heapq.merge breaks ties on the reader number, so members come in reader order
+    merged = heapq.merge(*(keyed(number, reader) for number, reader in enumerate(readers)))
+    for (size, digest), entries in groupby(merged, key=lambda entry: entry[:2]):
+        members = []
+        seen = set()
+        numbers = set()
+        for _, _, number, path in entries:
+            name = location(readers[number].volume, path)
+            if name not in seen:
+                seen.add(name)
+                members.append(name)
+                numbers.add(number)
+        if len(members) > 1 and (len(numbers) > 1 or not across_only):
+            yield DuplicateGroup(size, digest, members)
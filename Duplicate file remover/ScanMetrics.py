@@ -0,0 +1,275 @@
+"""
+Live throughput metrics for a scan, and an end-of-scan report.
+
+ScanMetrics reads the counters the scan already keeps - StageStats for the
+size / partial / full / image stages, HashCache hits, ScanWriter rows - plus
+the files counted off the walk, and turns them into rates:
+
+- files/s and bytes/s per stage, on average since the stage started and over
+  the last sampling interval ("current")
+- queue depths: jobs in flight on each WorkerPool, rows waiting for the writer
+- the cache hit ratio
+- progress and an ETA. Once the walk is done the total size of all files
+  that share a size is known (StageStats.bytes_planned); the ETA extrapolates
+  from how much of it has entered the hashing stages so far.
+
+Nothing here runs on the scan's hot path: counters are plain integers that
+the scan threads bump anyway, and snapshot() is only called by whoever shows
+them (MetricsReporter for the CLI, an after() timer in the GUI).
+
+write_report() stores the final snapshot as JSON, or in the Prometheus text
+exposition format (for node_exporter's textfile collector) when the file name
+ends in .prom.
+"""
+
+import os
+import json
+import time
+import threading
+
+from DuplicateEngine import format_bytes
+
+PROMETHEUS_SUFFIX = ".prom"
+METRIC_PREFIX = "dedupe"
+
+DEFAULT_REPORT_INTERVAL = 5.0  # seconds between live status lines in the CLI
+PROGRESS_STAGES = ("partial", "image")  # stages whose input bytes_planned counts
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class ScanMetrics:
+    """
+    Rates and progress of one scan. `stats` is its StageStats; cache (a
+    HashCache) and writer (a ScanWriter) are optional; queues are added with
+    watch_queue(). progress_stages are the stages whose input makes up
+    StageStats.bytes_planned.
+    """
+
+    def __init__(self, stats, cache=None, writer=None, progress_stages=PROGRESS_STAGES):
+        self.stats = stats
+        self.cache = cache
+        self.writer = writer
+        self.progress_stages = progress_stages
+        self.started = time.monotonic()
+        self.finished = None
+        self.walk_files = 0
+        self.walk_bytes = 0
+        self.walk_done = None
+        self._queues = {}
+        self._previous = None  # (time, {stage: (files, bytes)}) of the last snapshot
+
+    def walked(self, size):
+        """Count one file coming off the walk (called by the walk consumer)"""
+        self.walk_files += 1
+        self.walk_bytes += size
+
+    def walk_finished(self):
+        if self.walk_done is None:
+            self.walk_done = time.monotonic()
+
+    def watch_queue(self, name, depth):
+        """Report depth() as the depth of queue `name`"""
+        self._queues[name] = depth
+
+    def finish(self):
+        self.walk_finished()
+        self.finished = time.monotonic()
+
+    # Sampling
+
+    def _counters(self):
+        """{stage: (files, bytes processed, start time)}"""
+        stats = self.stats
+        counters = {"walk": (self.walk_files, self.walk_bytes, self.started)}
+        for stage in list(stats.files_in):  # the GUI adds the "similar" stage while this may run
+            processed = stats.bytes_read[stage] + stats.bytes_cached[stage]
+            if stage == "size":
+                processed = stats.bytes_in[stage]  # sizes come from the walk, nothing is read
+            counters[stage] = (stats.files_in[stage], processed, stats.started.get(stage))
+        if self.writer:
+            counters["db_write"] = (self.writer.rows_written, 0, self.started)
+        return counters
+
+    def progress(self):
+        """Fraction of the hashing work done, or None while the walk is running"""
+        if self.walk_done is None:
+            return None
+        if self.finished is not None or not self.stats.bytes_planned:
+            return 1.0
+        entered = sum(self.stats.bytes_in.get(stage, 0) for stage in self.progress_stages)
+        return min(1.0, entered / self.stats.bytes_planned)
+
+    def eta(self):
+        """Seconds left, extrapolated from the hashing progress, or None if unknown"""
+        done = self.progress()
+        if done is None:
+            return None
+        if done >= 1.0:
+            return 0.0
+        if done <= 0:
+            return None
+        spent = time.monotonic() - self.walk_done
+        return spent * (1 - done) / done
+
+    def snapshot(self):
+        """Everything there is to show, as a JSON-ready dict"""
+        now = self.finished or time.monotonic()
+        counters = self._counters()
+        previous_time, previous = self._previous or (self.started, {})
+        interval = max(1e-9, now - previous_time)
+
+        stages = {}
+        for stage, (files, processed, started) in counters.items():
+            active = max(1e-9, now - started) if started is not None else None
+            previous_files, previous_bytes = previous.get(stage, (0, 0))
+            entry = {
+                "files": files,
+                "files_per_second": round(files / active, 1) if active else 0.0,
+                "current_files_per_second": round((files - previous_files) / interval, 1),
+            }
+            if stage in self.stats.files_in:
+                entry.update(
+                    bytes_read=self.stats.bytes_read[stage],
+                    bytes_cached=self.stats.bytes_cached[stage],
+                    bytes_skipped=self.stats.bytes_skipped[stage],
+                )
+            if stage != "db_write":
+                entry.update(
+                    bytes_per_second=round(processed / active) if active else 0,
+                    current_bytes_per_second=round((processed - previous_bytes) / interval),
+                )
+            stages[stage] = entry
+        self._previous = (now, {stage: (files, processed) for stage, (files, processed, _) in counters.items()})
+
+        queues = {name: depth() for name, depth in self._queues.items()}
+        if self.writer:
+            queues["db_write"] = self.writer.queue_depth()
+
+        lookups = self.cache.lookups if self.cache else 0
+        hits = self.cache.hits if self.cache else 0
+        return {
+            "elapsed_seconds": round(now - self.started, 3),
+            "finished": self.finished is not None,
+            "walk_finished": self.walk_done is not None,
+            "stages": stages,
+            "queues": queues,
+            "cache": {"lookups": lookups, "hits": hits,
+                      "hit_ratio": round(hits / lookups, 4) if lookups else None},
+            "bytes_planned": self.stats.bytes_planned,
+            "bytes_read": self.stats.total_read(),
+            "progress": self.progress(),
+            "eta_seconds": self.eta(),
+        }
+
+    def status_line(self, snapshot=None):
+        """One line for a live display"""
+        snapshot = snapshot or self.snapshot()
+        stages = snapshot["stages"]
+        # Live: the speed right now; at the end: the average
+        rate = "" if snapshot["finished"] else "current_"
+        walk = stages["walk"]
+        parts = [f"walk {walk['files']} files ({walk[rate + 'files_per_second']:.0f}/s)"]
+        for stage in ("partial", "full", "image", "similar"):
+            if stage in stages and stages[stage]["files"]:
+                parts.append(f"{stage} {stages[stage]['files']} files "
+                             f"({format_bytes(stages[stage][rate + 'bytes_per_second'])}/s)")
+        depth = sum(snapshot["queues"].values())
+        if depth:
+            parts.append(f"queued {depth}")
+        if snapshot["cache"]["hit_ratio"] is not None:
+            parts.append(f"cache {snapshot['cache']['hit_ratio']:.0%}")
+        if snapshot["progress"] is not None:
+            parts.append(f"{snapshot['progress']:.0%}, ETA {format_duration(snapshot['eta_seconds'])}")
+        else:
+            parts.append("walking")
+        return " | ".join(parts)
+
+    # Reports
+
+    def write_report(self, path, fmt=None):
+        """Write the current snapshot as "json" or "prometheus" (default: by file extension)"""
+        fmt = fmt or ("prometheus" if path.endswith(PROMETHEUS_SUFFIX) else "json")
+        snapshot = self.snapshot()
+        if fmt == "prometheus":
+            text = prometheus_text(snapshot)
+        else:
+            text = json.dumps(snapshot, indent=2) + "\n"
+        # Written under a temporary name first, so collectors never read half a file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+        return path
+
+
+def prometheus_text(snapshot):
+    """The snapshot in the Prometheus text exposition format"""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        name = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    stages = snapshot["stages"]
+    metric("scan_duration_seconds", "gauge", "Wall time of the scan.", [({}, snapshot["elapsed_seconds"])])
+    metric("scan_timestamp_seconds", "gauge", "When the report was written.", [({}, round(time.time(), 3))])
+    metric("stage_files_total", "counter", "Files that entered each scan stage.",
+           [({"stage": stage}, entry["files"]) for stage, entry in stages.items()])
+    metric("stage_files_per_second", "gauge", "Average files per second of each stage.",
+           [({"stage": stage}, entry["files_per_second"]) for stage, entry in stages.items()])
+    metric("stage_bytes_per_second", "gauge", "Average bytes per second processed by each stage.",
+           [({"stage": stage}, entry["bytes_per_second"]) for stage, entry in stages.items()
+            if "bytes_per_second" in entry])
+    for field in ("bytes_read", "bytes_cached", "bytes_skipped"):
+        metric(f"stage_{field}_total", "counter", f"Bytes {field.split('_')[1]} by each stage.",
+               [({"stage": stage}, entry[field]) for stage, entry in stages.items() if field in entry])
+    metric("queue_depth", "gauge", "Jobs or rows waiting at the end of the scan.",
+           [({"queue": name}, depth) for name, depth in snapshot["queues"].items()])
+    cache = snapshot["cache"]
+    metric("cache_lookups_total", "counter", "Hash cache lookups.", [({}, cache["lookups"])])
+    metric("cache_hits_total", "counter", "Hash cache hits.", [({}, cache["hits"])])
+    if cache["hit_ratio"] is not None:
+        metric("cache_hit_ratio", "gauge", "Hash cache hits per lookup.", [({}, cache["hit_ratio"])])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsReporter:
+    """Background thread handing metrics.status_line() to callback every `interval` seconds"""
+
+    def __init__(self, metrics, callback, interval=DEFAULT_REPORT_INTERVAL):
+        self.metrics = metrics
+        self.callback = callback
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="MetricsReporter", daemon=True)
+
+    def __enter__(self):
+        if self.interval and self.interval > 0:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.callback(self.metrics.status_line())
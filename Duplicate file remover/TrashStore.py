@@ -0,0 +1,343 @@
+"""
+Content-addressed trash for safe_delete.
+
+A flat trash_bin/ keeps a full copy of every duplicate it receives, which for
+a deduplication tool means storing the very redundancy it was asked to
+remove. TrashStore keeps one blob per unique content instead:
+
+    trash_bin/objects/ab/abcdef...      blob named by the SHA-256 of its content
+    trash_bin/objects/ab/abcdef....z    the same, zlib-compressed
+    trash_bin/manifest.db               which original paths map to which blobs
+
+put() hashes the file (compressing it in the same pass when compression is
+on); if a blob with that digest is already stored the file is simply
+removed, otherwise it becomes the blob - by a rename when the trash is on the
+same filesystem and compression is off, so nothing is copied. A file with
+other hard links is copied instead: its inode stays with the user's other
+names and must never be shared with (or made read-only as) a blob. A
+duplicated directory is stored file by file under one item.
+
+restore() puts an item back: an uncompressed blob that no other item uses
+any more is renamed into place, one still shared is reflinked where the
+filesystem can (or copied), a compressed one is decompressed. Mode and
+modification time are restored from the manifest.
+
+With max_bytes set, the least recently used blobs are evicted once the stored
+size exceeds the limit; items that lose a blob are marked evicted and can no
+longer be restored, and blobs nothing else uses go with them.
+"""
+
+import os
+import shutil
+import hashlib
+import threading
+import time
+import zlib
+
+from FileActions import move_path, reflink, tree_files
+from ScanDatabase import connect
+
+OBJECTS_FOLDER = "objects"
+MANIFEST_FILE = "manifest.db"
+COMPRESSED_SUFFIX = ".z"
+
+DEFAULT_COMPRESS_LEVEL = 6
+_CHUNK = 1024 * 1024
+
+
+def parse_size(text):
+    """Bytes from "500M", "20G", "1048576" ...; None or 0 for blank text"""
+    text = str(text).strip().upper().rstrip("B")
+    if not text:
+        return None
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+class TrashStore:
+    """
+    Deduplicated, optionally compressed trash in `folder`. Safe to use from
+    several threads; compress_level 0 stores blobs uncompressed.
+    """
+
+    def __init__(self, folder, compress_level=0, max_bytes=None):
+        self.folder = folder
+        self.objects = os.path.join(folder, OBJECTS_FOLDER)
+        self.compress_level = compress_level
+        self.max_bytes = max_bytes or None
+        os.makedirs(os.path.join(self.objects, "tmp"), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = connect(os.path.join(folder, MANIFEST_FILE), check_same_thread=False)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER,
+                stored_size INTEGER,
+                compressed INTEGER,
+                refs INTEGER,
+                last_used REAL
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT,
+                is_dir INTEGER,
+                deleted REAL,
+                restored REAL,
+                evicted REAL
+            );
+            CREATE TABLE IF NOT EXISTS item_files (
+                item INTEGER,
+                rel_path TEXT,
+                digest TEXT,
+                mode INTEGER,
+                mtime_ns INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_item_files_item ON item_files (item);
+            CREATE INDEX IF NOT EXISTS idx_item_files_digest ON item_files (digest);
+        ''')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _blob_path(self, digest, compressed):
+        return os.path.join(self.objects, digest[:2], digest + (COMPRESSED_SUFFIX if compressed else ""))
+
+    def _temporary_blob(self):
+        return os.path.join(self.objects, "tmp", f"{os.getpid()}-{threading.get_ident()}-{time.monotonic_ns()}")
+
+    # Storing
+
+    def put(self, path):
+        """Move a file or directory into the trash; returns the item id used to restore it"""
+        path = os.path.abspath(path)
+        is_dir = os.path.isdir(path) and not os.path.islink(path)
+        with self._lock:
+            item = self.conn.execute("INSERT INTO items (path, is_dir, deleted) VALUES (?, ?, ?)",
+                                     (path, int(is_dir), time.time())).lastrowid
+            self.conn.commit()
+        stored = set()
+        try:
+            for rel in (tree_files(path) if is_dir else [""]):
+                stored.add(self._store_file(os.path.join(path, rel) if rel else path, item, rel))
+        except BaseException:
+            # Put back what was already taken, so a failure never leaves half a directory
+            self._restore_files(item, path)
+            with self._lock:
+                self.conn.execute("DELETE FROM item_files WHERE item = ?", (item,))
+                self.conn.execute("DELETE FROM items WHERE id = ?", (item,))
+                self.conn.commit()
+            raise
+        if is_dir:
+            shutil.rmtree(path)
+        if self.max_bytes:
+            self.evict(self.max_bytes, keep=stored)
+        return item
+
+    def _add_reference(self, digest, item, rel, stat):
+        """Register one more use of a stored blob; False if there is no such blob (call with the lock held)"""
+        if not self.conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone():
+            return False
+        self.conn.execute("UPDATE blobs SET refs = refs + 1, last_used = ? WHERE digest = ?", (time.time(), digest))
+        self.conn.execute("INSERT INTO item_files (item, rel_path, digest, mode, mtime_ns) VALUES (?, ?, ?, ?, ?)",
+                          (item, rel, digest, stat.st_mode, stat.st_mtime_ns))
+        self.conn.commit()
+        return True
+
+    def _store_file(self, path, item, rel):
+        """Turn one file into a reference to its blob, storing the blob if it is new; returns the digest"""
+        stat = os.stat(path)
+        digest = hashlib.sha256()
+        tmp = None
+        if self.compress_level or stat.st_nlink > 1:
+            # One read: hash and compress (or copy) together
+            tmp = self._temporary_blob()
+            compressor = zlib.compressobj(self.compress_level) if self.compress_level else None
+            with open(path, "rb") as source, open(tmp, "wb") as target:
+                for chunk in iter(lambda: source.read(_CHUNK), b""):
+                    digest.update(chunk)
+                    target.write(compressor.compress(chunk) if compressor else chunk)
+                if compressor:
+                    target.write(compressor.flush())
+        else:
+            with open(path, "rb") as source:
+                for chunk in iter(lambda: source.read(_CHUNK), b""):
+                    digest.update(chunk)
+        digest = digest.hexdigest()
+
+        with self._lock:
+            known = self._add_reference(digest, item, rel, stat)
+        moved = False
+        if not known and not tmp:
+            # New content becomes the blob itself: a rename on the same filesystem
+            tmp = self._temporary_blob()
+            move_path(path, tmp)
+            moved = True
+        if not known:
+            with self._lock:
+                try:
+                    # Another worker may have stored the same content meanwhile
+                    known = self._add_reference(digest, item, rel, stat)
+                    if not known:
+                        blob = self._blob_path(digest, bool(self.compress_level))
+                        os.makedirs(os.path.dirname(blob), exist_ok=True)
+                        os.chmod(tmp, 0o444)
+                        os.replace(tmp, blob)
+                        tmp = blob
+                        self.conn.execute(
+                            "INSERT INTO blobs (digest, size, stored_size, compressed, refs, last_used) "
+                            "VALUES (?, ?, ?, ?, 0, ?)",
+                            (digest, stat.st_size, os.path.getsize(blob), int(bool(self.compress_level)), time.time()))
+                        self._add_reference(digest, item, rel, stat)
+                        tmp = None
+                except BaseException:
+                    # A moved file now only exists as tmp (or already as the blob): put it back
+                    self.conn.rollback()
+                    if moved:
+                        os.chmod(tmp, stat.st_mode & 0o7777)
+                        move_path(tmp, path)
+                    else:
+                        os.remove(tmp)
+                    raise
+        if tmp:
+            os.remove(tmp)
+        if os.path.lexists(path):
+            os.remove(path)
+        return digest
+
+    # Restoring
+
+    def restore(self, item, dst=None):
+        """Put an item back at its original path (or dst); raises OSError if it cannot be"""
+        with self._lock:
+            row = self.conn.execute("SELECT path, is_dir, restored, evicted FROM items WHERE id = ?",
+                                    (item,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"Trash item {item} does not exist")
+        path, is_dir, restored, evicted = row
+        if restored:
+            raise FileNotFoundError(f"Trash item {item} was already restored")
+        if evicted:
+            raise FileNotFoundError(f"{path} was evicted from the trash (size limit)")
+        dst = dst or path
+        if os.path.lexists(dst):
+            raise FileExistsError(f"{dst} exists again, not overwriting it")
+
+        self._restore_files(item, dst)
+        if is_dir:
+            os.makedirs(dst, exist_ok=True)
+        with self._lock:
+            self.conn.execute("UPDATE items SET restored = ? WHERE id = ?", (time.time(), item))
+            self.conn.commit()
+
+    def _restore_files(self, item, dst):
+        with self._lock:
+            files = self.conn.execute("SELECT rel_path, digest, mode, mtime_ns FROM item_files WHERE item = ?",
+                                      (item,)).fetchall()
+        for rel, digest, mode, mtime_ns in files:
+            target = os.path.join(dst, rel) if rel else dst
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            self._restore_file(digest, target)
+            os.chmod(target, mode & 0o7777)
+            os.utime(target, ns=(mtime_ns, mtime_ns))
+
+    def _restore_file(self, digest, target):
+        with self._lock:
+            size, compressed, refs = self.conn.execute(
+                "SELECT size, compressed, refs FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            blob = self._blob_path(digest, compressed)
+            last = refs <= 1
+            if last and not compressed:
+                # Nobody else needs this content: hand the blob itself back
+                os.chmod(blob, 0o600)
+                move_path(blob, target)
+            if last:
+                self.conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            else:
+                self.conn.execute("UPDATE blobs SET refs = refs - 1 WHERE digest = ?", (digest,))
+            self.conn.commit()
+            if last and not compressed:
+                return
+            # Still needed (or compressed): work from a private name, out of the lock
+            source = self._temporary_blob()
+            if last:
+                os.rename(blob, source)
+            else:
+                os.link(blob, source)
+
+        try:
+            if compressed:
+                decompressor = zlib.decompressobj()
+                with open(source, "rb") as f, open(target, "xb") as out:
+                    for chunk in iter(lambda: f.read(_CHUNK), b""):
+                        out.write(decompressor.decompress(chunk))
+                    out.write(decompressor.flush())
+            else:
+                try:
+                    reflink(source, target)
+                except OSError:
+                    shutil.copyfile(source, target)
+        finally:
+            os.remove(source)
+
+    # Eviction
+
+    def stored_bytes(self):
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+
+    def evict(self, max_bytes, keep=()):
+        """
+        Delete least recently used blobs until at most max_bytes are stored
+        (blobs in keep are spared). Returns the number of bytes freed.
+        """
+        freed = 0
+        with self._lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+            if total <= max_bytes:
+                return 0
+            victims = []
+            for digest, stored_size, compressed in self.conn.execute(
+                    "SELECT digest, stored_size, compressed FROM blobs ORDER BY last_used"):
+                if total <= max_bytes:
+                    break
+                if digest in keep:
+                    continue
+                victims.append((digest, compressed))
+                total -= stored_size
+                freed += stored_size
+            now = time.time()
+            evicted = set()
+            for digest, compressed in victims:
+                evicted.update(item for item, in self.conn.execute('''
+                    SELECT id FROM items
+                    WHERE restored IS NULL AND evicted IS NULL
+                      AND id IN (SELECT item FROM item_files WHERE digest = ?)
+                ''', (digest,)).fetchall())
+                self.conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            for item in evicted:
+                self.conn.execute("UPDATE items SET evicted = ? WHERE id = ?", (now, item))
+                # The item's other blobs lose its references (deleted victims are simply not matched)
+                for digest, in self.conn.execute("SELECT digest FROM item_files WHERE item = ?", (item,)).fetchall():
+                    self.conn.execute("UPDATE blobs SET refs = refs - 1 WHERE digest = ?", (digest,))
+            # ... and those only evicted items used go as well
+            for digest, stored_size, compressed in self.conn.execute(
+                    "SELECT digest, stored_size, compressed FROM blobs WHERE refs <= 0").fetchall():
+                victims.append((digest, compressed))
+                freed += stored_size
+                self.conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            for digest, compressed in victims:
+                try:
+                    os.remove(self._blob_path(digest, compressed))
+                except FileNotFoundError:
+                    pass
+            self.conn.commit()
+        return freed
@@ -0,0 +1,258 @@
+"""
+Synthetic, reproducible file trees for Benchmark.py.
+
+Each profile stresses one part of the scan:
+
+- "tiny"      - many files of at most 512 bytes in a hundred folders, one in
+                ten a copy: per-file overhead (walk, stat, open)
+- "huge"      - a few large files of one size: two identical, two more that
+                only differ from them in the middle, so partial hashes collide
+                and all four are read completely: raw hashing throughput
+- "same_size" - many distinct files of one size, half of them sharing their
+                first and last 4 KB: the partial hash stage and the queue
+- "deep"      - a 64 level deep folder chain plus a wide, shallow one, with
+                copies across levels: the walker and long paths
+- "images"    - 24-bit BMP images with exact copies, half-size versions and
+                slightly brightened versions: exact and near-duplicate images
+
+generate_tree() writes one profile, or all of them ("all") in one folder per
+profile. Contents come from random.Random(seed), so the same profile, scale
+and seed always give byte-identical trees; TreeSpec.fingerprint names that
+tree when results of different runs are compared. The images are written
+without PIL, so generating never needs more than the standard library.
+
+A tree.json in the root records the spec, and generate_tree() reuses a tree
+whose spec matches instead of writing it again.
+"""
+
+import os
+import json
+import random
+import shutil
+import hashlib
+import struct
+
+GENERATOR_VERSION = 1  # bump when a profile changes, so old results are not compared with new trees
+SPEC_FILE = "tree.json"
+
+PROFILES = ("tiny", "huge", "same_size", "deep", "images")
+
+_BLOCK = 1024 * 1024
+_PARTIAL = 4096  # must cover HashEngine's partial hash ends
+
+
+class TreeSpec:
+    """What generate_tree() builds: profile, scale (multiplies file counts and sizes) and seed"""
+
+    __slots__ = ("profile", "scale", "seed")
+
+    def __init__(self, profile="all", scale=1.0, seed=0):
+        if profile != "all" and profile not in PROFILES:
+            raise ValueError(f"Unknown profile {profile!r}, expected 'all' or one of {', '.join(PROFILES)}")
+        self.profile = profile
+        self.scale = scale
+        self.seed = seed
+
+    def as_dict(self):
+        return {"profile": self.profile, "scale": self.scale, "seed": self.seed, "version": GENERATOR_VERSION}
+
+    @property
+    def fingerprint(self):
+        text = json.dumps(self.as_dict(), sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+    def profiles(self):
+        return PROFILES if self.profile == "all" else (self.profile,)
+
+
+def _count(base, scale, minimum=1):
+    return max(minimum, int(base * scale))
+
+
+def _random_bytes(rng, size):
+    return rng.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def _copy(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copyfile(src, dst)
+    return os.path.getsize(dst)
+
+
+# Profiles: each writes below root and returns (files, bytes)
+
+def _tiny(root, rng, scale):
+    files = _count(20000, scale)
+    written = 0
+    originals = []
+    for i in range(files):
+        path = os.path.join(root, f"d{i % 100:03d}", f"t{i:06d}.dat")
+        if originals and i % 10 == 9:
+            written += _copy(rng.choice(originals), path)
+        else:
+            written += _write(path, _random_bytes(rng, rng.randrange(513)))
+            originals.append(path)
+    return files, written
+
+
+def _huge(root, rng, scale):
+    size = _count(64 * _BLOCK, scale, _BLOCK)
+    block = _random_bytes(rng, _BLOCK)
+    middle = size // 2
+
+    def write_large(path, flip=0):
+        with open(path, "wb") as f:
+            for offset in range(0, size, _BLOCK):
+                chunk = bytearray(block[:min(_BLOCK, size - offset)])
+                chunk[:8] = struct.pack("<Q", offset)  # no two blocks alike
+                if offset <= middle < offset + len(chunk):
+                    chunk[middle - offset] ^= flip
+                f.write(chunk)
+
+    os.makedirs(root, exist_ok=True)
+    write_large(os.path.join(root, "large_a.bin"))
+    _copy(os.path.join(root, "large_a.bin"), os.path.join(root, "copy", "large_a.bin"))
+    # Same size, head and tail as large_a, one byte in the middle differs
+    write_large(os.path.join(root, "large_b.bin"), flip=0xFF)
+    write_large(os.path.join(root, "large_c.bin"), flip=0x0F)
+    return 4, 4 * size
+
+
+def _same_size(root, rng, scale):
+    files = _count(5000, scale)
+    size = 64 * 1024
+    head = _random_bytes(rng, _PARTIAL)
+    tail = _random_bytes(rng, _PARTIAL)
+    for i in range(files):
+        path = os.path.join(root, f"s{i % 50:02d}", f"same{i:05d}.bin")
+        if i % 2:
+            # Identical ends: only the full hash tells these apart
+            _write(path, head + _random_bytes(rng, size - 2 * _PARTIAL) + tail)
+        else:
+            _write(path, _random_bytes(rng, size))
+    return files, files * size
+
+
+def _deep(root, rng, scale):
+    depth = 64
+    written = files = 0
+    level_files = _count(4, scale)
+    path = root
+    previous = []
+    for level in range(depth):
+        path = os.path.join(path, f"level{level:02d}")
+        for i in range(level_files):
+            target = os.path.join(path, f"f{i}.txt")
+            if previous and i == 0:
+                written += _copy(rng.choice(previous), target)
+            else:
+                written += _write(target, _random_bytes(rng, rng.randrange(64, 4096)))
+            previous.append(target)
+            files += 1
+    for i in range(_count(2000, scale)):
+        target = os.path.join(root, "wide", f"w{i % 500:03d}", f"g{i}.txt")
+        written += _write(target, _random_bytes(rng, rng.randrange(64, 4096)))
+        files += 1
+    return files, written
+
+
+def _bmp(width, height, pixel):
+    """24-bit uncompressed BMP; pixel(x, y) returns (r, g, b)"""
+    row_size = (width * 3 + 3) & ~3
+    rows = []
+    for y in range(height - 1, -1, -1):  # stored bottom-up
+        row = bytearray()
+        for x in range(width):
+            r, g, b = pixel(x, y)
+            row += bytes((b, g, r))
+        row += bytes(row_size - len(row))
+        rows.append(bytes(row))
+    data = b"".join(rows)
+    header = struct.pack("<2sIHHI", b"BM", 54 + len(data), 0, 0, 54)
+    info = struct.pack("<IiiHHIIiiII", 40, width, height, 1, 24, 0, len(data), 2835, 2835, 0, 0)
+    return header + info + data
+
+
+def _images(root, rng, scale):
+    width, height = 256, 192
+    files = written = 0
+    for i in range(_count(50, scale)):
+        # Smooth gradients with a few blocks: stable under resizing, distinct per image
+        base = [rng.randrange(256) for _ in range(3)]
+        step = [rng.uniform(-1, 1) for _ in range(3)]
+        blocks = [(rng.randrange(width), rng.randrange(height), rng.randrange(20, 80),
+                   tuple(rng.randrange(256) for _ in range(3))) for _ in range(3)]
+
+        def pixel(x, y, gain=0, shrink=1):
+            x, y = x * shrink, y * shrink
+            for bx, by, side, color in blocks:
+                if bx <= x < bx + side and by <= y < by + side:
+                    return tuple(min(255, c + gain) for c in color)
+            return tuple(min(255, max(0, int(c + s * (x + y) / 2)) + gain) for c, s in zip(base, step))
+
+        folder = os.path.join(root, f"set{i % 10}")
+        original = os.path.join(folder, f"img{i:04d}.bmp")
+        written += _write(original, _bmp(width, height, pixel))
+        written += _copy(original, os.path.join(root, "copies", f"img{i:04d}.bmp"))
+        written += _write(os.path.join(root, "resized", f"img{i:04d}_half.bmp"),
+                          _bmp(width // 2, height // 2, lambda x, y: pixel(x, y, shrink=2)))
+        written += _write(os.path.join(root, "edited", f"img{i:04d}_bright.bmp"),
+                          _bmp(width, height, lambda x, y: pixel(x, y, gain=6)))
+        files += 4
+    return files, written
+
+
+_GENERATORS = {
+    "tiny": _tiny,
+    "huge": _huge,
+    "same_size": _same_size,
+    "deep": _deep,
+    "images": _images,
+}
+
+
+def read_spec(root):
+    """The spec stored in root by generate_tree(), or None"""
+    try:
+        with open(os.path.join(root, SPEC_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def generate_tree(root, spec, force=False, on_progress=None):
+    """
+    Write the tree described by spec below root (replacing whatever is
+    there) unless root already holds it. Returns the stored spec dict, with
+    the number of files and bytes written.
+    """
+    stored = read_spec(root)
+    if stored and not force and stored.get("fingerprint") == spec.fingerprint:
+        return stored
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    os.makedirs(root)
+
+    info = dict(spec.as_dict(), fingerprint=spec.fingerprint, files=0, bytes=0, profiles={})
+    for profile in spec.profiles():
+        if on_progress:
+            on_progress(profile)
+        # One generator per profile, so adding a profile does not change the others
+        rng = random.Random(f"{spec.seed}:{profile}")
+        files, written = _GENERATORS[profile](os.path.join(root, profile), rng, spec.scale)
+        info["profiles"][profile] = {"files": files, "bytes": written}
+        info["files"] += files
+        info["bytes"] += written
+
+    with open(os.path.join(root, SPEC_FILE), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    # Written back to disk now, so the first run is not slowed down by writeback
+    os.sync()
+    return info
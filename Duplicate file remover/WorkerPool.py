@@ -0,0 +1,89 @@
+"""
+Bounded worker pool for hashing and image decoding.
+
+Threads are used for SHA-256 work (hashlib releases the GIL while reading and
+hashing), processes for PIL/imagehash work, which holds the GIL. At most
+`io_depth` jobs are in flight at any time, so memory stays flat however many
+files are queued, and results come back in submission order, which keeps a
+parallel scan's output identical to a serial one.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def default_io_depth(workers):
+    """Jobs kept in flight: enough to keep every worker busy while results are consumed"""
+    return max(1, workers) * 4
+
+
+class WorkerPool:
+    """
+    Run func(item) over items with `workers` threads (or processes).
+    With a single worker everything runs inline, without a pool.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, io_depth=None, processes=False):
+        self.workers = max(1, int(workers))
+        self.io_depth = max(1, int(io_depth or default_io_depth(self.workers)))
+        self.processes = processes
+        self.in_flight = 0  # jobs submitted by map() and not yet consumed, for ScanMetrics
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    def submit(self, func, item):
+        """Start func(item) on a worker and return its Future (needs workers > 1)"""
+        return self._get_executor().submit(func, item)
+
+    def map(self, func, items):
+        """
+        Yield (item, result, error) in the order of items.
+        OSErrors raised by func are returned as error instead of being raised.
+        """
+        if self.workers == 1:
+            for item in items:
+                try:
+                    yield item, func(item), None
+                except OSError as e:
+                    yield item, None, e
+            return
+
+        executor = self._get_executor()
+        pending = deque()
+        items = iter(items)
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < self.io_depth:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((item, executor.submit(func, item)))
+            self.in_flight = len(pending)
+            if not pending:
+                return
+            item, future = pending.popleft()
+            try:
+                yield item, future.result(), None
+            except OSError as e:
+                yield item, None, e
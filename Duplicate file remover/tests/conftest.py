@@ -0,0 +1,40 @@
+import os
+import random
+import sys
+
+import pytest
+
+# The modules live flat in the folder above, as they do for the scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """
+    A folder of files with few distinct sizes: exact copies, files that only
+    differ in the middle (same partial hash), in the first byte, or only in
+    size, spread over nested folders.
+    """
+    rng = random.Random(1)
+    root = tmp_path / "tree"
+    contents = [rng.randbytes(rng.choice((1, 100, 5000, 70000))) for _ in range(12)]
+    base = rng.randbytes(70000)
+    variant = bytearray(base)
+    variant[35000] ^= 0xFF  # same size and ends as base: only the full hash tells them apart
+    contents += [base, bytes(variant)]
+    for i in range(60):
+        data = rng.choice(contents)
+        write(str(root / f"d{i % 4}" / f"sub{i % 3}" / f"f{i:02d}.bin"), data)
+    return str(root)
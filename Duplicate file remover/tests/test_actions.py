@@ -0,0 +1,155 @@
+import errno
+import os
+
+import pytest
+
+from ActionJournal import ActionJournal, read_journal
+from DuplicateEngine import DuplicateGroup, DuplicatePairs
+from FileActions import replace_with_link, break_link, run_actions
+from ScanEngine import ScanEngine, ScanSettings
+
+from conftest import read, write
+
+
+@pytest.mark.parametrize("action", ["move", "safe_delete", "hardlink"])
+def test_every_completed_action_is_journaled(tmp_path, action):
+    original = write(str(tmp_path / "data" / "original.bin"), b"z" * 5000)
+    pairs = [(write(str(tmp_path / "data" / f"dup{i}.bin"), b"z" * 5000), original) for i in range(5)]
+    folders = {"move": str(tmp_path / "duplicates"), "safe_delete": str(tmp_path / "trash")}
+    journal_file = str(tmp_path / "recovery.jsonl")
+
+    with ActionJournal(journal_file) as journal:
+        results = list(run_actions(pairs, action, journal, folders, workers=2))
+    assert [dup for dup, _, _ in results] == [dup for dup, _ in pairs]
+    assert not any(error for _, _, error in results)
+
+    records = read_journal(journal_file)
+    assert sorted(records) == sorted(dup for dup, _ in pairs)
+    for dup, record in records.items():
+        assert record["action"] == action
+        if action == "hardlink":
+            assert os.path.samefile(dup, original)
+        else:
+            assert not os.path.exists(dup)
+            assert read(record["from"]) == b"z" * 5000
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    journal_file = str(tmp_path / "recovery.jsonl")
+    with ActionJournal(journal_file) as journal:
+        journal.append({"path": "/data/a.bin", "action": "permanent_delete"})
+    with open(journal_file, "a", encoding="utf-8") as f:
+        f.write('{"path": "/data/b.bin", "act')
+    assert list(read_journal(journal_file)) == ["/data/a.bin"]
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # Journals, the trash and the moved files go below the working directory
+    monkeypatch.chdir(tmp_path)
+    return ScanEngine(ScanSettings(images=False, workers=2, db_file=str(tmp_path / "scan.db")))
+
+
+def snapshot(root):
+    return {os.path.join(folder, name): read(os.path.join(folder, name))
+            for folder, _, names in os.walk(root) for name in names}
+
+
+@pytest.mark.parametrize("action", ["move", "safe_delete", "hardlink"])
+def test_action_then_recover_restores_every_file(engine, tree, action):
+    before = snapshot(tree)
+    report = engine.scan(tree)
+    assert report.duplicates
+
+    result = engine.run_action(action, report.duplicates)
+    assert (result.handled, result.failed) == (len(report.duplicates), 0)
+    if action == "hardlink":
+        assert all(os.path.samefile(dup, original) for dup, original in report.duplicates)
+    else:
+        assert not any(os.path.exists(dup) for dup, _ in report.duplicates)
+    assert engine.recover() == (len(report.duplicates), 0)
+
+    assert snapshot(tree) == before
+    if action == "hardlink":
+        assert not any(os.path.samefile(dup, original) for dup, original in report.duplicates)
+    # Everything was restored: a second run has nothing left to do
+    assert engine.recover() == (0, 0)
+
+
+def test_permanent_deletes_are_not_counted_as_failures(engine, tree):
+    report = engine.scan(tree)
+    engine.run_action("permanent_delete", report.duplicates)
+    assert engine.recover() == (0, 0)
+    assert engine.recover() == (0, 0)
+
+
+def test_safe_delete_of_a_hard_linked_file_leaves_the_other_name_alone(engine, tmp_path):
+    root = tmp_path / "linked"
+    original = write(str(root / "a" / "original.bin"), b"x" * 5000)
+    dup = write(str(root / "b" / "dup.bin"), b"x" * 5000)
+    outside = str(tmp_path / "outside.bin")
+    os.link(dup, outside)  # a second name the scan does not see
+    os.chmod(outside, 0o644)
+
+    report = engine.scan(str(root))
+    assert list(report.duplicates) == [(dup, original)]
+    engine.run_action("safe_delete", report.duplicates)
+    assert not os.path.exists(dup)
+    assert os.stat(outside).st_mode & 0o777 == 0o644
+
+    # Editing the surviving name must not change what is in the trash
+    write(outside, b"edited")
+    assert engine.recover() == (1, 0)
+    assert read(dup) == b"x" * 5000
+    assert read(outside) == b"edited"
+
+
+def test_hardlink_of_hard_linked_duplicates_round_trips(engine, tmp_path):
+    root = tmp_path / "linked"
+    original = write(str(root / "a" / "original.bin"), b"y" * 5000)
+    names = {write(str(root / "b" / "dup.bin"), b"y" * 5000)}
+    alias = str(root / "b" / "alias.bin")
+    os.link(str(root / "b" / "dup.bin"), alias)  # one of the two names is collapsed by the walk
+    names.add(alias)
+
+    report = engine.scan(str(root))
+    [(dup, found_original)] = report.duplicates
+    assert dup in names and found_original == original
+    engine.run_action("hardlink", report.duplicates)
+    assert os.path.samefile(dup, original)
+    assert engine.recover() == (1, 0)
+    assert not os.path.samefile(dup, original)
+    assert all(read(name) == read(original) for name in names)
+
+
+def test_image_groups_are_never_linked(engine, tmp_path):
+    # Perceptual matches: same size, different bytes
+    original = write(str(tmp_path / "photos" / "a.jpg"), b"A" * 4000)
+    similar = write(str(tmp_path / "photos" / "b.jpg"), b"B" * 4000)
+    pairs = DuplicatePairs([DuplicateGroup(4000, "ffff0000ffff0000", [original, similar], kind="image")])
+
+    result = engine.run_action("hardlink", pairs)
+    assert result.handled == 0
+    assert read(similar) == b"B" * 4000
+    assert not os.path.samefile(similar, original)
+
+
+def test_hardlink_then_break_link_round_trips(tmp_path):
+    original = write(str(tmp_path / "a" / "original.bin"), b"y" * 5000)
+    dup = write(str(tmp_path / "b" / "dup.bin"), b"y" * 5000)
+    replace_with_link(dup, original)
+    assert os.path.samefile(dup, original)
+    replace_with_link(dup, original)  # already linked: nothing to do
+    break_link(dup)
+    assert not os.path.samefile(dup, original)
+    assert read(dup) == read(original)
+
+
+def test_link_refuses_different_content(tmp_path):
+    original = write(str(tmp_path / "a.bin"), b"A" * 4000)
+    other = write(str(tmp_path / "b.bin"), b"B" * 4000)
+    with pytest.raises(OSError) as raised:
+        replace_with_link(other, original)
+    assert raised.value.errno == errno.EINVAL
+    assert read(other) == b"B" * 4000
+    assert sorted(os.listdir(tmp_path)) == ["a.bin", "b.bin"]  # no temporary file left behind
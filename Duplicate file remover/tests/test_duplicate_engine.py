@@ -0,0 +1,70 @@
+import hashlib
+import os
+
+from DiskGrouping import DiskGrouper, MIN_MEMORY_BUDGET
+from DuplicateEngine import StageStats, find_duplicate_groups, iter_duplicate_groups
+from FileWalker import walk_files
+from HashEngine import FileHasher
+from WorkerPool import WorkerPool
+
+from conftest import read
+
+
+def naive_groups(root):
+    """Files grouped by (size, sha256 of everything), in walk order"""
+    by_key = {}
+    for path, stat in walk_files(root):
+        by_key.setdefault((stat.st_size, hashlib.sha256(read(path)).digest()), []).append(path)
+    return {frozenset(paths) for paths in by_key.values() if len(paths) > 1}
+
+
+def as_sets(groups):
+    return {frozenset(group.members) for group in groups}
+
+
+def test_staged_groups_match_full_hashes(tree):
+    files = [(path, stat.st_size) for path, stat in walk_files(tree)]
+    groups = find_duplicate_groups(files)
+    assert as_sets(groups) == naive_groups(tree)
+    assert all(group.kind == "content" for group in groups)
+
+
+def test_members_keep_walk_order(tree):
+    files = [(path, stat.st_size) for path, stat in walk_files(tree)]
+    position = {path: i for i, (path, _) in enumerate(files)}
+    groups = find_duplicate_groups(files)
+    for group in groups:
+        assert [position[path] for path in group.members] == sorted(position[path] for path in group.members)
+    assert [position[group.original] for group in groups] == sorted(position[group.original] for group in groups)
+
+
+def test_worker_pool_and_crc32_prefilter(tree):
+    files = [(path, stat.st_size) for path, stat in walk_files(tree)]
+    stats = StageStats()
+    with WorkerPool(4) as pool:
+        groups = list(iter_duplicate_groups(files, stats, pool=pool, hasher=FileHasher("sha256", "crc32"),
+                                            chunk_files=7))
+    assert as_sets(groups) == naive_groups(tree)
+    assert stats.bytes_read["full"] > 0  # the variant with a different middle needed the full hash
+
+
+def test_unreadable_files_are_reported_and_left_out(tree):
+    files = [(path, stat.st_size) for path, stat in walk_files(tree)]
+    gone = max(naive_groups(tree), key=len)
+    victim = sorted(gone)[0]
+    os.remove(victim)
+    errors = []
+    groups = find_duplicate_groups(files, on_error=lambda path, e: errors.append(path))
+    assert errors == [victim]
+    assert all(victim not in group.members for group in groups)
+
+
+def test_disk_grouper_matches_in_memory(tree, tmp_path):
+    walked = list(walk_files(tree))
+    in_memory = find_duplicate_groups([(path, stat.st_size) for path, stat in walked])
+    with DiskGrouper(MIN_MEMORY_BUDGET, directory=str(tmp_path)) as grouper:
+        grouper.batch = 5  # several pages of sizes and files
+        on_disk = list(grouper.groups(walked))
+    # Same members in the same order, with the same digests (groups may come in another order)
+    assert sorted((group.members, group.digest) for group in on_disk) == \
+        sorted((group.members, group.digest) for group in in_memory)
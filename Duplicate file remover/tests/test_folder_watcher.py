@@ -0,0 +1,72 @@
+import errno
+import os
+import sys
+import time
+
+import pytest
+
+from FolderWatcher import InotifyWatcher, PollingWatcher, create_watcher
+
+from conftest import write
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+
+
+def wait_for(watcher, condition, timeout=5.0):
+    """Merge take() results until condition(paths, directories) holds"""
+    paths, directories = set(), set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        new_paths, new_directories = watcher.take()
+        paths |= new_paths
+        directories |= new_directories
+        if condition(paths, directories):
+            break
+        time.sleep(0.05)
+    return paths, directories
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    errors = []
+    watcher = InotifyWatcher(str(tmp_path), on_error=lambda path, e: errors.append((path, e)))
+    try:
+        watcher.start()
+    except OSError as e:
+        pytest.skip(f"inotify unavailable: {e}")
+    watcher.errors = errors
+    yield watcher
+    watcher.close()
+
+
+def test_reports_changed_files_and_new_folders(watcher, tmp_path):
+    path = write(str(tmp_path / "a.bin"), b"a")
+    os.mkdir(tmp_path / "new")
+    paths, directories = wait_for(watcher, lambda paths, directories: path in paths and directories)
+    assert path in paths
+    assert str(tmp_path / "new") in directories
+    assert not watcher.errors
+
+
+def test_running_out_of_watches_falls_back_to_polling(watcher, tmp_path):
+    def no_space(directory):
+        raise OSError(errno.ENOSPC, "inotify watch limit reached (fs.inotify.max_user_watches)", directory)
+
+    watcher._add_watch = no_space
+    os.mkdir(tmp_path / "new")
+    _, directories = wait_for(watcher, lambda paths, directories: str(tmp_path) in directories)
+
+    # Reported once, the thread is still alive, and every take() now re-lists the root
+    assert str(tmp_path) in directories
+    assert [e.errno for _, e in watcher.errors] == [errno.ENOSPC]
+    assert watcher.polling and watcher._thread.is_alive()
+    assert str(tmp_path) in watcher.take()[1]
+    os.mkdir(tmp_path / "another")
+    time.sleep(0.2)
+    assert len(watcher.errors) == 1
+
+
+def test_polling_watcher_relists_the_root(tmp_path):
+    watcher, reason = create_watcher(str(tmp_path), polling=True)
+    assert isinstance(watcher, PollingWatcher) and reason is None
+    assert watcher.take() == (set(), {str(tmp_path)})
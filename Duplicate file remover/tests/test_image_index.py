@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+from ImageIndex import HammingIndex, hamming, similarity_groups
+
+
+def flipped(value, rng, bits):
+    for bit in rng.sample(range(64), bits):
+        value ^= 1 << bit
+    return value
+
+
+@pytest.mark.parametrize("max_distance", [1, 2, 5, 8])
+def test_search_finds_exactly_the_hashes_within_the_distance(max_distance):
+    rng = random.Random(max_distance)
+    values = [rng.getrandbits(64) for _ in range(50)]
+    values += [flipped(rng.choice(values), rng, rng.randrange(max_distance + 3)) for _ in range(300)]
+    index = HammingIndex(max_distance)
+    for value in values:
+        index.add(value)
+    assert len(index) == len(set(values))
+    for query in values[::7]:
+        expected = {(value, hamming(query, value)) for value in set(values) if hamming(query, value) <= max_distance}
+        assert set(index.search(query)) == expected
+
+
+def test_similarity_groups_are_connected_clusters():
+    a = 0
+    b = a ^ 0b111  # 3 bits from a
+    c = b ^ 0b111000  # 3 bits from b, 6 from a
+    far = (1 << 64) - 1
+    hashes = {"a": f"{a:016x}", "far": f"{far:016x}", "b": f"{b:016x}", "c": f"{c:016x}", "copy": f"{a:016x}"}
+    assert similarity_groups(hashes, 3) == [["a", "b", "c", "copy"]]
+    assert similarity_groups(hashes, 2) == [["a", "copy"]]
+    assert similarity_groups(hashes, 0) == [["a", "copy"]]
@@ -0,0 +1,168 @@
+import os
+import time
+
+import pytest
+
+from DuplicateEngine import StageStats, find_duplicate_groups
+from HashEngine import FileHasher
+from FileRemover import scan_duplicates
+from ScanDatabase import HashCache, CACHE_USE, CACHE_VERIFY, connect
+
+from conftest import read, write
+
+
+def scan(tmp_path, root, mode=CACHE_USE, hasher=None):
+    """Groups found with the cache in tmp_path, the stage stats and the cache's mismatches"""
+    hasher = hasher or FileHasher()
+    cache = HashCache(str(tmp_path / "scan.db"), mode, hasher)
+    files = []
+    for folder, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(folder, name)
+            stat = os.stat(path)
+            cache.add(path, stat)
+            files.append((path, stat.st_size))
+    stats = StageStats()
+    groups = find_duplicate_groups(files, stats, cache=cache, hasher=hasher)
+    cache.close()
+    return sorted(group.members for group in groups), stats, cache.mismatches
+
+
+def test_rescan_reads_nothing(tmp_path, tree):
+    groups, stats, _ = scan(tmp_path, tree)
+    assert stats.total_read() > 0
+    again, stats, _ = scan(tmp_path, tree)
+    assert again == groups
+    assert stats.total_read() == 0
+
+
+def test_changed_file_is_hashed_again(tmp_path, tree):
+    groups, _, _ = scan(tmp_path, tree)
+    changed = groups[0][1]
+    data = bytearray(read(changed))
+    data[0] ^= 0xFF
+    write(changed, bytes(data))
+    os.utime(changed, ns=(0, time.time_ns() - 10**9))
+    again, stats, _ = scan(tmp_path, tree)
+    assert all(changed not in members for members in again)
+    # Only the file that changed was read
+    assert 0 < stats.total_read() <= 2 * len(data)
+
+
+def test_verify_reports_content_changed_behind_the_signature(tmp_path, tree):
+    groups, _, _ = scan(tmp_path, tree)
+    changed = groups[-1][0]
+    stat = os.stat(changed)
+    data = bytearray(read(changed))
+    data[0] ^= 0xFF
+    write(changed, bytes(data))
+    os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    # Trusting the cache misses the change; verifying finds and fixes it
+    stale, _, _ = scan(tmp_path, tree)
+    assert stale == groups
+    verified, _, mismatches = scan(tmp_path, tree, CACHE_VERIFY)
+    assert changed in mismatches
+    assert all(changed not in members for members in verified)
+    fixed, _, _ = scan(tmp_path, tree)
+    assert fixed == verified
+
+
+def test_digests_of_another_algorithm_are_not_reused(tmp_path, tree):
+    scan(tmp_path, tree)
+    _, stats, _ = scan(tmp_path, tree, hasher=FileHasher("blake2b"))
+    assert stats.total_read() > 0
+
+
+def test_cache_get_put_and_invalidate(tmp_path):
+    path = write(str(tmp_path / "data" / "a.bin"), b"a" * 100)
+    db_file = str(tmp_path / "cache.db")
+    hasher = FileHasher()
+    cache = HashCache(db_file, hasher=hasher)
+    cache.add(path, os.stat(path))
+    assert cache.get(path, "file_hash") is None
+    cache.put(path, "file_hash", b"digest")
+    assert cache.get(path, "file_hash") == b"digest"
+    cache.close()
+
+    cache = HashCache(db_file, hasher=hasher)
+    cache.add(path, os.stat(path))
+    assert cache.has(path, "file_hash")
+    assert not cache.has(path, "partial_hash")
+    assert (cache.lookups, cache.hits) == (0, 0)
+    assert cache.get(path, "file_hash") == b"digest"
+    assert (cache.lookups, cache.hits) == (1, 1)
+    cache.invalidate(str(tmp_path / "data"))
+    assert cache.get(path, "file_hash") is None
+    cache.close()
+
+    # A new signature voids the stored digest
+    cache = HashCache(db_file, hasher=hasher)
+    cache.put(path, "file_hash", b"digest")
+    cache.close()
+    os.utime(path, ns=(0, time.time_ns() - 10**9))
+    cache = HashCache(db_file, hasher=hasher)
+    cache.add(path, os.stat(path))
+    assert cache.get(path, "file_hash") is None
+    cache.close()
+
+
+def test_verify_mode_never_returns_stored_digests(tmp_path):
+    path = write(str(tmp_path / "a.bin"), b"a")
+    db_file = str(tmp_path / "cache.db")
+    cache = HashCache(db_file)
+    cache.add(path, os.stat(path))
+    cache.put(path, "file_hash", b"old")
+    cache.close()
+
+    cache = HashCache(db_file, CACHE_VERIFY)
+    cache.add(path, os.stat(path))
+    assert cache.get(path, "file_hash") is None
+    cache.put(path, "file_hash", b"new")
+    assert cache.mismatches == [path]
+    cache.close()
+
+
+def scan_skipping_unchanged(tmp_path, root, capsys):
+    """Groups found with --skip-unchanged-dirs, and the line saying how many folders were listed"""
+    groups = sorted(group.members for group in
+                    scan_duplicates(root, cache_file=str(tmp_path / "scan.db"), skip_unchanged_dirs=True))
+    [line] = [line for line in capsys.readouterr().out.splitlines() if "unchanged folders" in line]
+    return groups, line
+
+
+def age_folders(root):
+    # Listings of folders modified just before they were listed are never reused (RACY_NS)
+    past = time.time() - 100
+    for folder, _, _ in os.walk(root):
+        os.utime(folder, (past, past))
+
+
+@pytest.mark.parametrize("tamper", [False, True])
+def test_unchanged_folders_are_taken_from_the_cache(tmp_path, tree, tamper, capsys):
+    age_folders(tree)
+    groups, _ = scan_skipping_unchanged(tmp_path, tree, capsys)
+    if tamper:
+        # A stored file row that no longer matches the folder's listing digest
+        conn = connect(str(tmp_path / "scan.db"))
+        conn.execute("UPDATE scanned_files SET mtime_ns = mtime_ns + 1 WHERE file_path = "
+                     "(SELECT MIN(file_path) FROM scanned_files)")
+        conn.commit()
+        conn.close()
+    again, line = scan_skipping_unchanged(tmp_path, tree, capsys)
+    assert again == groups
+    assert ("0 folders listed" in line) != tamper
+
+
+def test_rows_without_a_directory_are_completed(tmp_path, tree, capsys):
+    age_folders(tree)
+    scan_skipping_unchanged(tmp_path, tree, capsys)
+    # As written by a version without the directory column
+    conn = connect(str(tmp_path / "scan.db"))
+    conn.execute("UPDATE scanned_files SET directory = NULL")
+    conn.commit()
+    conn.close()
+
+    for listed in (True, False):
+        _, line = scan_skipping_unchanged(tmp_path, tree, capsys)
+        assert ("0 folders listed" in line) != listed
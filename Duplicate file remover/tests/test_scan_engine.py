@@ -0,0 +1,27 @@
+import pytest
+
+from ScanEngine import ScanEngine, ScanSettings
+
+from conftest import write
+
+
+def missing_imaging(settings):
+    raise ImportError("No module named 'PIL'", name="PIL")
+
+
+def test_images_fall_back_to_content_without_pil(tmp_path, monkeypatch):
+    monkeypatch.setattr(ScanSettings, "image_hasher", missing_imaging)
+    for name in ("a.jpg", "b.jpg"):
+        write(str(tmp_path / "photos" / name), b"not really a photo")
+    levels = []
+    engine = ScanEngine(ScanSettings(db_file=str(tmp_path / "scan.db")),
+                        lambda message, level='info': levels.append(level))
+
+    report = engine.scan(str(tmp_path / "photos"))
+    assert [group.kind for group in report.groups] == ["content"]
+    assert "warn" in levels
+
+    # Asked for by name, image hashing does not quietly turn itself off
+    engine = ScanEngine(ScanSettings(similarity_distance=4, db_file=str(tmp_path / "scan.db")))
+    with pytest.raises(ImportError):
+        engine.scan(str(tmp_path / "photos"))
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import shutil
+
+import pytest
+
+from ScanEngine import ScanEngine, ScanSettings
+from ScanManifest import ManifestBuilder, ManifestReader, location, merge_manifests
+
+from conftest import read, write
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return ScanEngine(ScanSettings(images=False, db_file=str(tmp_path / "scan.db")))
+
+
+def naive_groups(volumes):
+    """{volume: root} grouped by (size, sha256) into sets of "volume:path" locations"""
+    by_key = {}
+    for volume, root in volumes.items():
+        for folder, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(folder, name)
+                data = read(path)
+                by_key.setdefault((len(data), hashlib.sha256(data).digest()), set()).add(location(volume, path))
+    return {frozenset(members) for members in by_key.values() if len(members) > 1}
+
+
+def test_round_trip(tmp_path):
+    builder = ManifestBuilder("sha256")
+    files = [("/data/b/two", 2, b"\x02" * 32), ("/data/a/one", 1, b"\x01" * 32), ("/data/a/zero", 1, b"\x00" * 32)]
+    for path, size, digest in files:
+        builder.add(path, size, 0.0, digest)
+    manifest = str(tmp_path / "m.dfm")
+    builder.write(manifest, volume="disk")
+    with ManifestReader(manifest) as reader:
+        assert (reader.volume, reader.algorithm, reader.files) == ("disk", "sha256", 3)
+        assert [(entry.size, entry.digest, entry.path) for entry in reader] == \
+            sorted((size, digest, path) for path, size, digest in files)
+    with pytest.raises(ValueError):
+        builder.add("/data/short", 1, 0.0, b"\x00")
+
+
+def test_not_a_manifest(tmp_path):
+    path = write(str(tmp_path / "other.dfm"), b"not a manifest at all")
+    with pytest.raises(ValueError):
+        ManifestReader(path)
+
+
+def test_merge_matches_full_hashes_across_volumes(engine, tree, tmp_path):
+    other = str(tmp_path / "other")
+    shutil.copytree(os.path.join(tree, "d1"), os.path.join(other, "copied"))
+    write(os.path.join(other, "only_here.bin"), b"nowhere else")
+
+    volumes = {"nas": tree, "laptop": other}
+    manifests = []
+    for volume, root in volumes.items():
+        manifests.append(str(tmp_path / f"{volume}.dfm"))
+        report = engine.export_manifest(root, manifests[-1], volume=volume)
+        assert report.files == sum(len(names) for _, _, names in os.walk(root))
+
+    readers = [ManifestReader(path) for path in manifests]
+    try:
+        groups = list(merge_manifests(readers))
+        assert {frozenset(group.members) for group in groups} == naive_groups(volumes)
+        assert [group.size for group in groups] == sorted(group.size for group in groups)
+        across = list(merge_manifests(readers, across_only=True))
+    finally:
+        for reader in readers:
+            reader.close()
+    assert across
+    assert all({member.split(":", 1)[0] for member in group.members} == {"nas", "laptop"} for group in across)
+    assert all(group.original.startswith("nas:") for group in across)  # the first manifest's copy comes first
+
+
+def test_overlapping_manifests_list_a_file_once(engine, tree, tmp_path):
+    first, second = str(tmp_path / "1.dfm"), str(tmp_path / "2.dfm")
+    engine.export_manifest(tree, first, volume="nas")
+    engine.export_manifest(os.path.join(tree, "d0"), second, volume="nas")
+    with ManifestReader(first) as a, ManifestReader(second) as b:
+        groups = list(merge_manifests([a, b]))
+    assert {frozenset(group.members) for group in groups} == naive_groups({"nas": tree})
+    assert all(len(set(group.members)) == len(group.members) for group in groups)
+
+
+def test_second_export_reads_nothing(engine, tree, tmp_path):
+    engine.export_manifest(tree, str(tmp_path / "1.dfm"))
+    report = engine.export_manifest(tree, str(tmp_path / "2.dfm"))
+    assert report.stats.bytes_read["full"] == 0
+    assert report.stats.bytes_cached["full"] == sum(os.path.getsize(os.path.join(folder, name))
+                                                    for folder, _, names in os.walk(tree) for name in names)
+
+
+def test_different_algorithms_do_not_merge(tmp_path):
+    readers = []
+    for algorithm in ("sha256", "blake2b"):
+        builder = ManifestBuilder(algorithm)
+        path = str(tmp_path / f"{algorithm}.dfm")
+        builder.write(path)
+        readers.append(ManifestReader(path))
+    with pytest.raises(ValueError):
+        list(merge_manifests(readers))
+    for reader in readers:
+        reader.close()
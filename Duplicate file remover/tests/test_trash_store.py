@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+from TrashStore import TrashStore, parse_size
+
+from conftest import read, write
+
+
+@pytest.fixture(params=[0, 6], ids=["plain", "compressed"])
+def trash(request, tmp_path):
+    with TrashStore(str(tmp_path / "trash"), compress_level=request.param) as store:
+        yield store
+
+
+def test_put_and_restore_a_file(trash, tmp_path):
+    path = write(str(tmp_path / "data" / "a.bin"), os.urandom(300000))
+    data = read(path)
+    os.chmod(path, 0o640)
+    mtime_ns = os.stat(path).st_mtime_ns
+
+    item = trash.put(path)
+    assert not os.path.exists(path)
+    trash.restore(item)
+    assert read(path) == data
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.stat(path).st_mtime_ns == mtime_ns
+    assert trash.stored_bytes() == 0
+    with pytest.raises(FileNotFoundError):
+        trash.restore(item)
+
+
+def test_equal_files_share_one_blob(trash, tmp_path):
+    data = os.urandom(50000)
+    paths = [write(str(tmp_path / "data" / f"{i}.bin"), data) for i in range(3)]
+    items = [trash.put(path) for path in paths]
+    blobs = [name for folder, _, names in os.walk(trash.objects) if not folder.endswith("tmp") for name in names]
+    assert len(blobs) == 1
+
+    # Restored in any order, each copy gets the content back; the blob goes with the last one
+    for path, item in zip(reversed(paths), reversed(items)):
+        trash.restore(item)
+        assert read(path) == data
+    assert trash.stored_bytes() == 0
+
+
+def test_put_and_restore_a_directory(trash, tmp_path):
+    root = tmp_path / "data" / "folder"
+    files = {str(root / "a.txt"): b"a", str(root / "sub" / "b.txt"): b"b" * 10000, str(root / "sub" / "c.txt"): b"a"}
+    for path, data in files.items():
+        write(path, data)
+    item = trash.put(str(root))
+    assert not os.path.exists(root)
+    trash.restore(item)
+    assert {path: read(path) for path in files} == files
+
+
+def test_restore_does_not_overwrite(trash, tmp_path):
+    path = write(str(tmp_path / "a.bin"), b"old")
+    item = trash.put(path)
+    write(path, b"new")
+    with pytest.raises(FileExistsError):
+        trash.restore(item)
+    assert read(path) == b"new"
+
+
+def test_hard_linked_file_is_copied_not_taken(trash, tmp_path):
+    path = write(str(tmp_path / "a.bin"), b"content" * 1000)
+    other = str(tmp_path / "b.bin")
+    os.link(path, other)
+    os.chmod(other, 0o644)
+
+    item = trash.put(path)
+    assert os.stat(other).st_mode & 0o777 == 0o644
+    assert os.stat(other).st_nlink == 1
+    write(other, b"edited")
+    trash.restore(item)
+    assert read(path) == b"content" * 1000
+
+
+def test_evict_drops_least_recently_used(trash, tmp_path):
+    first = write(str(tmp_path / "first.bin"), os.urandom(100000))
+    second = write(str(tmp_path / "second.bin"), os.urandom(100000))
+    old_item = trash.put(first)
+    new_item = trash.put(second)
+
+    assert trash.evict(trash.stored_bytes()) == 0
+    freed = trash.evict(trash.stored_bytes() - 1)
+    assert freed > 0
+    with pytest.raises(FileNotFoundError):
+        trash.restore(old_item)
+    trash.restore(new_item)
+    assert os.path.exists(second)
+
+
+def test_evicting_an_item_releases_its_other_blobs(trash, tmp_path):
+    folder = tmp_path / "data"
+    write(str(folder / "a.bin"), os.urandom(100000))
+    data = read(write(str(folder / "b.bin"), os.urandom(100000)))
+    item = trash.put(str(folder))
+    shared = trash.put(write(str(tmp_path / "c.bin"), data))
+
+    # a.bin's blob is the least recently used; b.bin's is still needed by c.bin
+    trash.evict(trash.stored_bytes() - 1)
+    with pytest.raises(FileNotFoundError):
+        trash.restore(item)
+    trash.restore(shared)
+    assert trash.stored_bytes() == 0
+    assert not [name for folder, _, names in os.walk(trash.objects) for name in names]
+
+
+def test_failed_put_leaves_the_file_in_place(trash, tmp_path, monkeypatch):
+    path = write(str(tmp_path / "a.bin"), b"content" * 1000)
+    os.chmod(path, 0o640)
+
+    def fail(src, dst):
+        raise PermissionError(13, "Permission denied", dst)
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(PermissionError):
+        trash.put(path)
+    monkeypatch.undo()
+    assert read(path) == b"content" * 1000
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert trash.stored_bytes() == 0
+    assert not [name for folder, _, names in os.walk(trash.objects) for name in names]
+
+
+def test_size_limit_keeps_the_newest_item(tmp_path):
+    with TrashStore(str(tmp_path / "trash"), max_bytes=150000) as trash:
+        items = [trash.put(write(str(tmp_path / f"{i}.bin"), os.urandom(100000))) for i in range(3)]
+        assert trash.stored_bytes() <= 150000
+        trash.restore(items[-1])
+        with pytest.raises(FileNotFoundError):
+            trash.restore(items[0])
+
+
+def test_parse_size():
+    assert parse_size("512") == 512
+    assert parse_size("2K") == 2048
+    assert parse_size("1.5G") == int(1.5 * 1024 ** 3)